@@ -1,31 +1,41 @@
 from base64 import b64encode
 import json
+import mmap
+import os
 import re
 import subprocess
 import sys
 from socketserver import ForkingTCPServer, StreamRequestHandler
 from traceback import format_exception
+from types import CodeType
 from typing import Any
 
-from compiler.tokenizer import tokenize
-from compiler.parser import parse
-from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler import ast
+from compiler.tokenizer import iter_tokens, tokenize_buffer
+from compiler.parser import parse, parse_stream
+from compiler.resolver import resolve
+from compiler.symtab import build_interpreter_symtab, build_type_symtab, build_ir_dict
 from compiler.type_checker import typecheck
-from compiler.ir_generator import generate_ir
+from compiler.ir_generator import generate_ir, typecheck_and_generate_ir
+from compiler.ir import Instruction
+from compiler.interpreter import interpret
+from compiler.io_context import IOContext
 from compiler.assembly_generator import generate_assembly
 from compiler.assembler import assemble, assemble_and_get_executable
+from compiler import bytecode, ir_format, ir_interpreter, python_generator
+from compiler.cfg import build_cfg
+from compiler.ssa import to_ssa
+from compiler.profiler import Profile, profile_interpret
 
 
-def call_compiler(source_code: str, input_file_name: str) -> bytes:
+def call_compiler(source_code: str, input_file_name: str, fused: bool = False) -> bytes:
     # Call your compiler here and return the compiled executable.
     # Raise an exception on compilation error.
     try:
-        tokens = tokenize(source_code)
+        tokens = tokenize_buffer(source_code, input_file_name)
         ast_node = parse(tokens)
-        symtab = build_type_symtab()
-        typecheck(ast_node, symtab)
-        ir_dict = build_ir_dict()
-        ir_instructions = generate_ir(ir_dict, ast_node)
+        resolve(ast_node)
+        ir_instructions = check_and_generate_ir(ast_node, fused)
         asm_code = generate_assembly(ir_instructions)
         executable = assemble_and_get_executable(asm_code)
         return executable
@@ -33,6 +43,15 @@ def call_compiler(source_code: str, input_file_name: str) -> bytes:
         raise Exception(f"Compilation failed: {e}")
 
 
+def check_and_generate_ir(ast_node: ast.Expression, fused: bool) -> list[Instruction]:
+    if fused:
+        return typecheck_and_generate_ir(build_ir_dict(), ast_node)
+    symtab = build_type_symtab()
+    typecheck(ast_node, symtab)
+    ir_dict = build_ir_dict()
+    return generate_ir(ir_dict, ast_node)
+
+
 def main() -> int:
     # === Option parsing ===
     command: str | None = None
@@ -40,9 +59,22 @@ def main() -> int:
     output_file: str | None = None
     host = "127.0.0.1"
     port = 3000
+    fused = False
+    profile: Profile | None = None
+    collapsed_file: str | None = None
+    cache_dir: str | None = None
     for arg in sys.argv[1:]:
-        if (m := re.fullmatch(r'--output=(.+)', arg)) is not None:
+        if arg == '--fused':
+            fused = True
+        elif arg == '--profile':
+            profile = Profile()
+        elif (m := re.fullmatch(r'--collapsed=(.+)', arg)) is not None:
+            profile = Profile()
+            collapsed_file = m[1]
+        elif (m := re.fullmatch(r'--output=(.+)', arg)) is not None:
             output_file = m[1]
+        elif (m := re.fullmatch(r'--cache-dir=(.+)', arg)) is not None:
+            cache_dir = m[1]
         elif (m := re.fullmatch(r'--host=(.+)', arg)) is not None:
             host = m[1]
         elif (m := re.fullmatch(r'--port=(.+)', arg)) is not None:
@@ -67,13 +99,41 @@ def main() -> int:
         else:
             return sys.stdin.read()
 
+    def read_ast() -> ast.Expression:
+        ast_node = parse_source()
+        resolve(ast_node)
+        return ast_node
+
+    def parse_source() -> ast.Expression:
+        # Files are memory-mapped and parsed while they are scanned,
+        # so the source text and the token list are never fully in memory.
+        if input_file is not None:
+            with open(input_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_size > 0:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source_code:
+                        tokens = iter_tokens(source_code, input_file)
+                        try:
+                            return parse_stream(tokens)
+                        finally:
+                            tokens.close()
+        return parse(tokenize_buffer(read_source_code(), input_file or 'file_name'))
+
+    def read_ir() -> list[Instruction]:
+        # IR saved by the 'ir' command skips the front end
+        if input_file is not None and input_file.endswith('.irb'):
+            with open(input_file, 'rb') as ir_file:
+                return ir_format.load_ir(ir_file.read())
+        if input_file is not None and input_file.endswith('.ir'):
+            return ir_format.parse_ir(read_source_code(), input_file)
+        return check_and_generate_ir(read_ast(), fused)
+
     # === Command implementations ===
 
     if command == 'compile':
         source_code = read_source_code()
         if output_file is None:
             raise Exception("Output file flag --output=... required")
-        executable = call_compiler(source_code, input_file or '(source code)')
+        executable = call_compiler(source_code, input_file or '(source code)', fused)
         with open(output_file, 'wb') as f:
             f.write(executable)
     elif command == 'serve':
@@ -82,34 +142,80 @@ def main() -> int:
         except KeyboardInterrupt:
             pass
     elif command == 'ir':
-        source_code = read_source_code()
-        tokens = tokenize(source_code)
-        ast_node = parse(tokens)
-        symtab = build_type_symtab()
-        typecheck(ast_node, symtab)
-        ir_dict = build_ir_dict()
-        ir_instructions = generate_ir(ir_dict, ast_node)
-        print("\n".join([str(ins) for ins in ir_instructions]))
+        ir_instructions = read_ir()
+        if output_file is None:
+            print("\n".join([str(ins) for ins in ir_instructions]))
+        elif output_file.endswith('.irb'):
+            with open(output_file, 'wb') as ir_file:
+                ir_file.write(ir_format.dump_ir(ir_instructions))
+        else:
+            with open(output_file, 'w') as ir_text_file:
+                ir_text_file.write(ir_format.format_ir(ir_instructions))
+    elif command == 'ssa':
+        cfg = build_cfg(read_ir())
+        to_ssa(cfg)
+        print("\n".join([str(ins) for ins in cfg.linearize()]))
     elif command == 'asm':
-        source_code = read_source_code()
-        tokens = tokenize(source_code)
-        ast_node = parse(tokens)
-        symtab = build_type_symtab()
-        typecheck(ast_node, symtab)
-        ir_dict = build_ir_dict()
-        ir_instructions = generate_ir(ir_dict, ast_node)
+        ir_instructions = read_ir()
         asm_code = generate_assembly(ir_instructions)
         print(asm_code)
     elif command == 'run':
-        source_code = read_source_code()
-        tokens = tokenize(source_code)
-        ast_node = parse(tokens)
-        symtab = build_type_symtab()
-        typecheck(ast_node, symtab)
-        ir_dict = build_ir_dict()
-        ir_instructions = generate_ir(ir_dict, ast_node)
+        ir_instructions = read_ir()
         asm_code = generate_assembly(ir_instructions)
         assemble(asm_code, 'compiled_program')
+    elif command == 'python':
+        ast_node = read_ast()
+        typecheck(ast_node, build_type_symtab())
+        print(python_generator.generate_python(ast_node), end='')
+    elif command == 'pyrun':
+        def compile_python(ast_node: ast.Expression) -> CodeType:
+            typecheck(ast_node, build_type_symtab())
+            return python_generator.compile_python(ast_node, input_file or '<stdin>')
+        if cache_dir is not None:
+            # Code objects are cached by the hash of the source code
+            source_code = read_source_code()
+            code = python_generator.cached_code(source_code, cache_dir, lambda: compile_python(
+                parse(tokenize_buffer(source_code, input_file or 'file_name'))
+            ))
+        else:
+            code = compile_python(read_ast())
+        python_generator.run_python(code)
+    elif command == 'bytecode':
+        if output_file is None:
+            raise Exception("Output file flag --output=... required")
+        program = bytecode.compile_bytecode(read_ir())
+        with open(output_file, 'wb') as f:
+            f.write(bytecode.dump(program))
+    elif command == 'vm':
+        # A .bc file written by the 'bytecode' command runs without
+        # tokenizing, parsing or typechecking it again
+        if input_file is not None and input_file.endswith('.bc'):
+            with open(input_file, 'rb') as bc_file:
+                program = bytecode.load(bc_file.read())
+        else:
+            program = bytecode.compile_bytecode(read_ir())
+        bytecode.run_bytecode(program)
+    elif command == 'interpret':
+        ast_node = read_ast()
+        # Printed values are buffered and written when the program ends
+        with IOContext() as io:
+            if profile is not None:
+                result = profile_interpret(ast_node, build_interpreter_symtab(io), profile)
+            else:
+                result = interpret(ast_node, build_interpreter_symtab(io))
+            if isinstance(result, bool):
+                io.print_bool(result)
+            elif isinstance(result, int):
+                io.print_int(result)
+        if profile is not None:
+            # A hot-line report, and a file for flame graph tools
+            profiled_source = read_source_code() if input_file is not None else None
+            print(profile.report(profiled_source), end='', file=sys.stderr)
+            if collapsed_file is not None:
+                with open(collapsed_file, 'w') as stacks_file:
+                    stacks_file.write(profile.collapsed_stacks())
+    elif command == 'irrun':
+        ir_interpreter.interpret_ir(read_ir())
     else:
         print(f"Error: unknown command: {command}", file=sys.stderr)
         return 1
@@ -0,0 +1,590 @@
+from array import array
+from itertools import accumulate, islice
+from operator import sub
+from typing import Any, Sequence
+import struct
+import sys
+from compiler import ast, trampoline
+from compiler.tokenizer import SourceLocation
+from compiler.trampoline import Step
+from compiler.ast import NodeKind
+from compiler.types import BasicType, Bool, FunType, Int, Type, Unit
+
+
+# Operator ids stored in the `ops` column of binary and unary operators
+operators = ['+', '-', '*', '/', '%', '==', '!=', '<', '<=', '>', '>=', 'and', 'or', '=', 'not']
+operator_ids = {op: index for index, op in enumerate(operators)}
+
+# Literal tags stored in the `ops` column of literals
+LITERAL_INT = 0
+LITERAL_BOOL = 1
+LITERAL_NONE = 2
+LITERAL_BIG_INT = 3
+
+NO_NODE = -1
+
+# Binary format written by `Arena.to_bytes`
+FORMAT_MAGIC = b'CAST'
+FORMAT_VERSION = 2
+
+# The serialized columns and their typecodes in an arena being built.
+# `to_bytes` writes each column with the narrowest of `_NARROW_TYPECODES`
+# that holds its values.
+_COLUMN_TYPECODES = {
+    'kinds': 'B', 'ops': 'B', 'values': 'i', 'child0': 'i', 'child1': 'i', 'child2': 'i',
+    'child_lists': 'i', 'lines': 'i', 'columns': 'i', 'file_ids': 'i', 'types': 'H',
+}
+_NARROW_TYPECODES = ['B', 'b', 'H', 'h', 'i']
+
+_INT_MIN = -1 << 31
+_INT_MAX = (1 << 31) - 1
+
+
+class Arena:
+    """Flat AST storage. A node is an index into parallel typed columns.
+
+    Nodes are added after their children, and a child is stored as its
+    offset back from the parent's index, which is small however large
+    the arena is. The meaning of the child and value columns depends on
+    the node kind:
+
+    - Literal: `ops` is the literal tag, `values` the value
+    - Identifier: `values` is the name's string id, `child0` and `child2`
+      the (depth, slot) address set by the resolver
+    - BinaryOp: `ops` is the operator id, `child0` and `child1` the operands
+    - UnaryOp: `ops` is the operator id, `child0` the operand
+    - IfExpression: `child0`, `child1` and `child2` are the condition and
+      clauses
+    - WhileExpression: `child0` and `child1` are the condition and body
+    - FunctionCall: `values` is the name's string id, `child0` and
+      `child2` the address
+    - Block: `child2` is the frame size
+    - VarDeclaration: `values` is the name's string id, `child0` the value,
+      `child1` the declared type's string id and `child2` the slot
+
+    A missing child or value is `NO_NODE`. The arguments of a function
+    call or a block are the node indices in `child_lists` from
+    `list_starts[node]` to `list_starts[node + 1]`.
+
+    Locations are stored in the `lines`, `columns` and `file_ids` columns,
+    and the `types` column holds an index into `type_table`, which starts
+    with Unit, Int and Bool. Literals and locations that do not fit in
+    the columns are kept in `_big_ints` and `_odd_locations`.
+
+    An arena is a `compiler.tree.Tree` of its node indices.
+    """
+
+    def __init__(self) -> None:
+        self.kinds = array('B')
+        self.ops = array('B')
+        self.values = array('i')
+        self.child0 = array('i')
+        self.child1 = array('i')
+        self.child2 = array('i')
+        self.child_lists = array('i')
+        self.list_starts = array('i', [0])
+        self.lines = array('i')
+        self.columns = array('i')
+        self.file_ids = array('i')
+        self.types = array('H')
+        self.strings: list[str] = []
+        self.files: list[str] = []
+        self.type_table: list[Type] = [Unit, Int, Bool]
+        self._string_ids: dict[str, int] = {}
+        self._file_ids: dict[str, int] = {}
+        self._type_ids: dict[Type, int] = {t: index for index, t in enumerate(self.type_table)}
+        self._big_ints: dict[int, int] = {}
+        self._odd_locations: dict[int, SourceLocation] = {}
+        # Whether the columns were loaded with narrower typecodes than
+        # `_COLUMN_TYPECODES`, and must be widened before nodes are added
+        self._narrowed = False
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def string_id(self, text: str) -> int:
+        string_id = self._string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self._string_ids[text] = string_id
+            self.strings.append(text)
+        return string_id
+
+    def type_id(self, t: Type) -> int:
+        type_id = self._type_ids.get(t)
+        if type_id is None:
+            type_id = len(self.type_table)
+            self._type_ids[t] = type_id
+            self.type_table.append(t)
+        return type_id
+
+    def file_id(self, file: str) -> int:
+        file_id = self._file_ids.get(file)
+        if file_id is None:
+            file_id = len(self.files)
+            self._file_ids[file] = file_id
+            self.files.append(file)
+        return file_id
+
+    def add_node(self, kind: int, location: SourceLocation, op: int = 0, value: int = 0,
+                 child0: int = NO_NODE, child1: int = NO_NODE, child2: int = NO_NODE,
+                 arguments: Sequence[int] = (), type: Type = Unit) -> int:
+        """Adds a node and returns its index. The child columns are given
+        as stored, see `child_offset`."""
+        if self._narrowed:
+            self._widen()
+        node = len(self.kinds)
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.values.append(value)
+        self.child0.append(child0)
+        self.child1.append(child1)
+        self.child2.append(child2)
+        self.child_lists.extend(arguments)
+        self.list_starts.append(len(self.child_lists))
+        self.file_ids.append(self.file_id(location.file))
+        if _INT_MIN <= location.line <= _INT_MAX and _INT_MIN <= location.column <= _INT_MAX:
+            self.lines.append(location.line)
+            self.columns.append(location.column)
+        else:
+            self.lines.append(0)
+            self.columns.append(0)
+            self._odd_locations[node] = location
+        self.types.append(self.type_id(type))
+        return node
+
+    def add_literal(self, location: SourceLocation, value: int | bool | None, type: Type = Unit) -> int:
+        if value is None:
+            return self.add_node(NodeKind.LITERAL, location, LITERAL_NONE, type=type)
+        if isinstance(value, bool):
+            return self.add_node(NodeKind.LITERAL, location, LITERAL_BOOL, int(value), type=type)
+        if _INT_MIN <= value <= _INT_MAX:
+            return self.add_node(NodeKind.LITERAL, location, LITERAL_INT, value, type=type)
+        node = self.add_node(NodeKind.LITERAL, location, LITERAL_BIG_INT, type=type)
+        self._big_ints[node] = value
+        return node
+
+    def child_offset(self, child: int) -> int:
+        """The offset of `child` from the next node added, which is how
+        that node stores it."""
+        return len(self.kinds) - child
+
+    def from_ast(self, node: ast.Expression) -> int:
+        """Copies an AST into the arena and returns the root node."""
+        return trampoline.run(self._from_ast(node, 0))
+
+    def _from_ast(self, node: ast.Expression, depth: int) -> Step:
+        if depth > trampoline.RECURSION_BUDGET:
+            return (yield self._from_ast(node, 0))
+        depth += 1
+
+        loc = node.location
+        match node:
+            case ast.Literal():
+                return self.add_literal(loc, node.value, node.type)
+            case ast.Identifier():
+                var_depth, slot = (NO_NODE, NO_NODE) if node.address is None else node.address
+                return self.add_node(NodeKind.IDENTIFIER, loc, value=self.string_id(node.name),
+                                     child0=var_depth, child2=slot, type=node.type)
+            case ast.BinaryOp():
+                left = yield from self._from_ast(node.left, depth)
+                right = yield from self._from_ast(node.right, depth)
+                return self.add_node(NodeKind.BINARY_OP, loc, operator_ids[node.op],
+                                     child0=self.child_offset(left), child1=self.child_offset(right), type=node.type)
+            case ast.UnaryOp():
+                expr = yield from self._from_ast(node.expr, depth)
+                return self.add_node(NodeKind.UNARY_OP, loc, operator_ids[node.op],
+                                     child0=self.child_offset(expr), type=node.type)
+            case ast.IfExpression():
+                cond = yield from self._from_ast(node.cond, depth)
+                then_clause = yield from self._from_ast(node.then_clause, depth)
+                else_clause = None if node.else_clause is None else (yield from self._from_ast(node.else_clause, depth))
+                return self.add_node(NodeKind.IF_EXPRESSION, loc, child0=self.child_offset(cond),
+                                     child1=self.child_offset(then_clause),
+                                     child2=NO_NODE if else_clause is None else self.child_offset(else_clause),
+                                     type=node.type)
+            case ast.WhileExpression():
+                cond = yield from self._from_ast(node.cond, depth)
+                do_clause = yield from self._from_ast(node.do_clause, depth)
+                return self.add_node(NodeKind.WHILE_EXPRESSION, loc, child0=self.child_offset(cond),
+                                     child1=self.child_offset(do_clause), type=node.type)
+            case ast.FunctionCall():
+                arguments = []
+                for argument in node.arguments:
+                    arguments.append((yield from self._from_ast(argument, depth)))
+                var_depth, slot = (NO_NODE, NO_NODE) if node.address is None else node.address
+                return self.add_node(NodeKind.FUNCTION_CALL, loc, value=self.string_id(node.name),
+                                     child0=var_depth, child2=slot, arguments=arguments, type=node.type)
+            case ast.Block():
+                arguments = []
+                for argument in node.arguments:
+                    arguments.append((yield from self._from_ast(argument, depth)))
+                return self.add_node(NodeKind.BLOCK, loc, child2=NO_NODE if node.frame_size is None else node.frame_size,
+                                     arguments=arguments, type=node.type)
+            case ast.VarDeclaration():
+                value = yield from self._from_ast(node.value, depth)
+                declared_type = NO_NODE if node.declared_type is None else self.string_id(node.declared_type)
+                return self.add_node(NodeKind.VAR_DECLARATION, loc, value=self.string_id(node.name),
+                                     child0=self.child_offset(value), child1=declared_type,
+                                     child2=NO_NODE if node.slot is None else node.slot, type=node.type)
+            case _:
+                raise Exception(f"Unsupported AST node: {node}")
+
+    # === Read-only accessors ===
+
+    def location(self, node: int) -> SourceLocation:
+        if self._odd_locations:
+            location = self._odd_locations.get(node)
+            if location is not None:
+                return location
+        return SourceLocation(self.files[self.file_ids[node]], self.lines[node], self.columns[node])
+
+    def literal_value(self, node: int) -> int | bool | None:
+        tag = self.ops[node]
+        if tag == LITERAL_INT:
+            return self.values[node]
+        if tag == LITERAL_BOOL:
+            return self.values[node] != 0
+        if tag == LITERAL_NONE:
+            return None
+        return self._big_ints[node]
+
+    def name(self, node: int) -> str:
+        return self.strings[self.values[node]]
+
+    def op(self, node: int) -> str:
+        return operators[self.ops[node]]
+
+    def kind(self, node: int) -> int:
+        return self.kinds[node]
+
+    def left(self, node: int) -> int:
+        return node - self.child0[node]
+
+    def right(self, node: int) -> int:
+        return node - self.child1[node]
+
+    def expr(self, node: int) -> int:
+        return node - self.child0[node]
+
+    def cond(self, node: int) -> int:
+        return node - self.child0[node]
+
+    def then_clause(self, node: int) -> int:
+        return node - self.child1[node]
+
+    def else_clause(self, node: int) -> int | None:
+        offset = self.child2[node]
+        return None if offset == NO_NODE else node - offset
+
+    def do_clause(self, node: int) -> int:
+        return node - self.child1[node]
+
+    def arguments(self, node: int) -> 'array[int]':
+        """The arguments of a block or a function call."""
+        return self.child_lists[self.list_starts[node]:self.list_starts[node + 1]]
+
+    def value(self, node: int) -> int:
+        return node - self.child0[node]
+
+    def declared_type(self, node: int) -> str | None:
+        declared_type = self.child1[node]
+        return None if declared_type == NO_NODE else self.strings[declared_type]
+
+    def address(self, node: int) -> tuple[int, int] | None:
+        var_depth = self.child0[node]
+        return None if var_depth == NO_NODE else (var_depth, self.child2[node])
+
+    def slot(self, node: int) -> int | None:
+        slot = self.child2[node]
+        return None if slot == NO_NODE else slot
+
+    def frame_size(self, node: int) -> int | None:
+        frame_size = self.child2[node]
+        return None if frame_size == NO_NODE else frame_size
+
+    def type(self, node: int) -> Type:
+        return self.type_table[self.types[node]]
+
+    def set_type(self, node: int, t: Type) -> None:
+        if t is Unit:
+            self.types[node] = 0
+        elif t is Int:
+            self.types[node] = 1
+        elif t is Bool:
+            self.types[node] = 2
+        else:
+            type_id = self.type_id(t)
+            try:
+                self.types[node] = type_id
+            except OverflowError:
+                self._widen()
+                self.types[node] = type_id
+
+    def to_ast(self, node: int) -> ast.Expression:
+        """Builds an ordinary AST node, with its subtree, from the arena."""
+        return trampoline.run(self._to_ast(node, 0))
+
+    def _to_ast(self, node: int, depth: int) -> Step:
+        if depth > trampoline.RECURSION_BUDGET:
+            return (yield self._to_ast(node, 0))
+        depth += 1
+
+        loc = self.location(node)
+        t = self.type(node)
+        kind = self.kinds[node]
+        result: ast.Expression
+        if kind == NodeKind.LITERAL:
+            result = ast.Literal(loc, self.literal_value(node))
+        elif kind == NodeKind.IDENTIFIER:
+            result = ast.Identifier(loc, self.name(node), address=self.address(node))
+        elif kind == NodeKind.BINARY_OP:
+            left = yield from self._to_ast(self.left(node), depth)
+            right = yield from self._to_ast(self.right(node), depth)
+            result = ast.BinaryOp(loc, left, self.op(node), right)
+        elif kind == NodeKind.UNARY_OP:
+            expr = yield from self._to_ast(self.expr(node), depth)
+            result = ast.UnaryOp(loc, self.op(node), expr)
+        elif kind == NodeKind.IF_EXPRESSION:
+            cond = yield from self._to_ast(self.cond(node), depth)
+            then_clause = yield from self._to_ast(self.then_clause(node), depth)
+            else_node = self.else_clause(node)
+            else_clause = None if else_node is None else (yield from self._to_ast(else_node, depth))
+            result = ast.IfExpression(loc, cond, then_clause, else_clause)
+        elif kind == NodeKind.WHILE_EXPRESSION:
+            cond = yield from self._to_ast(self.cond(node), depth)
+            do_clause = yield from self._to_ast(self.do_clause(node), depth)
+            result = ast.WhileExpression(loc, cond, do_clause)
+        elif kind == NodeKind.FUNCTION_CALL:
+            arguments = []
+            for c in self.arguments(node):
+                arguments.append((yield from self._to_ast(c, depth)))
+            result = ast.FunctionCall(loc, self.name(node), arguments, address=self.address(node))
+        elif kind == NodeKind.BLOCK:
+            arguments = []
+            for c in self.arguments(node):
+                arguments.append((yield from self._to_ast(c, depth)))
+            result = ast.Block(loc, arguments, frame_size=self.frame_size(node))
+        elif kind == NodeKind.VAR_DECLARATION:
+            value = yield from self._to_ast(self.value(node), depth)
+            result = ast.VarDeclaration(loc, self.declared_type(node), self.name(node), value, slot=self.slot(node))
+        else:
+            raise Exception(f"Unknown node kind: {kind}")
+        result.type = t
+        return result
+
+    # === Binary format ===
+
+    def _widen(self) -> None:
+        """Gives the columns of a loaded arena their usual typecodes again."""
+        for name, typecode in _COLUMN_TYPECODES.items():
+            column = getattr(self, name)
+            if column.typecode != typecode:
+                setattr(self, name, array(typecode, column))
+        self._narrowed = False
+
+    def to_bytes(self, root: int) -> bytes:
+        """Serializes the arena and its root node.
+
+        The layout is a header, the string, file and type tables, then each
+        column as little-endian integers of the narrowest width that holds
+        its values, then the rare values that do not fit in the columns.
+        A column whose values are all the same is written as one value,
+        and the arguments are written as their counts in `child_lists`."""
+        out = bytearray(struct.pack('<4sHq', FORMAT_MAGIC, FORMAT_VERSION, root))
+
+        def write_string(text: str) -> None:
+            data = text.encode()
+            out.extend(struct.pack('<I', len(data)))
+            out.extend(data)
+
+        for table in (self.strings, self.files):
+            out.extend(struct.pack('<I', len(table)))
+            for text in table:
+                write_string(text)
+
+        # Function types are written with the ids of the types they are
+        # built from, which are added to a copy of the table if missing.
+        type_table = list(self.type_table)
+        type_ids = dict(self._type_ids)
+
+        def type_id(t: Type) -> int:
+            type_id = type_ids.get(t)
+            if type_id is None:
+                type_id = type_ids[t] = len(type_table)
+                type_table.append(t)
+            return type_id
+
+        types = bytearray()
+        index = 0
+        while index < len(type_table):
+            t = type_table[index]
+            if isinstance(t, BasicType):
+                types.append(0)
+                data = t.name.encode()
+                types.extend(struct.pack('<I', len(data)))
+                types.extend(data)
+            elif isinstance(t, FunType):
+                types.append(1)
+                arg_ids = [type_id(arg) for arg in t.arg_types]
+                types.extend(struct.pack(f'<I{len(arg_ids)}HH', len(arg_ids), *arg_ids, type_id(t.return_type)))
+            else:
+                raise Exception(f"Cannot serialize type: {t}")
+            index += 1
+        out.extend(struct.pack('<I', len(type_table)))
+        out.extend(types)
+
+        child_counts = array('i', map(sub, islice(self.list_starts, 1, None), self.list_starts))
+        for column in [*(getattr(self, name) for name in _COLUMN_TYPECODES), child_counts]:
+            typecode = _narrowest_typecode(column)
+            length = len(column)
+            if length > 1 and column.count(column[0]) == length:
+                column = column[:1]
+            if typecode != column.typecode or sys.byteorder == 'big':
+                column = array(typecode, column)
+            if sys.byteorder == 'big':
+                column.byteswap()
+            out.extend(struct.pack('<cBqq', typecode.encode(), column.itemsize, length, len(column)))
+            out.extend(column.tobytes())
+
+        out.extend(struct.pack('<I', len(self._big_ints)))
+        for node, value in self._big_ints.items():
+            out.extend(struct.pack('<q', node))
+            write_string(str(value))
+
+        out.extend(struct.pack('<I', len(self._odd_locations)))
+        for node, location in self._odd_locations.items():
+            out.extend(struct.pack('<q', node))
+            write_string(location.file)
+            out.extend(struct.pack('<qq', location.line, location.column))
+
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> tuple['Arena', int]:
+        """Reads an arena written by `to_bytes`. Returns the arena and the root node.
+
+        The columns keep the widths they were written with until a node
+        is added to the arena."""
+        magic, version, root = struct.unpack_from('<4sHq', data)
+        if magic != FORMAT_MAGIC:
+            raise Exception("Not a serialized AST")
+        if version != FORMAT_VERSION:
+            raise Exception(f"Unsupported AST format version {version}")
+        offset = struct.calcsize('<4sHq')
+        view = memoryview(data)
+
+        def read(fmt: str) -> tuple[Any, ...]:
+            nonlocal offset
+            values = struct.unpack_from(fmt, data, offset)
+            offset += struct.calcsize(fmt)
+            return values
+
+        def read_string() -> str:
+            nonlocal offset
+            (length,) = read('<I')
+            text = str(view[offset:offset + length], 'utf-8')
+            offset += length
+            return text
+
+        def read_column() -> 'array[int]':
+            nonlocal offset
+            typecode_byte, itemsize, length, stored = read('<cBqq')
+            typecode = typecode_byte.decode()
+            if typecode not in _NARROW_TYPECODES or array(typecode).itemsize != itemsize:
+                raise Exception("Serialized AST has incompatible column widths")
+            column = array(typecode)
+            column.frombytes(view[offset:offset + itemsize * stored])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            offset += itemsize * stored
+            return column if stored == length else column * length
+
+        arena = Arena()
+        for table, ids in ((arena.strings, arena._string_ids), (arena.files, arena._file_ids)):
+            (count,) = read('<I')
+            for index in range(count):
+                text = read_string()
+                table.append(text)
+                ids[text] = index
+
+        # A function type may refer to types written after it
+        (count,) = read('<I')
+        entries: list[str | tuple[int, ...]] = []
+        for _ in range(count):
+            (tag,) = read('<B')
+            if tag == 0:
+                entries.append(read_string())
+            else:
+                (arg_count,) = read('<I')
+                entries.append(read(f'<{arg_count}HH'))
+        type_table: list[Type | None] = [None] * count
+
+        def build_type(type_id: int) -> Type:
+            t = type_table[type_id]
+            if t is None:
+                entry = entries[type_id]
+                if isinstance(entry, str):
+                    t = BasicType(entry)
+                else:
+                    t = FunType([build_type(i) for i in entry[:-1]], build_type(entry[-1]))
+                type_table[type_id] = t
+            return t
+
+        arena.type_table = [build_type(type_id) for type_id in range(count)]
+        arena._type_ids = {t: type_id for type_id, t in enumerate(arena.type_table)}
+
+        for name, typecode in _COLUMN_TYPECODES.items():
+            column = read_column()
+            setattr(arena, name, column)
+            if column.typecode != typecode:
+                arena._narrowed = True
+        arena.list_starts = array('i', accumulate(read_column(), initial=0))
+
+        (count,) = read('<I')
+        for _ in range(count):
+            (node,) = read('<q')
+            arena._big_ints[node] = int(read_string())
+
+        (count,) = read('<I')
+        for _ in range(count):
+            (node,) = read('<q')
+            file = read_string()
+            line, column_number = read('<qq')
+            arena._odd_locations[node] = SourceLocation(file, line, column_number)
+
+        return arena, root
+
+
+def _narrowest_typecode(column: 'array[int]') -> str:
+    low = min(column, default=0)
+    high = max(column, default=0)
+    for typecode in _NARROW_TYPECODES:
+        bits = 8 * array(typecode).itemsize
+        if typecode.islower():
+            if -(1 << (bits - 1)) <= low and high < 1 << (bits - 1):
+                return typecode
+        elif 0 <= low and high < 1 << bits:
+            return typecode
+    raise Exception("Column values out of range")
+
+
+def dump(node: ast.Expression) -> bytes:
+    """Serializes a (typically type-checked and resolved) AST, including
+    node types and the resolver's addresses and frame sizes."""
+    arena, root = build_arena(node)
+    return arena.to_bytes(root)
+
+
+def load(data: bytes) -> tuple[Arena, int]:
+    """Reads an AST written by `dump` into an arena, without building AST
+    nodes. Returns the arena and the root node. The stages run on the
+    arena directly, and `Arena.to_ast` builds AST nodes when needed."""
+    return Arena.from_bytes(data)
+
+
+def build_arena(node: ast.Expression) -> tuple[Arena, int]:
+    """Copies an AST into a new arena. Returns the arena and the root node."""
+    arena = Arena()
+    root = arena.from_ast(node)
+    return arena, root
@@ -1,5 +1,5 @@
-import dataclasses
 from compiler import ir
+from compiler.compact_ir import compact
 from compiler.intrinsics import all_intrinsics, IntrinsicArgs
 
 
@@ -72,24 +72,8 @@ def generate_assembly(instructions: list[ir.Instruction]) -> str:
     return "\n".join(assembly_code_lines)
 
 def get_all_ir_variables(instructions: list[ir.Instruction]) -> list[ir.IRVar]:
-    result_list: list[ir.IRVar] = []
-    result_set: set[ir.IRVar] = set()
-
-    def add(v: ir.IRVar) -> None:
-        if v not in result_set:
-            result_list.append(v)
-            result_set.add(v)
-
-    for insn in instructions:
-        for field in dataclasses.fields(insn):
-            value = getattr(insn, field.name)
-            if isinstance(value, ir.IRVar):
-                add(value)
-            elif isinstance(value, list):
-                for v in value:
-                    if isinstance(v, ir.IRVar):
-                        add(v)
-    return result_list
+    program = compact(instructions)
+    return [program.var(var_id) for var_id in range(len(program.variables))]
 
 
 class Locals:
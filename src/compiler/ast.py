@@ -1,28 +1,48 @@
 
 from dataclasses import dataclass, field
+from typing import ClassVar
 from compiler.tokenizer import SourceLocation
 from compiler.types import Type, Unit
 
 
+class NodeKind:
+    """Small integers that tell the node classes apart, see `compiler.tree`"""
+    LITERAL = 0
+    IDENTIFIER = 1
+    BINARY_OP = 2
+    UNARY_OP = 3
+    IF_EXPRESSION = 4
+    WHILE_EXPRESSION = 5
+    FUNCTION_CALL = 6
+    BLOCK = 7
+    VAR_DECLARATION = 8
+
+
 @dataclass
 class Expression:
     """Base class for AST nodes representing expressions"""
     location: SourceLocation
     type: Type = field(kw_only=True, default=Unit)
+    kind: ClassVar[int]
 
 
 @dataclass
 class Identifier(Expression):
+    kind = NodeKind.IDENTIFIER
     name: str
+    # (depth, slot) of the variable, set by the resolver
+    address: tuple[int, int] | None = field(kw_only=True, default=None, compare=False, repr=False)
 
 
 @dataclass
 class Literal(Expression):
+    kind = NodeKind.LITERAL
     value: int | bool | None
 
 
 @dataclass
 class BinaryOp(Expression):
+    kind = NodeKind.BINARY_OP
     left: Expression
     op: str
     right: Expression
@@ -30,6 +50,7 @@ class BinaryOp(Expression):
 
 @dataclass
 class IfExpression(Expression):
+    kind = NodeKind.IF_EXPRESSION
     cond: Expression
     then_clause: Expression
     else_clause: Expression | None
@@ -37,29 +58,38 @@ class IfExpression(Expression):
 
 @dataclass
 class WhileExpression(Expression):
+    kind = NodeKind.WHILE_EXPRESSION
     cond: Expression
     do_clause: Expression
 
 
 @dataclass
 class FunctionCall(Expression):
+    kind = NodeKind.FUNCTION_CALL
     name: str
     arguments: list[Expression]
+    address: tuple[int, int] | None = field(kw_only=True, default=None, compare=False, repr=False)
 
 
 @dataclass
 class Block(Expression):
+    kind = NodeKind.BLOCK
     arguments: list[Expression]
+    # Number of slots for the variables declared in the block, None if not resolved
+    frame_size: int | None = field(kw_only=True, default=None, compare=False, repr=False)
 
 
 @dataclass
 class UnaryOp(Expression):
+    kind = NodeKind.UNARY_OP
     op: str
     expr: Expression
 
 
 @dataclass
 class VarDeclaration(Expression):
+    kind = NodeKind.VAR_DECLARATION
     declared_type: str | None
     name: str
     value: Expression
+    slot: int | None = field(kw_only=True, default=None, compare=False, repr=False)
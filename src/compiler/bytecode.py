@@ -0,0 +1,432 @@
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from enum import IntEnum
+import struct
+import sys
+from typing import Iterator
+from compiler import ir
+from compiler.ir import IRVar
+
+
+class Op(IntEnum):
+    """Bytecode opcodes. Each is followed by its operands in the code:
+    register numbers, immediate values and code offsets."""
+    HALT = 0
+    LOAD = 1            # dest, value
+    COPY = 2            # dest, source
+    ADD = 3             # dest, a, b
+    SUB = 4
+    MUL = 5
+    DIV = 6
+    MOD = 7
+    EQ = 8
+    NE = 9
+    LT = 10
+    LE = 11
+    GT = 12
+    GE = 13
+    ADD_IMMEDIATE = 14  # dest, a, value
+    NEG = 15            # dest, a
+    NOT = 16
+    JUMP = 17           # target
+    JUMP_UNLESS = 18    # cond, target
+    PRINT_INT = 19      # a
+    PRINT_BOOL = 20
+    READ_INT = 21       # dest
+    # Superinstructions for a comparison followed by a conditional jump,
+    # which jump to target when the comparison is false
+    JUMP_UNLESS_EQ = 22  # a, b, target
+    JUMP_UNLESS_NE = 23
+    JUMP_UNLESS_LT = 24
+    JUMP_UNLESS_LE = 25
+    JUMP_UNLESS_GT = 26
+    JUMP_UNLESS_GE = 27
+    # The same with an immediate value as the right operand
+    JUMP_UNLESS_EQ_IMMEDIATE = 28  # a, value, target
+    JUMP_UNLESS_NE_IMMEDIATE = 29
+    JUMP_UNLESS_LT_IMMEDIATE = 30
+    JUMP_UNLESS_LE_IMMEDIATE = 31
+    JUMP_UNLESS_GT_IMMEDIATE = 32
+    JUMP_UNLESS_GE_IMMEDIATE = 33
+
+
+_binary_ops = {
+    '+': Op.ADD, '-': Op.SUB, '*': Op.MUL, '/': Op.DIV, '%': Op.MOD,
+    '==': Op.EQ, '!=': Op.NE, '<': Op.LT, '<=': Op.LE, '>': Op.GT, '>=': Op.GE,
+}
+_unary_ops = {'unary_-': Op.NEG, 'unary_not': Op.NOT}
+_comparison_jumps = {
+    '==': Op.JUMP_UNLESS_EQ, '!=': Op.JUMP_UNLESS_NE, '<': Op.JUMP_UNLESS_LT,
+    '<=': Op.JUMP_UNLESS_LE, '>': Op.JUMP_UNLESS_GT, '>=': Op.JUMP_UNLESS_GE,
+}
+_immediate_offset = Op.JUMP_UNLESS_EQ_IMMEDIATE - Op.JUMP_UNLESS_EQ
+
+_operand_counts = {op: 3 for op in Op}
+_operand_counts.update({
+    Op.HALT: 0, Op.LOAD: 2, Op.COPY: 2, Op.NEG: 2, Op.NOT: 2, Op.JUMP: 1,
+    Op.JUMP_UNLESS: 2, Op.PRINT_INT: 1, Op.PRINT_BOOL: 1, Op.READ_INT: 1,
+})
+
+FORMAT_MAGIC = b'CBYC'
+FORMAT_VERSION = 1
+
+_MIN_INT = -2**63
+_MAX_INT = 2**63 - 1
+
+
+def _wrap(value: int) -> int:
+    """Wraps an integer to 64 bits like the machine does."""
+    return ((value - _MIN_INT) & 0xFFFFFFFFFFFFFFFF) + _MIN_INT
+
+
+@dataclass
+class Bytecode:
+    """A compiled program: the code as 64-bit integers and the number
+    of registers it uses. Integers behave like in the compiled program:
+    they are 64 bits wide and division rounds towards zero."""
+    code: array
+    register_count: int
+
+    def instructions(self) -> Iterator[tuple[int, Op, list[int]]]:
+        """Decodes the code into (offset, opcode, operands) triples."""
+        pc = 0
+        while pc < len(self.code):
+            op = Op(self.code[pc])
+            count = _operand_counts[op]
+            yield pc, op, self.code[pc + 1:pc + 1 + count].tolist()
+            pc += 1 + count
+
+    def disassemble(self) -> str:
+        return '\n'.join(
+            f'{pc:5} {op.name} {", ".join(map(str, operands))}'.rstrip()
+            for pc, op, operands in self.instructions()
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serializes the program in the `.bc` file format: a header
+        followed by the code as little-endian 64-bit integers."""
+        code = array('q', self.code)
+        if sys.byteorder != 'little':
+            code.byteswap()
+        header = struct.pack('<4sHqq', FORMAT_MAGIC, FORMAT_VERSION, self.register_count, len(code))
+        return header + code.tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'Bytecode':
+        """Reads a program written by `to_bytes`."""
+        magic, version, register_count, length = struct.unpack_from('<4sHqq', data)
+        if magic != FORMAT_MAGIC:
+            raise Exception("Not a bytecode file")
+        if version != FORMAT_VERSION:
+            raise Exception(f"Unsupported bytecode format version {version}")
+        offset = struct.calcsize('<4sHqq')
+        if len(data) != offset + 8 * length:
+            raise Exception("Truncated bytecode file")
+        code = array('q')
+        code.frombytes(data[offset:])
+        if sys.byteorder != 'little':
+            code.byteswap()
+        return Bytecode(code, register_count)
+
+
+def dump(bytecode: Bytecode) -> bytes:
+    return bytecode.to_bytes()
+
+
+def load(data: bytes) -> Bytecode:
+    return Bytecode.from_bytes(data)
+
+
+def compile_bytecode(instructions: list[ir.Instruction]) -> Bytecode:
+    """Compiles the IR of a program into bytecode.
+
+    Each IR variable gets a register. Common instruction sequences are
+    combined into superinstructions when the temporary variables between
+    them are not used elsewhere:
+
+    - a comparison and a conditional jump on its result,
+    - loading a constant used as the right operand of `+`, `-` or a
+      comparison, e.g. `x = x + 1` and `i < 10`,
+    - an operation whose result is copied into a variable."""
+    uses: Counter[IRVar] = Counter()
+    for ins in instructions:
+        match ins:
+            case ir.Call():
+                uses.update(ins.args)
+            case ir.Copy():
+                uses[ins.source] += 1
+            case ir.CondJump():
+                uses[ins.cond] += 1
+
+    registers: dict[IRVar, int] = {}
+
+    def register(var: IRVar) -> int:
+        number = registers.get(var)
+        if number is None:
+            number = registers[var] = len(registers)
+        return number
+
+    code = array('q')
+    label_offsets: dict[str, int] = {}
+    # Positions of jump targets to fill in once the labels are known
+    fixups: list[tuple[int, str]] = []
+
+    def emit_jump_target(label: ir.Label) -> None:
+        fixups.append((len(code), label.name))
+        code.append(0)
+
+    def at(index: int) -> ir.Instruction | None:
+        return instructions[index] if index < len(instructions) else None
+
+    def single_use_temp(var: IRVar, ins: ir.Instruction | None) -> bool:
+        """Whether `var` is used only by `ins`."""
+        if uses[var] != 1:
+            return False
+        match ins:
+            case ir.Call():
+                return var in ins.args
+            case ir.Copy():
+                return ins.source == var
+            case ir.CondJump():
+                return ins.cond == var
+        return False
+
+    def result_register(dest: IRVar, index: int) -> tuple[int, int]:
+        """The register to store a result in, skipping a following copy of
+        it, and the number of instructions consumed."""
+        ins = at(index)
+        if isinstance(ins, ir.Copy) and ins.source == dest and single_use_temp(dest, ins):
+            return register(ins.dest), 1
+        return register(dest), 0
+
+    def emit_cond_jump_tail(ins: ir.CondJump, index: int) -> None:
+        """After jumping to the else branch, continue to the then branch."""
+        emit_jump_target(ins.else_label)
+        following = at(index + 1)
+        if not (isinstance(following, ir.Label) and following.name == ins.then_label.name):
+            code.append(Op.JUMP)
+            emit_jump_target(ins.then_label)
+
+    index = 0
+    while index < len(instructions):
+        ins = instructions[index]
+        following = at(index + 1)
+
+        match ins:
+            case ir.LoadIntConstant() if (isinstance(following, ir.Call)
+                                          and len(following.args) == 2
+                                          and following.args[1] == ins.dest
+                                          and following.args[0] != ins.dest
+                                          and single_use_temp(ins.dest, following)):
+                op_name = following.fun.name
+                value = _wrap(ins.value)
+                jump_ins = at(index + 2)
+                if (op_name in _comparison_jumps and isinstance(jump_ins, ir.CondJump)
+                        and jump_ins.cond == following.dest and single_use_temp(following.dest, jump_ins)):
+                    code.extend((_comparison_jumps[op_name] + _immediate_offset,
+                                 register(following.args[0]), value))
+                    emit_cond_jump_tail(jump_ins, index + 2)
+                    index += 3
+                    continue
+                if op_name in ('+', '-') and value != _MIN_INT:
+                    dest, skipped = result_register(following.dest, index + 2)
+                    code.extend((Op.ADD_IMMEDIATE, dest, register(following.args[0]),
+                                 value if op_name == '+' else -value))
+                    index += 2 + skipped
+                    continue
+                code.extend((Op.LOAD, register(ins.dest), value))
+
+            case ir.LoadIntConstant() | ir.LoadBoolConstant():
+                dest, skipped = result_register(ins.dest, index + 1)
+                code.extend((Op.LOAD, dest, _wrap(int(ins.value))))
+                index += skipped
+
+            case ir.Copy():
+                code.extend((Op.COPY, register(ins.dest), register(ins.source)))
+
+            case ir.Call() if ins.fun.name in _binary_ops and len(ins.args) == 2:
+                op_name = ins.fun.name
+                a, b = register(ins.args[0]), register(ins.args[1])
+                if (op_name in _comparison_jumps and isinstance(following, ir.CondJump)
+                        and following.cond == ins.dest and single_use_temp(ins.dest, following)):
+                    code.extend((_comparison_jumps[op_name], a, b))
+                    emit_cond_jump_tail(following, index + 1)
+                    index += 2
+                    continue
+                dest, skipped = result_register(ins.dest, index + 1)
+                code.extend((_binary_ops[op_name], dest, a, b))
+                index += skipped
+
+            case ir.Call() if ins.fun.name in _unary_ops and len(ins.args) == 1:
+                dest, skipped = result_register(ins.dest, index + 1)
+                code.extend((_unary_ops[ins.fun.name], dest, register(ins.args[0])))
+                index += skipped
+
+            case ir.Call() if ins.fun.name in ('print_int', 'print_bool') and len(ins.args) == 1:
+                op = Op.PRINT_INT if ins.fun.name == 'print_int' else Op.PRINT_BOOL
+                code.extend((op, register(ins.args[0])))
+
+            case ir.Call() if ins.fun.name == 'read_int' and len(ins.args) == 0:
+                dest, skipped = result_register(ins.dest, index + 1)
+                code.extend((Op.READ_INT, dest))
+                index += skipped
+
+            case ir.Call():
+                raise Exception(f'Unknown function: {ins.fun.name}')
+
+            case ir.Label():
+                label_offsets[ins.name] = len(code)
+
+            case ir.Jump():
+                code.append(Op.JUMP)
+                emit_jump_target(ins.label)
+
+            case ir.CondJump():
+                code.extend((Op.JUMP_UNLESS, register(ins.cond)))
+                emit_cond_jump_tail(ins, index)
+
+            case _:
+                raise Exception(f'Unsupported IR instruction: {ins}')
+        index += 1
+
+    code.append(Op.HALT)
+    for position, name in fixups:
+        code[position] = label_offsets[name]
+    return Bytecode(code, len(registers))
+
+
+def run_bytecode(bytecode: Bytecode) -> None:
+    """Runs a program compiled by `compile_bytecode`."""
+    code = bytecode.code.tolist()
+    # Opcodes as plain ints in local variables, which are much faster
+    # to compare with than the enum members
+    HALT = int(Op.HALT)
+    LOAD = int(Op.LOAD)
+    COPY = int(Op.COPY)
+    ADD = int(Op.ADD)
+    SUB = int(Op.SUB)
+    MUL = int(Op.MUL)
+    DIV = int(Op.DIV)
+    MOD = int(Op.MOD)
+    EQ = int(Op.EQ)
+    NE = int(Op.NE)
+    LT = int(Op.LT)
+    LE = int(Op.LE)
+    GT = int(Op.GT)
+    GE = int(Op.GE)
+    ADD_IMMEDIATE = int(Op.ADD_IMMEDIATE)
+    NEG = int(Op.NEG)
+    NOT = int(Op.NOT)
+    JUMP = int(Op.JUMP)
+    JUMP_UNLESS = int(Op.JUMP_UNLESS)
+    PRINT_INT = int(Op.PRINT_INT)
+    PRINT_BOOL = int(Op.PRINT_BOOL)
+    READ_INT = int(Op.READ_INT)
+    JUMP_UNLESS_EQ = int(Op.JUMP_UNLESS_EQ)
+    JUMP_UNLESS_NE = int(Op.JUMP_UNLESS_NE)
+    JUMP_UNLESS_LT = int(Op.JUMP_UNLESS_LT)
+    JUMP_UNLESS_LE = int(Op.JUMP_UNLESS_LE)
+    JUMP_UNLESS_GT = int(Op.JUMP_UNLESS_GT)
+    JUMP_UNLESS_EQ_IMMEDIATE = int(Op.JUMP_UNLESS_EQ_IMMEDIATE)
+    JUMP_UNLESS_LT_IMMEDIATE = int(Op.JUMP_UNLESS_LT_IMMEDIATE)
+    regs: list[int] = [0] * bytecode.register_count
+    pc = 0
+    while True:
+        op = code[pc]
+        # The opcodes are tested roughly in order of how often loops use them
+        if op == ADD_IMMEDIATE:
+            value = regs[code[pc + 2]] + code[pc + 3]
+            regs[code[pc + 1]] = value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+            pc += 4
+        elif op == JUMP:
+            pc = code[pc + 1]
+        elif op == JUMP_UNLESS_LT_IMMEDIATE:
+            pc = pc + 4 if regs[code[pc + 1]] < code[pc + 2] else code[pc + 3]
+        elif op == JUMP_UNLESS_LT:
+            pc = pc + 4 if regs[code[pc + 1]] < regs[code[pc + 2]] else code[pc + 3]
+        elif op == ADD:
+            value = regs[code[pc + 2]] + regs[code[pc + 3]]
+            regs[code[pc + 1]] = value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+            pc += 4
+        elif op == COPY:
+            regs[code[pc + 1]] = regs[code[pc + 2]]
+            pc += 3
+        elif op == LOAD:
+            regs[code[pc + 1]] = code[pc + 2]
+            pc += 3
+        elif op == JUMP_UNLESS:
+            pc = pc + 3 if regs[code[pc + 1]] else code[pc + 2]
+        elif op == SUB:
+            value = regs[code[pc + 2]] - regs[code[pc + 3]]
+            regs[code[pc + 1]] = value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+            pc += 4
+        elif op == MUL:
+            value = regs[code[pc + 2]] * regs[code[pc + 3]]
+            regs[code[pc + 1]] = value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+            pc += 4
+        elif op == DIV or op == MOD:
+            a, b = regs[code[pc + 2]], regs[code[pc + 3]]
+            if b == 0:
+                raise Exception("Can't divide by zero")
+            # Rounded towards zero, and the remainder has the sign of `a`
+            quotient = abs(a) // abs(b)
+            if (a < 0) != (b < 0):
+                quotient = -quotient
+            regs[code[pc + 1]] = _wrap(quotient) if op == DIV else a - b * quotient
+            pc += 4
+        elif EQ <= op <= GE:
+            a, b = regs[code[pc + 2]], regs[code[pc + 3]]
+            if op == EQ:
+                result = a == b
+            elif op == NE:
+                result = a != b
+            elif op == LT:
+                result = a < b
+            elif op == LE:
+                result = a <= b
+            elif op == GT:
+                result = a > b
+            else:
+                result = a >= b
+            regs[code[pc + 1]] = result
+            pc += 4
+        elif op >= JUMP_UNLESS_EQ:
+            a = regs[code[pc + 1]]
+            if op >= JUMP_UNLESS_EQ_IMMEDIATE:
+                b = code[pc + 2]
+                op -= _immediate_offset
+            else:
+                b = regs[code[pc + 2]]
+            if op == JUMP_UNLESS_EQ:
+                result = a == b
+            elif op == JUMP_UNLESS_NE:
+                result = a != b
+            elif op == JUMP_UNLESS_LT:
+                result = a < b
+            elif op == JUMP_UNLESS_LE:
+                result = a <= b
+            elif op == JUMP_UNLESS_GT:
+                result = a > b
+            else:
+                result = a >= b
+            pc = pc + 4 if result else code[pc + 3]
+        elif op == NEG:
+            regs[code[pc + 1]] = _wrap(-regs[code[pc + 2]])
+            pc += 3
+        elif op == NOT:
+            regs[code[pc + 1]] = not regs[code[pc + 2]]
+            pc += 3
+        elif op == PRINT_INT:
+            print(regs[code[pc + 1]])
+            pc += 2
+        elif op == PRINT_BOOL:
+            print('true' if regs[code[pc + 1]] else 'false')
+            pc += 2
+        elif op == READ_INT:
+            regs[code[pc + 1]] = _wrap(int(input()))
+            pc += 2
+        elif op == HALT:
+            return
+        else:
+            raise Exception(f'Invalid opcode {op} at {pc}')
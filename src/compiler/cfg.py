@@ -0,0 +1,124 @@
+from typing import Protocol
+from compiler import ir
+
+
+class InstructionSink(Protocol):
+    """Where the IR generator puts instructions: a list, or a
+    `CFGBuilder` that splits them into basic blocks as they come."""
+
+    def append(self, ins: ir.Instruction, /) -> None: ...
+
+
+class BasicBlock:
+    """Instructions that run from the first to the last, without jumps
+    in or out in between.
+
+    A block starts with its label, if it has one, and ends with its
+    terminator: a `Jump` or a `CondJump`, or None when the block falls
+    through to the next block (or, for the last block, the program's end).
+    `instructions` holds the instructions in between. Successors and
+    predecessors are block indices."""
+    __slots__ = ('index', 'label', 'instructions', 'terminator', 'successors', 'predecessors')
+
+    def __init__(self, index: int, label: ir.Label | None) -> None:
+        self.index = index
+        self.label = label
+        self.instructions: list[ir.Instruction] = []
+        self.terminator: ir.Jump | ir.CondJump | None = None
+        self.successors: list[int] = []
+        self.predecessors: list[int] = []
+
+    def __repr__(self) -> str:
+        name = self.label.name if self.label is not None else f'#{self.index}'
+        return f'BasicBlock({name}, {len(self.instructions)} instructions, successors={self.successors})'
+
+
+class ControlFlowGraph:
+    """The basic blocks of a program in program order. The first block
+    is the entry."""
+
+    def __init__(self, blocks: list[BasicBlock]) -> None:
+        self.blocks = blocks
+
+    def linearize(self) -> list[ir.Instruction]:
+        """The program as a flat list of instructions, like `generate_ir` returns."""
+        result: list[ir.Instruction] = []
+        for block in self.blocks:
+            if block.label is not None:
+                result.append(block.label)
+            result.extend(block.instructions)
+            if block.terminator is not None:
+                result.append(block.terminator)
+        return result
+
+
+class CFGBuilder:
+    """Builds a control flow graph from instructions appended in program
+    order. A label starts a new block and a jump ends one, so the blocks
+    are complete when the last instruction arrives, and `finish` only
+    links the jumps to the blocks of their labels."""
+
+    def __init__(self) -> None:
+        self.blocks: list[BasicBlock] = [BasicBlock(0, None)]
+        self._block_of_label: dict[str, int] = {}
+        self._ended = False
+
+    def append(self, ins: ir.Instruction) -> None:
+        block = self.blocks[-1]
+        if isinstance(ins, ir.Label):
+            if block.label is None and not block.instructions and not self._ended:
+                # The program starts with a label
+                block.label = ins
+            else:
+                block = self._new_block(ins)
+            self._block_of_label[ins.name] = block.index
+        elif self._ended:
+            # Unreachable code after a jump
+            block = self._new_block(None)
+            self._add(block, ins)
+        else:
+            self._add(block, ins)
+
+    def _add(self, block: BasicBlock, ins: ir.Instruction) -> None:
+        if isinstance(ins, (ir.Jump, ir.CondJump)):
+            block.terminator = ins
+            self._ended = True
+        else:
+            block.instructions.append(ins)
+
+    def _new_block(self, label: ir.Label | None) -> BasicBlock:
+        block = BasicBlock(len(self.blocks), label)
+        self.blocks.append(block)
+        self._ended = False
+        return block
+
+    def finish(self) -> ControlFlowGraph:
+        for block in self.blocks:
+            terminator = block.terminator
+            if isinstance(terminator, ir.Jump):
+                targets = [self._target(terminator.label)]
+            elif isinstance(terminator, ir.CondJump):
+                targets = [self._target(terminator.then_label), self._target(terminator.else_label)]
+            elif block.index + 1 < len(self.blocks):
+                targets = [block.index + 1]
+            else:
+                targets = []
+            for target in targets:
+                if target not in block.successors:
+                    block.successors.append(target)
+                    self.blocks[target].predecessors.append(block.index)
+        return ControlFlowGraph(self.blocks)
+
+    def _target(self, label: ir.Label) -> int:
+        index = self._block_of_label.get(label.name)
+        if index is None:
+            raise Exception(f'{label.location}: jump to unknown label {label.name}')
+        return index
+
+
+def build_cfg(instructions: list[ir.Instruction]) -> ControlFlowGraph:
+    """Splits a flat list of instructions into basic blocks."""
+    builder = CFGBuilder()
+    for ins in instructions:
+        builder.append(ins)
+    return builder.finish()
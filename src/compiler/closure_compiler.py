@@ -0,0 +1,334 @@
+from typing import Any, Callable
+from compiler import ast
+from compiler.interpreter import Value, interpret
+from compiler.resolver import resolve
+from compiler.symtab import SymTab, UNDEFINED
+
+
+# A compiled expression. It is called with the values of all resolved
+# variables of the program, see `compile_closures`.
+Closure = Callable[[list], Any]
+
+# Nesting depth compiled into closures. Deeper programs are run by `interpret`,
+# which continues with an explicit stack.
+_RECURSION_BUDGET = 200
+
+
+class _TooDeep(Exception):
+    pass
+
+
+def closure_interpret(node: ast.Expression, symtab: SymTab) -> Value:
+    """Runs the program like `interpret`, by compiling it with `compile_closures`."""
+    return compile_closures(node, symtab)()
+
+
+def compile_closures(node: ast.Expression, symtab: SymTab) -> Callable[[], Value]:
+    """Compiles the AST once into a tree of closures specialized for each node.
+
+    Operators, literal values and variable addresses are bound when compiling,
+    so running the closures does no dispatch on node types and allocates no
+    scopes. The language has no functions, so a block is never entered again
+    before it is left, and the variables of every block live at fixed
+    positions of one list allocated for each run. Entering a block resets its
+    variables, so the program behaves exactly like with `interpret`.
+
+    Names that are not resolved, like the built-in functions, are looked up
+    in `symtab` when they are used, except that operators and functions that
+    the program does not assign to are looked up once when compiling."""
+    resolve(node)
+    compiler = _ClosureCompiler(node, symtab)
+    try:
+        closure = compiler.compile(node, 0)
+    except _TooDeep:
+        return lambda: interpret(node, symtab)
+    size = compiler.size
+
+    def run() -> Value:
+        return closure([UNDEFINED] * size)
+
+    return run
+
+
+class _ClosureCompiler:
+    def __init__(self, root: ast.Expression, symtab: SymTab) -> None:
+        self.symtab = symtab
+        # Number of variables in all blocks of the program
+        self.size = 0
+        # Position of the first variable of each enclosing block
+        self.bases: list[int] = []
+        # Positions of the variables declared by a statement of a block that
+        # has already been compiled, so they are set when read from here on.
+        # Others may be read before their declaration has run, like `y` in
+        # `{ false and var y = 1; y }`, and are checked when read.
+        self.set_indices: set[int] = set()
+        self.assigned_names = _assigned_names(root)
+
+    def index(self, address: tuple[int, int]) -> int:
+        depth, slot = address
+        return self.bases[-1 - depth] + slot
+
+    def compile(self, node: ast.Expression, depth: int) -> Closure:
+        if depth > _RECURSION_BUDGET:
+            raise _TooDeep()
+        depth += 1
+        symtab = self.symtab
+
+        match node:
+            case ast.Literal():
+                literal_value = node.value
+                return lambda values: literal_value
+
+            case ast.Identifier():
+                name = node.name
+                if node.address is not None:
+                    index = self.index(node.address)
+                    if index in self.set_indices:
+                        return lambda values: values[index]
+
+                    def resolved_identifier(values: list) -> Any:
+                        value = values[index]
+                        if value is UNDEFINED:
+                            raise Exception(f'Variable "{name}" is not set')
+                        return value
+                    return resolved_identifier
+
+                def identifier(values: list) -> Any:
+                    value = symtab.get(name)
+                    if value is UNDEFINED:
+                        raise Exception(f'Variable "{name}" is not set')
+                    return value
+                return identifier
+
+            case ast.BinaryOp():
+                if node.op == '=':
+                    return self.compile_assignment(node, depth)
+                return self.compile_binary_op(node, depth)
+
+            case ast.UnaryOp():
+                unary_op = symtab.get(f'unary_{node.op}')
+                expr = self.compile(node.expr, depth)
+                return lambda values: unary_op(expr(values))
+
+            case ast.VarDeclaration():
+                name = node.name
+                value_closure = self.compile(node.value, depth)
+                if node.slot is None:
+                    def root_declaration(values: list) -> None:
+                        if symtab.get_local(name) is not UNDEFINED:
+                            raise Exception(f'Value for "{name}" already exists')
+                        symtab.set(name, value_closure(values))
+                    return root_declaration
+
+                index = self.bases[-1] + node.slot
+
+                def declaration(values: list) -> None:
+                    if values[index] is not UNDEFINED:
+                        raise Exception(f'Value for "{name}" already exists')
+                    values[index] = value_closure(values)
+                return declaration
+
+            case ast.IfExpression():
+                cond = self.compile(node.cond, depth)
+                then_clause = self.compile(node.then_clause, depth)
+                if node.else_clause is None:
+                    def if_then(values: list) -> None:
+                        if cond(values):
+                            then_clause(values)
+                    return if_then
+
+                else_clause = self.compile(node.else_clause, depth)
+                return lambda values: then_clause(values) if cond(values) else else_clause(values)
+
+            case ast.WhileExpression():
+                cond = self.compile(node.cond, depth)
+                do_clause = self.compile(node.do_clause, depth)
+
+                def while_loop(values: list) -> None:
+                    while cond(values):
+                        do_clause(values)
+                return while_loop
+
+            case ast.Block():
+                return self.compile_block(node, depth)
+
+            case ast.FunctionCall():
+                return self.compile_function_call(node, depth)
+
+            case _:
+                raise Exception(f'Unsupported AST node: {node}')
+
+    def compile_assignment(self, node: ast.BinaryOp, depth: int) -> Closure:
+        if not isinstance(node.left, ast.Identifier):
+            # An error only if the assignment is run
+            def invalid_assignment(values: list) -> Any:
+                raise Exception('Left of assignment must be an identifier')
+            return invalid_assignment
+        name = node.left.name
+        right = self.compile(node.right, depth)
+        if node.left.address is not None:
+            index = self.index(node.left.address)
+
+            def assignment(values: list) -> Any:
+                value = values[index] = right(values)
+                return value
+            return assignment
+
+        symtab = self.symtab
+
+        def root_assignment(values: list) -> Any:
+            value = right(values)
+            scope = symtab.find_scope(name)
+            if scope is UNDEFINED:
+                raise Exception(f'Variable "{name}" is not set')
+            scope.set(name, value)
+            return value
+        return root_assignment
+
+    def compile_binary_op(self, node: ast.BinaryOp, depth: int) -> Closure:
+        binary_op = self.symtab.get(node.op)
+        left = self.compile(node.left, depth)
+        right = self.compile(node.right, depth)
+
+        if node.op == 'and':
+            def and_op(values: list) -> Any:
+                a = left(values)
+                if not a:
+                    return False
+                return binary_op(a, right(values))
+            return and_op
+
+        if node.op == 'or':
+            def or_op(values: list) -> Any:
+                a = left(values)
+                if a:
+                    return True
+                return binary_op(a, right(values))
+            return or_op
+
+        # Operands that are variables or literals are read in place,
+        # which saves a closure call for most operators
+        left_index = self.operand_index(node.left)
+        right_index = self.operand_index(node.right)
+        if left_index is not None and right_index is not None:
+            return lambda values: binary_op(values[left_index], values[right_index])
+        if left_index is not None:
+            if isinstance(node.right, ast.Literal):
+                b = node.right.value
+                return lambda values: binary_op(values[left_index], b)
+            return lambda values: binary_op(values[left_index], right(values))
+        if isinstance(node.right, ast.Literal):
+            b = node.right.value
+            return lambda values: binary_op(left(values), b)
+        return lambda values: binary_op(left(values), right(values))
+
+    def operand_index(self, node: ast.Expression) -> int | None:
+        if isinstance(node, ast.Identifier) and node.address is not None:
+            index = self.index(node.address)
+            if index in self.set_indices:
+                return index
+        return None
+
+    def compile_block(self, node: ast.Block, depth: int) -> Closure:
+        assert node.frame_size is not None
+        start = self.size
+        end = start + node.frame_size
+        self.size = end
+        self.bases.append(start)
+        statements = []
+        for argument in node.arguments:
+            statements.append(self.compile(argument, depth))
+            if isinstance(argument, ast.VarDeclaration) and argument.slot is not None:
+                self.set_indices.add(start + argument.slot)
+        self.bases.pop()
+
+        if not statements:
+            return lambda values: None
+        last = statements.pop()
+        undefined = [UNDEFINED] * node.frame_size
+
+        if node.frame_size == 0:
+            if not statements:
+                return last
+
+            def block(values: list) -> Any:
+                for statement in statements:
+                    statement(values)
+                return last(values)
+            return block
+
+        def block_with_variables(values: list) -> Any:
+            values[start:end] = undefined
+            for statement in statements:
+                statement(values)
+            return last(values)
+        return block_with_variables
+
+    def compile_function_call(self, node: ast.FunctionCall, depth: int) -> Closure:
+        name = node.name
+        symtab = self.symtab
+        arguments = [self.compile(argument, depth) for argument in node.arguments]
+        wrong_count = (
+            (name in ['print_int', 'print_bool'] and len(arguments) != 1)
+            or (name == 'read_int' and len(arguments) != 0)
+        )
+
+        if wrong_count:
+            def wrong_call(values: list) -> Any:
+                for argument in arguments:
+                    argument(values)
+                raise Exception(f'Wrong number of arguments in {name}')
+            return wrong_call
+
+        if node.address is not None:
+            index = self.index(node.address)
+
+            def resolved_call(values: list) -> Any:
+                func = values[index]
+                return func(*[argument(values) for argument in arguments])
+            return resolved_call
+
+        if name in self.assigned_names:
+            def dynamic_call(values: list) -> Any:
+                func = symtab.get(name)
+                return func(*[argument(values) for argument in arguments])
+            return dynamic_call
+
+        func = symtab.get(name)
+        if len(arguments) == 0:
+            return lambda values: func()
+        if len(arguments) == 1:
+            argument = arguments[0]
+            return lambda values: func(argument(values))
+        return lambda values: func(*[argument(values) for argument in arguments])
+
+
+def _assigned_names(root: ast.Expression) -> set[str]:
+    """Unresolved names that the program assigns to or declares"""
+    names = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        match node:
+            case ast.BinaryOp():
+                if node.op == '=' and isinstance(node.left, ast.Identifier) and node.left.address is None:
+                    names.add(node.left.name)
+                stack.append(node.left)
+                stack.append(node.right)
+            case ast.UnaryOp():
+                stack.append(node.expr)
+            case ast.VarDeclaration():
+                if node.slot is None:
+                    names.add(node.name)
+                stack.append(node.value)
+            case ast.IfExpression():
+                stack.append(node.cond)
+                stack.append(node.then_clause)
+                if node.else_clause is not None:
+                    stack.append(node.else_clause)
+            case ast.WhileExpression():
+                stack.append(node.cond)
+                stack.append(node.do_clause)
+            case ast.FunctionCall() | ast.Block():
+                stack.extend(node.arguments)
+    return names
@@ -0,0 +1,263 @@
+from abc import ABC, abstractmethod
+from typing import Iterator
+from compiler import ir
+from compiler.ir import IRVar
+from compiler.tokenizer import SourceLocation
+from compiler.types import Type, Unit
+
+
+class VarTable:
+    """The names and types of IR variables, indexed by dense integer ids."""
+    __slots__ = ('names', 'types', '_ids')
+
+    def __init__(self) -> None:
+        self.names: list[str] = []
+        self.types: list[Type] = []
+        self._ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def id(self, name: str, t: Type = Unit) -> int:
+        """The id of the variable, added with the given type if it is new."""
+        var_id = self._ids.get(name)
+        if var_id is None:
+            var_id = len(self.names)
+            self._ids[name] = var_id
+            self.names.append(name)
+            self.types.append(t)
+        return var_id
+
+    def find(self, name: str) -> int | None:
+        return self._ids.get(name)
+
+
+# Each instruction class lists its operands with `defs` (the variables
+# it assigns) and `uses` (the variables it reads), so passes walk the
+# operands without looking at the fields.
+
+class Instruction(ABC):
+    __slots__ = ('location',)
+
+    def __init__(self, location: SourceLocation) -> None:
+        self.location = location
+
+    def defs(self) -> tuple[int, ...]:
+        return ()
+
+    def uses(self) -> tuple[int, ...]:
+        return ()
+
+    def operands(self) -> tuple[int, ...]:
+        """All variables of the instruction, in the order of the fields
+        of the `ir` class."""
+        return self.uses() + self.defs()
+
+    @abstractmethod
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        """The instruction as an `ir.Instruction`."""
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name)
+            for name in type(self).__slots__
+        )
+
+
+class LoadIntConstant(Instruction):
+    __slots__ = ('value', 'dest')
+
+    def __init__(self, location: SourceLocation, value: int, dest: int) -> None:
+        self.location = location
+        self.value = value
+        self.dest = dest
+
+    def defs(self) -> tuple[int, ...]:
+        return (self.dest,)
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return ir.LoadIntConstant(self.location, self.value, program.var(self.dest))
+
+
+class LoadBoolConstant(Instruction):
+    __slots__ = ('value', 'dest')
+
+    def __init__(self, location: SourceLocation, value: bool, dest: int) -> None:
+        self.location = location
+        self.value = value
+        self.dest = dest
+
+    def defs(self) -> tuple[int, ...]:
+        return (self.dest,)
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return ir.LoadBoolConstant(self.location, self.value, program.var(self.dest))
+
+
+class Copy(Instruction):
+    __slots__ = ('source', 'dest')
+
+    def __init__(self, location: SourceLocation, source: int, dest: int) -> None:
+        self.location = location
+        self.source = source
+        self.dest = dest
+
+    def defs(self) -> tuple[int, ...]:
+        return (self.dest,)
+
+    def uses(self) -> tuple[int, ...]:
+        return (self.source,)
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return ir.Copy(self.location, program.var(self.source), program.var(self.dest))
+
+
+class Call(Instruction):
+    __slots__ = ('fun', 'args', 'dest')
+
+    def __init__(self, location: SourceLocation, fun: int, args: tuple[int, ...], dest: int) -> None:
+        self.location = location
+        self.fun = fun
+        self.args = args
+        self.dest = dest
+
+    def defs(self) -> tuple[int, ...]:
+        return (self.dest,)
+
+    def uses(self) -> tuple[int, ...]:
+        # The function is a variable too, since it can be assigned
+        return (self.fun,) + self.args
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return ir.Call(
+            self.location,
+            program.var(self.fun),
+            [program.var(arg) for arg in self.args],
+            program.var(self.dest),
+        )
+
+
+class Label(Instruction):
+    """Labels are dense integer ids too, indexing `CompactIR.labels`."""
+    __slots__ = ('label',)
+
+    def __init__(self, location: SourceLocation, label: int) -> None:
+        self.location = location
+        self.label = label
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return program.labels[self.label]
+
+
+class Jump(Instruction):
+    __slots__ = ('label',)
+
+    def __init__(self, location: SourceLocation, label: int) -> None:
+        self.location = location
+        self.label = label
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return ir.Jump(self.location, program.labels[self.label])
+
+
+class CondJump(Instruction):
+    __slots__ = ('cond', 'then_label', 'else_label')
+
+    def __init__(self, location: SourceLocation, cond: int, then_label: int, else_label: int) -> None:
+        self.location = location
+        self.cond = cond
+        self.then_label = then_label
+        self.else_label = else_label
+
+    def uses(self) -> tuple[int, ...]:
+        return (self.cond,)
+
+    def view(self, program: 'CompactIR') -> ir.Instruction:
+        return ir.CondJump(
+            self.location,
+            program.var(self.cond),
+            program.labels[self.then_label],
+            program.labels[self.else_label],
+        )
+
+
+class CompactIR:
+    """A program of compact instructions, whose variables and labels are
+    integer ids. `view` gives the same program as `ir` instructions."""
+    __slots__ = ('instructions', 'variables', 'labels', '_vars')
+
+    def __init__(self) -> None:
+        self.instructions: list[Instruction] = []
+        self.variables = VarTable()
+        self.labels: list[ir.Label] = []
+        self._vars: list[IRVar] = []
+
+    def var(self, var_id: int) -> IRVar:
+        """The variable as an `IRVar`, created once per id."""
+        while len(self._vars) <= var_id:
+            self._vars.append(IRVar(self.variables.names[len(self._vars)]))
+        return self._vars[var_id]
+
+    def view(self) -> list[ir.Instruction]:
+        return [ins.view(self) for ins in self.instructions]
+
+    def __iter__(self) -> Iterator[Instruction]:
+        return iter(self.instructions)
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def __str__(self) -> str:
+        return '\n'.join(str(ins) for ins in self.view())
+
+
+def compact(instructions: list[ir.Instruction], var_types: dict[IRVar, Type] | None = None) -> CompactIR:
+    """Converts `ir` instructions to compact IR. Variables get ids in the
+    order they first appear, with their types from `var_types`."""
+    program = CompactIR()
+    variables = program.variables
+    types = var_types or {}
+    label_ids: dict[str, int] = {}
+
+    ids = variables._ids
+
+    def var(v: IRVar) -> int:
+        var_id = ids.get(v.name)
+        if var_id is None:
+            var_id = variables.id(v.name, types.get(v, Unit))
+        return var_id
+
+    def label(l: ir.Label) -> int:
+        label_id = label_ids.get(l.name)
+        if label_id is None:
+            label_id = label_ids[l.name] = len(program.labels)
+            program.labels.append(l)
+        return label_id
+
+    result = program.instructions
+    for ins in instructions:
+        match ins:
+            case ir.LoadIntConstant():
+                result.append(LoadIntConstant(ins.location, ins.value, var(ins.dest)))
+            case ir.LoadBoolConstant():
+                result.append(LoadBoolConstant(ins.location, ins.value, var(ins.dest)))
+            case ir.Copy():
+                source = var(ins.source)
+                result.append(Copy(ins.location, source, var(ins.dest)))
+            case ir.Call():
+                fun = var(ins.fun)
+                args = tuple(var(arg) for arg in ins.args)
+                result.append(Call(ins.location, fun, args, var(ins.dest)))
+            case ir.Label():
+                # The label's own instance, so the view equals the original
+                label_id = label(ins)
+                program.labels[label_id] = ins
+                result.append(Label(ins.location, label_id))
+            case ir.Jump():
+                result.append(Jump(ins.location, label(ins.label)))
+            case ir.CondJump():
+                cond = var(ins.cond)
+                result.append(CondJump(ins.location, cond, label(ins.then_label), label(ins.else_label)))
+            case _:
+                raise Exception(f'Unknown instruction: {type(ins)}')
+    return program
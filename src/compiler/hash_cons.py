@@ -0,0 +1,288 @@
+from dataclasses import dataclass, field
+from typing import Any
+from compiler import ast, trampoline
+from compiler.symtab import SymTab
+from compiler.trampoline import Step
+from compiler.types import Type
+
+
+# A name looked up by name, or the (depth, slot) address of a resolved
+# variable relative to the scope the subtree is checked in
+Reference = str | tuple[int, int]
+
+
+@dataclass
+class SubtreeInfo:
+    """One class of structurally identical subtrees"""
+    node: ast.Expression
+    size: int
+    count: int = 1
+    references: tuple[Reference, ...] | None = None
+    pure: bool | None = None
+
+
+class HashConsing:
+    """Gives structurally identical subtrees a shared canonical id.
+
+    Locations and types are ignored, so two copies of the same
+    expression in different places of a program get the same id.
+    Nodes are identified by `id()`, so the AST must not be modified
+    while the ids are in use."""
+
+    def __init__(self, root: ast.Expression) -> None:
+        self.root = root
+        self.ids: dict[int, int] = {}
+        self.subtrees: list[SubtreeInfo] = []
+        self._keys: dict[tuple, int] = {}
+        self.add(root)
+
+    def add(self, node: ast.Expression) -> int:
+        """Assigns canonical ids to a subtree and returns the root's id."""
+        return trampoline.run(self._add(node, 0))
+
+    def _add(self, node: ast.Expression, depth: int) -> Step:
+        if depth > trampoline.RECURSION_BUDGET:
+            return (yield self._add(node, 0))
+        depth += 1
+
+        match node:
+            case ast.Literal():
+                key: tuple = ('Literal', type(node.value), node.value)
+                size = 1
+            case ast.Identifier():
+                key = ('Identifier', node.name, node.address)
+                size = 1
+            case ast.BinaryOp():
+                left = yield from self._add(node.left, depth)
+                right = yield from self._add(node.right, depth)
+                key = ('BinaryOp', node.op, left, right)
+                size = 1 + self.subtrees[left].size + self.subtrees[right].size
+            case ast.UnaryOp():
+                expr = yield from self._add(node.expr, depth)
+                key = ('UnaryOp', node.op, expr)
+                size = 1 + self.subtrees[expr].size
+            case ast.IfExpression():
+                cond = yield from self._add(node.cond, depth)
+                then_clause = yield from self._add(node.then_clause, depth)
+                else_clause = -1 if node.else_clause is None else (yield from self._add(node.else_clause, depth))
+                key = ('IfExpression', cond, then_clause, else_clause)
+                size = 1 + sum(self.subtrees[i].size for i in (cond, then_clause, else_clause) if i >= 0)
+            case ast.WhileExpression():
+                cond = yield from self._add(node.cond, depth)
+                do_clause = yield from self._add(node.do_clause, depth)
+                key = ('WhileExpression', cond, do_clause)
+                size = 1 + self.subtrees[cond].size + self.subtrees[do_clause].size
+            case ast.FunctionCall():
+                argument_ids = []
+                for argument in node.arguments:
+                    argument_ids.append((yield from self._add(argument, depth)))
+                arguments = tuple(argument_ids)
+                key = ('FunctionCall', node.name, node.address, arguments)
+                size = 1 + sum(self.subtrees[i].size for i in arguments)
+            case ast.Block():
+                argument_ids = []
+                for argument in node.arguments:
+                    argument_ids.append((yield from self._add(argument, depth)))
+                arguments = tuple(argument_ids)
+                key = ('Block', arguments)
+                size = 1 + sum(self.subtrees[i].size for i in arguments)
+            case ast.VarDeclaration():
+                value = yield from self._add(node.value, depth)
+                key = ('VarDeclaration', node.declared_type, node.name, node.slot, value)
+                size = 1 + self.subtrees[value].size
+            case _:
+                raise Exception(f"Unsupported AST node: {node}")
+
+        canonical_id = self._keys.get(key)
+        if canonical_id is None:
+            canonical_id = len(self.subtrees)
+            self._keys[key] = canonical_id
+            self.subtrees.append(SubtreeInfo(node, size))
+        else:
+            self.subtrees[canonical_id].count += 1
+        self.ids[id(node)] = canonical_id
+        return canonical_id
+
+    def canonical_id(self, node: ast.Expression) -> int | None:
+        return self.ids.get(id(node))
+
+    def references(self, canonical_id: int) -> tuple[Reference, ...]:
+        """The symbol table entries that typechecking the subtree looks up,
+        including operators and functions. Unresolved names declared inside
+        the subtree are included too, which is harmless for memoization."""
+        info = self.subtrees[canonical_id]
+        if info.references is None:
+            references: dict[Reference, None] = {}
+            trampoline.run(_collect_references(info.node, 0, references, 0))
+            info.references = tuple(references)
+        return info.references
+
+    def pure(self, canonical_id: int) -> bool:
+        """Whether typechecking the subtree leaves the symbol table as it was,
+        i.e. every variable declaration in it is inside a block in it."""
+        info = self.subtrees[canonical_id]
+        if info.pure is None:
+            info.pure = not trampoline.run(_declares_outside_block(info.node, 0))
+        return info.pure
+
+    @property
+    def node_count(self) -> int:
+        return sum(info.count for info in self.subtrees)
+
+    @property
+    def duplicate_count(self) -> int:
+        """Number of nodes that are copies of an earlier subtree root"""
+        return sum(info.count - 1 for info in self.subtrees)
+
+    def report(self, limit: int = 5) -> str:
+        nodes = self.node_count
+        duplicates = self.duplicate_count
+        percent = 100 * duplicates / nodes if nodes else 0.0
+        lines = [
+            f"{nodes} nodes, {len(self.subtrees)} distinct subtrees",
+            f"{duplicates} nodes ({percent:.1f}%) repeat an earlier subtree",
+        ]
+        shared = [info for info in self.subtrees if info.count > 1 and info.size > 1]
+        shared.sort(key=lambda info: (info.count - 1) * info.size, reverse=True)
+        for info in shared[:limit]:
+            lines.append(f"  {info.count} copies of {type(info.node).__name__} "
+                         f"with {info.size} nodes at {info.node.location}")
+        return '\n'.join(lines)
+
+
+def hash_cons(root: ast.Expression) -> HashConsing:
+    return HashConsing(root)
+
+
+def _collect_references(node: ast.Expression, level: int, references: dict[Reference, None], depth: int) -> Step:
+    """Collects the references of a subtree `level` blocks deep in the subtree being checked."""
+    if depth > trampoline.RECURSION_BUDGET:
+        return (yield _collect_references(node, level, references, 0))
+    depth += 1
+
+    def add(name: str, address: tuple[int, int] | None) -> None:
+        if address is None:
+            references[name] = None
+        elif address[0] >= level:
+            references[(address[0] - level, address[1])] = None
+
+    match node:
+        case ast.Identifier():
+            add(node.name, node.address)
+        case ast.BinaryOp():
+            if node.op not in ('=', '==', '!='):
+                add(node.op, None)
+            yield from _collect_references(node.left, level, references, depth)
+            yield from _collect_references(node.right, level, references, depth)
+        case ast.UnaryOp():
+            add(f'unary_{node.op}', None)
+            yield from _collect_references(node.expr, level, references, depth)
+        case ast.IfExpression():
+            yield from _collect_references(node.cond, level, references, depth)
+            yield from _collect_references(node.then_clause, level, references, depth)
+            if node.else_clause is not None:
+                yield from _collect_references(node.else_clause, level, references, depth)
+        case ast.WhileExpression():
+            # The type checker does not look into the body
+            yield from _collect_references(node.cond, level, references, depth)
+        case ast.FunctionCall():
+            add(node.name, node.address)
+            for argument in node.arguments:
+                yield from _collect_references(argument, level, references, depth)
+        case ast.Block():
+            for argument in node.arguments:
+                yield from _collect_references(argument, level + 1, references, depth)
+        case ast.VarDeclaration():
+            if node.slot is None:
+                add(node.name, None)
+            yield from _collect_references(node.value, level, references, depth)
+
+
+def _declares_outside_block(node: ast.Expression, depth: int) -> Step:
+    if depth > trampoline.RECURSION_BUDGET:
+        return (yield _declares_outside_block(node, 0))
+    depth += 1
+
+    match node:
+        case ast.VarDeclaration():
+            return True
+        case ast.BinaryOp():
+            children = [node.left, node.right]
+        case ast.UnaryOp():
+            children = [node.expr]
+        case ast.IfExpression():
+            children = [node.cond, node.then_clause]
+            if node.else_clause is not None:
+                children.append(node.else_clause)
+        case ast.WhileExpression():
+            children = [node.cond]
+        case ast.FunctionCall():
+            children = node.arguments
+        case _:
+            return False
+    for child in children:
+        if (yield from _declares_outside_block(child, depth)):
+            return True
+    return False
+
+
+@dataclass
+class TypeMemo:
+    """Remembers the types of typechecked subtrees by canonical id and
+    the types of the names they look up, for `typecheck`."""
+    consing: HashConsing
+    results: dict[tuple, ast.Expression] = field(default_factory=dict)
+    hits: int = 0
+    misses: int = 0
+
+    def key(self, node: ast.Expression, symtab: SymTab) -> tuple | None:
+        """The memo key for typechecking a node, or None if it is not worth memoizing."""
+        canonical_id = self.consing.canonical_id(node)
+        if canonical_id is None:
+            return None
+        info = self.consing.subtrees[canonical_id]
+        if info.count < 2 or info.size < 2 or not self.consing.pure(canonical_id):
+            return None
+        return (canonical_id, tuple(
+            symtab.get(reference) if isinstance(reference, str) else symtab.get_slot(reference)
+            for reference in self.consing.references(canonical_id)
+        ))
+
+    def lookup(self, key: tuple, node: ast.Expression) -> Type | None:
+        """Copies the types of an earlier typechecked copy of the node, if any."""
+        typed = self.results.get(key)
+        if typed is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        trampoline.run(_copy_types(typed, node, 0))
+        return node.type
+
+    def store(self, key: tuple, node: ast.Expression) -> None:
+        self.results[key] = node
+
+
+def _copy_types(source: ast.Expression, target: Any, depth: int) -> Step:
+    if depth > trampoline.RECURSION_BUDGET:
+        return (yield _copy_types(source, target, 0))
+    depth += 1
+
+    target.type = source.type
+    match source:
+        case ast.BinaryOp():
+            yield from _copy_types(source.left, target.left, depth)
+            yield from _copy_types(source.right, target.right, depth)
+        case ast.UnaryOp():
+            yield from _copy_types(source.expr, target.expr, depth)
+        case ast.IfExpression():
+            yield from _copy_types(source.cond, target.cond, depth)
+            yield from _copy_types(source.then_clause, target.then_clause, depth)
+            if source.else_clause is not None:
+                yield from _copy_types(source.else_clause, target.else_clause, depth)
+        case ast.WhileExpression():
+            yield from _copy_types(source.cond, target.cond, depth)
+        case ast.FunctionCall() | ast.Block():
+            for source_argument, target_argument in zip(source.arguments, target.arguments):
+                yield from _copy_types(source_argument, target_argument, depth)
+        case ast.VarDeclaration():
+            yield from _copy_types(source.value, target.value, depth)
@@ -1,94 +1,154 @@
 
-from typing import Any, Callable
-from compiler import ast
+from typing import Any, Callable, Protocol
+from compiler import ast, trampoline
+from compiler.arena import Arena
 from compiler.symtab import SymTab, UNDEFINED
+from compiler.trampoline import Step
+from compiler.ast import NodeKind
+from compiler.tree import N, Tree, nodes
 
 
 Value = int | bool | None | Callable
 
-def interpret(node: ast.Expression, symtab: SymTab) -> Value:
-    match node:
-        case ast.Literal():
-            return node.value
+# Wraps the step that runs a node, for example to measure it
+InterpretHook = Callable[[Any, Step], Step]
 
-        case ast.BinaryOp():
-            if node.op == "=":
-                if not isinstance(node.left, ast.Identifier):
+
+class _Visit(Protocol):
+    def __call__(self, tree: Tree[Any], node: Any, symtab: SymTab, depth: int, visit: '_Visit', /) -> Step: ...
+
+
+def interpret(node: ast.Expression, symtab: SymTab, hook: InterpretHook | None = None) -> Value:
+    """Runs the program. Parts nested deeper than the recursion
+    budget are run with an explicit stack.
+
+    With a hook, the step of every node is run through the hook."""
+    return interpret_tree(nodes, node, symtab, hook)
+
+
+def interpret_arena(arena: Arena, node: int, symtab: SymTab, hook: InterpretHook | None = None) -> Value:
+    """Like `interpret`, but walks an arena AST by node index."""
+    return interpret_tree(arena, node, symtab, hook)
+
+
+def interpret_tree(tree: Tree[N], node: N, symtab: SymTab, hook: InterpretHook | None = None) -> Value:
+    if hook is None:
+        return trampoline.run(_interpret(tree, node, symtab, 0, _interpret))
+
+    def visit(tree: Tree[Any], node: Any, symtab: SymTab, depth: int, visit: _Visit) -> Step:
+        return hook(node, _interpret(tree, node, symtab, depth, visit))
+
+    return trampoline.run(visit(tree, node, symtab, 0, visit))
+
+
+def _interpret(tree: Tree[N], node: N, symtab: SymTab, depth: int, visit: _Visit) -> Step:
+    if depth > trampoline.RECURSION_BUDGET:
+        return (yield _interpret(tree, node, symtab, 0, visit))
+    depth += 1
+
+    match tree.kind(node):
+        case NodeKind.LITERAL:
+            return tree.literal_value(node)
+
+        case NodeKind.BINARY_OP:
+            op = tree.op(node)
+            left = tree.left(node)
+            if op == "=":
+                if tree.kind(left) != NodeKind.IDENTIFIER:
                     raise Exception('Left of assignment must be an identifier')
-                name = node.left.name
-                value = interpret(node.right, symtab)
+                value = yield from visit(tree, tree.right(node), symtab, depth, visit)
+                address = tree.address(left)
+                if address is not None:
+                    symtab.set_slot(address, value)
+                    return value
+                name = tree.name(left)
                 scope = symtab.find_scope(name)
                 if scope is UNDEFINED:
                     raise Exception(f'Variable "{name}" is not set')
                 scope.set(name, value)
                 return value
 
-            a: Any = interpret(node.left, symtab)
-            if node.op == "and":
+            a: Any = yield from visit(tree, left, symtab, depth, visit)
+            if op == "and":
                 if not a:
                     return False
 
-            elif node.op == "or":
+            elif op == "or":
                 if a:
                     return True
-            
-            b: Any = interpret(node.right, symtab)
-            binaryop = symtab.get(node.op)
+
+            b: Any = yield from visit(tree, tree.right(node), symtab, depth, visit)
+            binaryop = symtab.get(op)
             return binaryop(a, b)
 
-        case ast.VarDeclaration():
-            if symtab.get_local(node.name) is not UNDEFINED:
-                raise Exception(f'Value for "{node.name}" already exists')
-            value = interpret(node.value, symtab)
-            symtab.set(node.name, value)
+        case NodeKind.VAR_DECLARATION:
+            name = tree.name(node)
+            slot = tree.slot(node)
+            if slot is not None:
+                declared = symtab.slots[slot]
+            else:
+                declared = symtab.get_local(name)
+            if declared is not UNDEFINED:
+                raise Exception(f'Value for "{name}" already exists')
+            value = yield from visit(tree, tree.value(node), symtab, depth, visit)
+            if slot is not None:
+                symtab.slots[slot] = value
+            else:
+                symtab.set(name, value)
             return None
 
-        case ast.Identifier():
-            value = symtab.get(node.name)
+        case NodeKind.IDENTIFIER:
+            address = tree.address(node)
+            if address is not None:
+                value = symtab.get_slot(address)
+            else:
+                value = symtab.get(tree.name(node))
             if value is UNDEFINED:
-                raise Exception(f'Variable "{node.name}" is not set')
+                raise Exception(f'Variable "{tree.name(node)}" is not set')
             return value
 
-        case ast.IfExpression():
-            if node.else_clause is not None:
-                if interpret(node.cond, symtab):
-                    return interpret(node.then_clause, symtab)
+        case NodeKind.IF_EXPRESSION:
+            else_clause = tree.else_clause(node)
+            if else_clause is not None:
+                if (yield from visit(tree, tree.cond(node), symtab, depth, visit)):
+                    return (yield from visit(tree, tree.then_clause(node), symtab, depth, visit))
                 else:
-                    return interpret(node.else_clause, symtab)
+                    return (yield from visit(tree, else_clause, symtab, depth, visit))
             else:
-                if interpret(node.cond, symtab):
-                    interpret(node.then_clause, symtab)
+                if (yield from visit(tree, tree.cond(node), symtab, depth, visit)):
+                    yield from visit(tree, tree.then_clause(node), symtab, depth, visit)
                 return None
 
-        case ast.WhileExpression():
+        case NodeKind.WHILE_EXPRESSION:
+            cond = tree.cond(node)
+            do_clause = tree.do_clause(node)
             while True:
-                cond_value = interpret(node.cond, symtab)
+                cond_value = yield from visit(tree, cond, symtab, depth, visit)
                 if not cond_value:
                     return None
-                interpret(node.do_clause, symtab)
+                yield from visit(tree, do_clause, symtab, depth, visit)
 
-        case ast.Block():
-            inner_scope = SymTab(parent=symtab)
+        case NodeKind.BLOCK:
+            inner_scope = SymTab.for_block(symtab, tree.frame_size(node))
             result = None
-            for argument in node.arguments:
-                result = interpret(argument, inner_scope)
+            for argument in tree.arguments(node):
+                result = yield from visit(tree, argument, inner_scope, depth, visit)
             return result
 
-        case ast.FunctionCall():
-            func = symtab.get(node.name)
+        case NodeKind.FUNCTION_CALL:
+            name = tree.name(node)
+            address = tree.address(node)
+            func = symtab.get(name) if address is None else symtab.get_slot(address)
             args = []
-            for argument in node.arguments:
-                args.append(interpret(argument, symtab))
-            if node.name in ['print_int', 'print_bool'] and len(args) != 1:
-                raise Exception(f'Wrong number of arguments in {node.name}')
-            if node.name == 'read_int' and len(args) != 0:
-                raise Exception(f'Wrong number of arguments in {node.name}')
+            for argument in tree.arguments(node):
+                args.append((yield from visit(tree, argument, symtab, depth, visit)))
+            if name in ['print_int', 'print_bool'] and len(args) != 1:
+                raise Exception(f'Wrong number of arguments in {name}')
+            if name == 'read_int' and len(args) != 0:
+                raise Exception(f'Wrong number of arguments in {name}')
             return func(*args)
 
-        case ast.UnaryOp():
-            value = interpret(node.expr, symtab)
-            unaryop = symtab.get(f'unary_{node.op}')
+        case NodeKind.UNARY_OP:
+            value = yield from visit(tree, tree.expr(node), symtab, depth, visit)
+            unaryop = symtab.get(f'unary_{tree.op(node)}')
             return unaryop(value)
-
-        case _:
-            raise Exception(f'Unsupported AST node: {node}')
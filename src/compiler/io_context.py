@@ -0,0 +1,65 @@
+import sys
+from typing import Iterable, Iterator, TextIO
+
+
+class IOContext:
+    """The input and output of an interpreted program.
+
+    Output is collected in a buffer that is written to the stream when
+    it holds `buffer_size` lines and when the context is flushed or
+    exited, instead of calling `print` for every value. In capture mode
+    the printed lines are kept in `outputs` and nothing is written.
+
+    Input comes from `inputs` if given. Otherwise all of the standard
+    input is read at the first `read_int`, one integer per line."""
+
+    def __init__(
+        self,
+        inputs: Iterable[int] | None = None,
+        capture: bool = False,
+        buffer_size: int = 4096,
+        stream: TextIO | None = None,
+    ) -> None:
+        self.inputs: Iterator[int | str] | None = iter(inputs) if inputs is not None else None
+        self.capture = capture
+        self.buffer_size = buffer_size
+        self.stream = stream
+        self.outputs: list[str] = []
+
+    def __enter__(self) -> 'IOContext':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.flush()
+
+    def read_int(self) -> int:
+        if self.inputs is None:
+            self.inputs = iter(sys.stdin.read().splitlines())
+        line = next(self.inputs, None)
+        if line is None:
+            raise EOFError('No more input')
+        return int(line)
+
+    def print_int(self, value: int) -> None:
+        self.write(str(value))
+
+    def print_bool(self, value: bool) -> None:
+        self.write('true' if value else 'false')
+
+    def write(self, line: str) -> None:
+        self.outputs.append(line)
+        if not self.capture and len(self.outputs) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered lines, unless they are captured."""
+        if self.capture or not self.outputs:
+            return
+        stream = self.stream or sys.stdout
+        stream.write('\n'.join(self.outputs) + '\n')
+        stream.flush()
+        self.outputs.clear()
+
+    def captured_output(self) -> str:
+        """The captured lines as the program would have printed them."""
+        return ''.join(f'{line}\n' for line in self.outputs)
@@ -12,6 +12,18 @@ class IRVar:
     def __str__(self) -> str:
         return self.name
 
+_field_names_by_class: dict[type, list[str]] = {}
+
+
+def _field_names(cls: type) -> list[str]:
+    """The names of the fields of an instruction class, except the location"""
+    names = _field_names_by_class.get(cls)
+    if names is None:
+        names = [field.name for field in dataclasses.fields(cls) if field.name != 'location']
+        _field_names_by_class[cls] = names
+    return names
+
+
 @dataclass(frozen=True)
 class Instruction():
     """Base class for IR instructions"""
@@ -26,9 +38,8 @@ class Instruction():
             else:
                 return str(v)
         args = ', '.join(
-            format_value(getattr(self, field.name))
-            for field in dataclasses.fields(self)
-            if field.name != 'location'
+            format_value(getattr(self, name))
+            for name in _field_names(type(self))
         )
         return f'{type(self).__name__}({args})'
 
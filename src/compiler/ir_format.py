@@ -0,0 +1,252 @@
+from array import array
+import re
+import struct
+import sys
+from typing import Callable
+from compiler import ir
+from compiler.ir import IRVar
+from compiler.tokenizer import SourceLocation
+
+# === Text format ===
+#
+# One instruction per line, written as `str(ins)`, optionally followed by
+# its location in a comment:
+#
+#     LoadIntConstant(3, x1)  # program.txt:0:8
+#     Call(+, [x1, x2], x3)  # program.txt:0:6
+#
+# The output of the `ir` command, without the comments, can be parsed too.
+# Instructions without a location get the IR file's name and line number.
+
+_instruction_re = re.compile(r'(\w+)\((.*)\)')
+_call_args_re = re.compile(r'(.+?), \[(.*)\], (.+)')
+_label_re = re.compile(r'Label\((.+)\)')
+
+
+def format_ir(instructions: list[ir.Instruction], locations: bool = True) -> str:
+    """The instructions in the text format, with their locations if `locations`."""
+    if not locations:
+        return ''.join(f'{ins}\n' for ins in instructions)
+    return ''.join(
+        f'{ins}  # {ins.location.file}:{ins.location.line}:{ins.location.column}\n'
+        for ins in instructions
+    )
+
+
+def parse_ir(text: str, file_name: str = 'ir') -> list[ir.Instruction]:
+    """Reads instructions written by `format_ir` or printed by the `ir` command."""
+    parsed: list[tuple[str, str, SourceLocation]] = []
+    for line_number, line in enumerate(text.splitlines()):
+        code, _, comment = line.partition('  # ')
+        code = code.strip()
+        if code == '' or code.startswith('#'):
+            continue
+        m = _instruction_re.fullmatch(code)
+        if m is None:
+            raise Exception(f'{file_name}:{line_number}: invalid IR instruction: {code}')
+        location = _parse_location(comment.strip()) if comment else SourceLocation(file_name, line_number, 0)
+        parsed.append((m[1], m[2], location))
+
+    labels: dict[str, ir.Label] = {}
+    for kind, args, location in parsed:
+        if kind == 'Label':
+            labels[args] = ir.Label(location, args)
+
+    def label(text: str, location: SourceLocation) -> ir.Label:
+        m = _label_re.fullmatch(text.strip())
+        if m is None:
+            raise Exception(f'{location.file}:{location.line}: invalid label: {text}')
+        return labels.get(m[1]) or ir.Label(location, m[1])
+
+    instructions: list[ir.Instruction] = []
+    for kind, args, location in parsed:
+        try:
+            instructions.append(_parse_instruction(kind, args, location, labels, label))
+        except (ValueError, IndexError):
+            raise Exception(f'{location.file}:{location.line}: invalid arguments for {kind}: {args}')
+    return instructions
+
+
+def _parse_location(text: str) -> SourceLocation:
+    file, line, column = text.rsplit(':', 2)
+    return SourceLocation(file, int(line), int(column))
+
+
+def _parse_instruction(kind: str, args: str, location: SourceLocation,
+                       labels: dict[str, ir.Label],
+                       label: Callable[[str, SourceLocation], ir.Label]) -> ir.Instruction:
+    if kind == 'Call':
+        m = _call_args_re.fullmatch(args)
+        if m is None:
+            raise ValueError()
+        call_args = [IRVar(arg) for arg in m[2].split(', ')] if m[2] else []
+        return ir.Call(location, IRVar(m[1]), call_args, IRVar(m[3]))
+    if kind == 'Label':
+        return labels[args]
+    if kind == 'Jump':
+        return ir.Jump(location, label(args, location))
+
+    parts = args.split(', ')
+    if kind == 'LoadIntConstant':
+        value, dest = parts
+        return ir.LoadIntConstant(location, int(value), IRVar(dest))
+    if kind == 'LoadBoolConstant':
+        value, dest = parts
+        if value not in ('True', 'False'):
+            raise ValueError()
+        return ir.LoadBoolConstant(location, value == 'True', IRVar(dest))
+    if kind == 'Copy':
+        source, dest = parts
+        return ir.Copy(location, IRVar(source), IRVar(dest))
+    if kind == 'CondJump':
+        cond, then_label, else_label = parts
+        return ir.CondJump(location, IRVar(cond), label(then_label, location), label(else_label, location))
+    raise Exception(f'{location.file}:{location.line}: unknown IR instruction: {kind}')
+
+
+# === Binary format ===
+#
+# A header, a table of strings (variable names, label names and file
+# names) separated by NUL characters, and the instructions as
+# little-endian 64-bit integers. Each instruction is its kind, its
+# location as (file, line, column) and its operands, with strings
+# given as indices into the table.
+
+FORMAT_MAGIC = b'CIRB'
+FORMAT_VERSION = 1
+
+_HEADER = '<4sHqq'
+
+_LOAD_INT = 0
+_LOAD_BIG_INT = 1  # An integer constant that does not fit in 64 bits, as a string
+_LOAD_BOOL = 2
+_COPY = 3
+_CALL = 4
+_LABEL = 5
+_JUMP = 6
+_COND_JUMP = 7
+
+
+def dump_ir(instructions: list[ir.Instruction]) -> bytes:
+    """Serializes the instructions in the binary format."""
+    strings: dict[str, int] = {}
+
+    def string(s: str) -> int:
+        index = strings.get(s)
+        if index is None:
+            if '\0' in s:
+                raise Exception(f'Invalid name: {s!r}')
+            index = strings[s] = len(strings)
+        return index
+
+    code = array('q')
+    for ins in instructions:
+        location = ins.location
+        header = (string(location.file), location.line, location.column)
+        match ins:
+            case ir.LoadIntConstant():
+                if -2**63 <= ins.value < 2**63:
+                    code.extend((_LOAD_INT, *header, ins.value, string(ins.dest.name)))
+                else:
+                    code.extend((_LOAD_BIG_INT, *header, string(str(ins.value)), string(ins.dest.name)))
+            case ir.LoadBoolConstant():
+                code.extend((_LOAD_BOOL, *header, int(ins.value), string(ins.dest.name)))
+            case ir.Copy():
+                code.extend((_COPY, *header, string(ins.source.name), string(ins.dest.name)))
+            case ir.Call():
+                code.extend((_CALL, *header, string(ins.fun.name), string(ins.dest.name), len(ins.args)))
+                code.extend(string(arg.name) for arg in ins.args)
+            case ir.Label():
+                code.extend((_LABEL, *header, string(ins.name)))
+            case ir.Jump():
+                code.extend((_JUMP, *header, string(ins.label.name)))
+            case ir.CondJump():
+                code.extend((_COND_JUMP, *header, string(ins.cond.name),
+                             string(ins.then_label.name), string(ins.else_label.name)))
+            case _:
+                raise Exception(f'Unknown instruction: {type(ins)}')
+
+    if sys.byteorder != 'little':
+        code.byteswap()
+    string_data = '\0'.join(strings).encode()
+    return struct.pack(_HEADER, FORMAT_MAGIC, FORMAT_VERSION, len(string_data), len(code)) \
+        + string_data + code.tobytes()
+
+
+def load_ir(data: bytes) -> list[ir.Instruction]:
+    """Reads instructions written by `dump_ir`."""
+    if len(data) < struct.calcsize(_HEADER):
+        raise Exception("Not an IR file")
+    magic, version, string_length, code_length = struct.unpack_from(_HEADER, data)
+    if magic != FORMAT_MAGIC:
+        raise Exception("Not an IR file")
+    if version != FORMAT_VERSION:
+        raise Exception(f"Unsupported IR format version {version}")
+    offset = struct.calcsize(_HEADER)
+    if len(data) != offset + string_length + 8 * code_length:
+        raise Exception("Truncated IR file")
+    strings = data[offset:offset + string_length].decode().split('\0')
+    code = array('q')
+    code.frombytes(data[offset + string_length:])
+    if sys.byteorder != 'little':
+        code.byteswap()
+    values = code.tolist()
+
+    variables = [IRVar(s) for s in strings]
+    # The Label instructions, which jumps refer to
+    labels: dict[int, ir.Label] = {}
+    decoded: list[tuple[int, SourceLocation, list[int]]] = []
+    pc = 0
+    try:
+        while pc < len(values):
+            kind = values[pc]
+            location = SourceLocation(strings[values[pc + 1]], values[pc + 2], values[pc + 3])
+            pc += 4
+            if kind == _CALL:
+                count = 3 + values[pc + 2]
+            elif kind in (_LABEL, _JUMP):
+                count = 1
+            elif kind == _COND_JUMP:
+                count = 3
+            elif _LOAD_INT <= kind <= _COPY:
+                count = 2
+            else:
+                raise Exception(f"Invalid IR instruction kind {kind}")
+            operands = values[pc:pc + count]
+            pc += count
+            if kind == _LABEL:
+                labels[operands[0]] = ir.Label(location, strings[operands[0]])
+            decoded.append((kind, location, operands))
+    except IndexError:
+        raise Exception("Invalid IR file")
+
+    def label(index: int, location: SourceLocation) -> ir.Label:
+        return labels.get(index) or ir.Label(location, strings[index])
+
+    try:
+        return [_decode(kind, location, operands, strings, variables, labels, label)
+                for kind, location, operands in decoded]
+    except (IndexError, ValueError):
+        raise Exception("Invalid IR file")
+
+
+def _decode(kind: int, location: SourceLocation, operands: list[int], strings: list[str],
+            variables: list[IRVar], labels: dict[int, ir.Label],
+            label: Callable[[int, SourceLocation], ir.Label]) -> ir.Instruction:
+    if kind == _LOAD_INT:
+        return ir.LoadIntConstant(location, operands[0], variables[operands[1]])
+    if kind == _LOAD_BIG_INT:
+        return ir.LoadIntConstant(location, int(strings[operands[0]]), variables[operands[1]])
+    if kind == _LOAD_BOOL:
+        return ir.LoadBoolConstant(location, bool(operands[0]), variables[operands[1]])
+    if kind == _COPY:
+        return ir.Copy(location, variables[operands[0]], variables[operands[1]])
+    if kind == _CALL:
+        args = [variables[arg] for arg in operands[3:]]
+        return ir.Call(location, variables[operands[0]], args, variables[operands[1]])
+    if kind == _LABEL:
+        return labels[operands[0]]
+    if kind == _JUMP:
+        return ir.Jump(location, label(operands[0], location))
+    cond, then_label, else_label = operands
+    return ir.CondJump(location, variables[cond], label(then_label, location), label(else_label, location))
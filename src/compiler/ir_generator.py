@@ -1,13 +1,69 @@
 
-from compiler import ast, ir
+from typing import Any
+from compiler import ast, ir, trampoline, type_checker
+from compiler.cfg import CFGBuilder, ControlFlowGraph, InstructionSink
+from compiler.compact_ir import CompactIR, compact
+from compiler.arena import Arena
+from compiler.ast import NodeKind
 from compiler.tokenizer import SourceLocation
 from compiler.ir import IRVar
 from compiler.types import Bool, Int, Unit, FunType, Type
 from compiler.symtab import SymTab, UNDEFINED
+from compiler.trampoline import Step
+from compiler.tree import N, Tree, nodes
 
 
-def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> list[ir.Instruction]:
-    var_types: dict[IRVar, Type] = root_types.copy()
+def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression,
+                var_types: dict[IRVar, Type] | None = None) -> list[ir.Instruction]:
+    """Generates IR for a typechecked AST. Parts nested deeper than the
+    recursion budget are generated with an explicit stack.
+    If `var_types` is given, the type of every IR variable is added to it."""
+    if var_types is None:
+        var_types = {}
+    instructions: list[ir.Instruction] = []
+    _generate_ir(root_types, nodes, root_node, var_types, instructions)
+    return instructions
+
+
+def generate_cfg(root_types: dict[IRVar, Type], root_node: ast.Expression) -> ControlFlowGraph:
+    """Generates IR for a typechecked AST as a control flow graph. The
+    instructions go into basic blocks while they are generated, and
+    `ControlFlowGraph.linearize` gives the same list as `generate_ir`."""
+    builder = CFGBuilder()
+    _generate_ir(root_types, nodes, root_node, {}, builder)
+    return builder.finish()
+
+
+def generate_compact_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> CompactIR:
+    """Generates IR for a typechecked AST as compact IR."""
+    var_types: dict[IRVar, Type] = {}
+    return compact(generate_ir(root_types, root_node, var_types), var_types)
+
+
+def generate_ir_arena(root_types: dict[IRVar, Type], arena: Arena, root: int) -> list[ir.Instruction]:
+    """Like `generate_ir`, but walks an arena AST by node index."""
+    instructions: list[ir.Instruction] = []
+    _generate_ir(root_types, arena, root, {}, instructions)
+    return instructions
+
+
+def typecheck_and_generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> list[ir.Instruction]:
+    """Typechecks the AST and generates its IR in a single traversal.
+
+    The IR, the node types and the diagnostics are the same as with
+    `typecheck` followed by `generate_ir`. Parts nested deeper than the
+    recursion budget are handled with an explicit stack."""
+    instructions: list[ir.Instruction] = []
+    _generate_ir(root_types, nodes, root_node, {}, instructions, check=True)
+    return instructions
+
+
+def _generate_ir(root_types: dict[IRVar, Type], tree: Tree[N], root_node: N,
+                 var_types: dict[IRVar, Type], instructions: InstructionSink, check: bool = False) -> None:
+    """Generates IR for the tree. If `check`, it is also typechecked with
+    the rules of `type_checker`, and the types of names are those of their
+    IR variables."""
+    var_types.update(root_types)
     var_unit = IRVar('unit')
     var_types[var_unit] = Unit
 
@@ -27,38 +83,65 @@ def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> lis
         next_label_number += 1
         return label
 
-    instructions: list[ir.Instruction] = []
-
-    def visit(st: SymTab, node: ast.Expression) -> IRVar:
-        loc = node.location
-
-        match node:
-            case ast.Literal():
-                match node.value:
+    def type_of(var: Any) -> Any:
+        return var_types.get(var, UNDEFINED)
+
+    # `typecheck` reports its errors before `generate_ir` runs, but it does
+    # not look into while loop bodies. Those are generated without checking,
+    # and their first error is kept until the checking is done.
+    body_error: Exception | None = None
+
+    def visit(st: SymTab, node: N, check: bool, depth: int) -> Step:
+        nonlocal body_error
+        if depth > trampoline.RECURSION_BUDGET:
+            return (yield visit(st, node, check, 0))
+        depth += 1
+        loc = tree.location(node)
+
+        match tree.kind(node):
+            case NodeKind.LITERAL:
+                value = tree.literal_value(node)
+                if check:
+                    tree.set_type(node, type_checker.literal_type(value))
+                match value:
                     case bool():
                         var = new_var(Bool)
-                        instructions.append(ir.LoadBoolConstant(loc, node.value, var))
+                        instructions.append(ir.LoadBoolConstant(loc, value, var))
                     case int():
                         var = new_var(Int)
-                        instructions.append(ir.LoadIntConstant(loc, node.value, var))
+                        instructions.append(ir.LoadIntConstant(loc, value, var))
                     case None:
                         var = var_unit
                     case _:
-                        raise Exception(f"{loc}: unsupported literal: {type(node.value)}")
+                        raise Exception(f"{loc}: unsupported literal: {type(value)}")
                 return var
 
-            case ast.BinaryOp():
-                if node.op == "=":
-                    if not isinstance(node.left, ast.Identifier):
-                        raise Exception(f"{loc}: left of assignment must be an identifier")
-
-                    var_name = node.left.name
-                    scope = st.find_scope(var_name)
-                    if scope is UNDEFINED:
-                        raise Exception(f"{loc}: variable '{var_name}' is not set")
-
-                    var_left = scope.get_local(var_name)
-                    var_right = visit(scope, node.right)
+            case NodeKind.BINARY_OP:
+                op = tree.op(node)
+                if op == "=":
+                    left = tree.left(node)
+                    if check:
+                        var_left = yield from visit(st, left, check, depth)
+                        var_right = yield from visit(st, tree.right(node), check, depth)
+                        tree.set_type(node, type_checker.assignment_type(
+                            tree.type(left), tree.type(tree.right(node)), tree.kind(left) == NodeKind.IDENTIFIER))
+                    else:
+                        if tree.kind(left) != NodeKind.IDENTIFIER:
+                            raise Exception(f"{loc}: left of assignment must be an identifier")
+
+                        var_name = tree.name(left)
+                        address = tree.address(left)
+                        if address is not None:
+                            var_left = st.get_slot(address)
+                        else:
+                            scope = st.find_scope(var_name)
+                            if scope is UNDEFINED:
+                                raise Exception(f"{loc}: variable '{var_name}' is not set")
+                            var_left = scope.get_local(var_name)
+
+                        # The value sees the names of the assignment's scope, not those
+                        # of the scope that declares the variable
+                        var_right = yield from visit(st, tree.right(node), check, depth)
 
                     instructions.append(ir.Copy(
                         location=loc,
@@ -68,63 +151,51 @@ def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> lis
 
                     return var_left
 
-                elif node.op == 'and':
+                elif op == 'and' or op == 'or':
                     l_right = new_label(loc)
                     l_skip = new_label(loc)
                     l_end = new_label(loc)
 
-                    var_left = visit(st, node.left)
-                    instructions.append(ir.CondJump(loc, var_left, l_right, l_skip))
+                    var_left = yield from visit(st, tree.left(node), check, depth)
+                    if op == 'and':
+                        instructions.append(ir.CondJump(loc, var_left, l_right, l_skip))
+                    else:
+                        instructions.append(ir.CondJump(loc, var_left, l_skip, l_right))
 
                     instructions.append(l_right)
-                    var_right = visit(st, node.right)
+                    var_right = yield from visit(st, tree.right(node), check, depth)
+                    if check:
+                        tree.set_type(node, type_checker.binary_op_type(
+                            op, type_of(st.get(op)), tree.type(tree.left(node)), tree.type(tree.right(node))))
                     var_result = new_var(Bool)
                     instructions.append(ir.Copy(loc, var_right, var_result))
                     instructions.append(ir.Jump(loc, l_end))
 
                     instructions.append(l_skip)
-                    instructions.append(ir.LoadBoolConstant(loc, False, var_result))
+                    instructions.append(ir.LoadBoolConstant(loc, op == 'or', var_result))
                     instructions.append(ir.Jump(loc, l_end))
 
                     instructions.append(l_end)
                     return var_result
 
-                elif node.op == 'or':
-                    l_right = new_label(loc)
-                    l_skip = new_label(loc)
-                    l_end = new_label(loc)
+                var_left = yield from visit(st, tree.left(node), check, depth)
+                var_right = yield from visit(st, tree.right(node), check, depth)
+                if check:
+                    tree.set_type(node, type_checker.binary_op_type(
+                        op, type_of(st.get(op)), tree.type(tree.left(node)), tree.type(tree.right(node))))
 
-                    var_left = visit(st, node.left)
-                    instructions.append(ir.CondJump(loc, var_left, l_skip, l_right))
-
-                    instructions.append(l_right)
-                    var_right = visit(st, node.right)
-                    var_result = new_var(Bool)
-                    instructions.append(ir.Copy(loc, var_right, var_result))
-                    instructions.append(ir.Jump(loc, l_end))
-
-                    instructions.append(l_skip)
-                    instructions.append(ir.LoadBoolConstant(loc, True, var_result))
-                    instructions.append(ir.Jump(loc, l_end))
-
-                    instructions.append(l_end)
-                    return var_result
-
-                var_left = visit(st, node.left)
-                var_right = visit(st, node.right)
-
-                if node.op in ['==', '!=']:
+                if op in ['==', '!=']:
                     var_result = new_var(Bool)
                     instructions.append(ir.Call(
                         location=loc,
-                        fun=IRVar(node.op),
+                        fun=IRVar(op),
                         args=[var_left, var_right],
                         dest=var_result
                     ))
                     return var_result
 
-                var_op = st.get(node.op)
-                var_result = new_var(node.type)
+                var_op = st.get(op)
+                var_result = new_var(tree.type(node))
                 instructions.append(ir.Call(
                     location=loc,
                     fun=var_op,
@@ -133,10 +204,14 @@ def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> lis
                 ))
                 return var_result
 
-            case ast.UnaryOp():
-                var_expr = visit(st, node.expr)
-                var_op = st.get(f'unary_{node.op}')
-                var_result = new_var(node.type)
+            case NodeKind.UNARY_OP:
+                op = tree.op(node)
+                expr = tree.expr(node)
+                var_expr = yield from visit(st, expr, check, depth)
+                var_op = st.get(f'unary_{op}')
+                if check:
+                    tree.set_type(node, type_checker.unary_op_type(op, type_of(var_op), tree.type(expr)))
+                var_result = new_var(tree.type(node))
                 instructions.append(ir.Call(
                     location=loc,
                     fun=var_op,
@@ -145,16 +220,21 @@ def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> lis
                 ))
                 return var_result
 
-            case ast.IfExpression():
-                if node.else_clause is None:
+            case NodeKind.IF_EXPRESSION:
+                else_clause = tree.else_clause(node)
+                if else_clause is None:
                     l_then = new_label(loc)
                     l_end = new_label(loc)
 
-                    var_cond = visit(st, node.cond)
+                    var_cond = yield from visit(st, tree.cond(node), check, depth)
+                    if check:
+                        type_checker.check_condition('if', tree.type(tree.cond(node)))
                     instructions.append(ir.CondJump(loc, var_cond, l_then, l_end))
 
                     instructions.append(l_then)
-                    visit(st, node.then_clause)
+                    yield from visit(st, tree.then_clause(node), check, depth)
+                    if check:
+                        tree.set_type(node, Unit)
 
                     instructions.append(l_end)
                     return var_unit
@@ -163,62 +243,107 @@ def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> lis
                     l_else = new_label(loc)
                     l_end = new_label(loc)
 
-                    var_cond = visit(st, node.cond)
+                    var_cond = yield from visit(st, tree.cond(node), check, depth)
+                    if check:
+                        type_checker.check_condition('if', tree.type(tree.cond(node)))
                     instructions.append(ir.CondJump(loc, var_cond, l_then, l_else))
 
                     instructions.append(l_then)
-                    var_result = visit(st, node.then_clause)
+                    var_result = yield from visit(st, tree.then_clause(node), check, depth)
                     instructions.append(ir.Jump(loc, l_end))
 
                     instructions.append(l_else)
-                    var_else_result = visit(st, node.else_clause)
+                    var_else_result = yield from visit(st, else_clause, check, depth)
+                    if check:
+                        tree.set_type(node, type_checker.if_type(
+                            tree.type(tree.then_clause(node)), tree.type(else_clause)))
                     instructions.append(ir.Copy(loc, var_else_result, var_result))
 
                     instructions.append(l_end)
                     return var_result
 
-            case ast.WhileExpression():
+            case NodeKind.WHILE_EXPRESSION:
                 l_start = new_label(loc)
                 l_body = new_label(loc)
                 l_end = new_label(loc)
 
                 instructions.append(l_start)
-                var_cond = visit(st, node.cond)
+                var_cond = yield from visit(st, tree.cond(node), check, depth)
+                if check:
+                    type_checker.check_condition('while', tree.type(tree.cond(node)))
+                    tree.set_type(node, Unit)
                 instructions.append(ir.CondJump(loc, var_cond, l_body, l_end))
 
                 instructions.append(l_body)
-                visit(st, node.do_clause)
+                if check:
+                    try:
+                        yield from visit(st, tree.do_clause(node), False, depth)
+                    except Exception as e:
+                        if body_error is None:
+                            body_error = e
+                else:
+                    yield from visit(st, tree.do_clause(node), check, depth)
                 instructions.append(ir.Jump(loc, l_start))
 
                 instructions.append(l_end)
                 return var_unit
 
-            case ast.VarDeclaration():
-                var = visit(st, node.value)
-                var_result = new_var(node.value.type)
-                st.set(node.name, var_result)
+            case NodeKind.VAR_DECLARATION:
+                name = tree.name(node)
+                slot = tree.slot(node)
+                if check:
+                    type_checker.check_not_declared(name, st.get_local(name) if slot is None else st.slots[slot])
+                value_node = tree.value(node)
+                var = yield from visit(st, value_node, check, depth)
+                if check:
+                    type_checker.check_declared_type(name, tree.declared_type(node), tree.type(value_node))
+                    tree.set_type(node, Unit)
+                var_result = new_var(tree.type(value_node))
+                if slot is not None:
+                    st.slots[slot] = var_result
+                else:
+                    st.set(name, var_result)
                 instructions.append(ir.Copy(loc, var, var_result))
                 return var_unit
 
-            case ast.Identifier():
-                var = st.get(node.name)
+            case NodeKind.IDENTIFIER:
+                address = tree.address(node)
+                if address is not None:
+                    var = st.get_slot(address)
+                else:
+                    var = st.get(tree.name(node))
+                if check:
+                    tree.set_type(node, type_checker.identifier_type(tree.name(node), type_of(var)))
                 if var is UNDEFINED:
-                    raise Exception(f"{loc}: variable '{node.name}' is not set")
+                    raise Exception(f"{loc}: variable '{tree.name(node)}' is not set")
                 return var
 
-            case ast.Block():
-                inner_scope = SymTab(parent=st)
+            case NodeKind.BLOCK:
+                inner_scope = SymTab.for_block(st, tree.frame_size(node))
                 result = var_unit
-                for expr in node.arguments:
-                    result = visit(inner_scope, expr)
+                arguments = tree.arguments(node)
+                for expr in arguments:
+                    result = yield from visit(inner_scope, expr, check, depth)
+                if check:
+                    tree.set_type(node, tree.type(arguments[-1]) if arguments else Unit)
                 return result
 
-            case ast.FunctionCall():
-                func = st.get(node.name)
+            case NodeKind.FUNCTION_CALL:
+                name = tree.name(node)
+                address = tree.address(node)
+                func = st.get(name) if address is None else st.get_slot(address)
+                if check:
+                    expected_args = type_checker.parameter_types(name, type_of(func))
                 if func is UNDEFINED:
-                    raise Exception(f"{loc}: function '{node.name}' is not defined")
+                    raise Exception(f"{loc}: function '{name}' is not defined")
 
-                var_args = [visit(st, arg) for arg in node.arguments]
+                var_args = []
+                arguments = tree.arguments(node)
+                for arg in arguments:
+                    var_args.append((yield from visit(st, arg, check, depth)))
+                if check:
+                    tree.set_type(node, type_checker.call_type(
+                        name, type_of(func), expected_args, [tree.type(arg) for arg in arguments]))
 
                 fun_type = var_types[func]
                 if isinstance(fun_type, FunType):
@@ -236,27 +361,28 @@ def generate_ir(root_types: dict[IRVar, Type], root_node: ast.Expression) -> lis
                 return var_result
 
             case _:
-                raise Exception(f"Unsupported AST node: {node}")
+                raise Exception(f"Unsupported AST node: {tree.to_ast(node)}")
 
     root_symtab = SymTab()
     for v in root_types.keys():
         root_symtab.set(v.name, v)
 
-    var_result = visit(root_symtab, root_node)
+    var_result = trampoline.run(visit(root_symtab, root_node, check, 0))
+    if body_error is not None:
+        raise body_error
 
+    root_location = tree.location(root_node)
     if var_types[var_result] == Int:
         instructions.append(ir.Call(
-            root_node.location,
+            root_location,
             IRVar('print_int'),
             [var_result],
             new_var(Unit)
         ))
     elif var_types[var_result] == Bool:
         instructions.append(ir.Call(
-            root_node.location,
+            root_location,
             IRVar('print_bool'),
             [var_result],
             new_var(Unit)
         ))
-
-    return instructions
@@ -0,0 +1,234 @@
+from typing import Any, Callable
+from compiler import ir
+from compiler.io_context import IOContext
+from compiler.ir import IRVar
+
+_MIN_INT = -2**63
+_MAX_INT = 2**63 - 1
+
+
+def _wrap(value: int) -> int:
+    """Wraps an integer to 64 bits like the machine does."""
+    return ((value - _MIN_INT) & 0xFFFFFFFFFFFFFFFF) + _MIN_INT
+
+
+# Runs a prepared instruction on the variable slots and returns the
+# index of the instruction to run next.
+Handler = Callable[[list[Any]], int]
+
+
+class PreparedIR:
+    """IR instructions prepared to run: labels are resolved to the indices
+    of the instructions after them, every IR variable has a slot, and the
+    built-in functions read and print through `io`."""
+
+    def __init__(self, instructions: list[ir.Instruction], io: IOContext) -> None:
+        self.functions = _operators | _io_functions(io)
+        self.slots: dict[IRVar, int] = {}
+        self.labels: dict[str, int] = {}
+        index = 0
+        for ins in instructions:
+            if isinstance(ins, ir.Label):
+                self.labels[ins.name] = index
+            else:
+                index += 1
+        self.handlers: list[Handler] = []
+        for ins in instructions:
+            if not isinstance(ins, ir.Label):
+                prepare = _preparers.get(type(ins))
+                if prepare is None:
+                    raise Exception(f'{ins.location}: unsupported IR instruction: {ins}')
+                self.handlers.append(prepare(self, ins, len(self.handlers) + 1))
+
+    def slot(self, var: IRVar) -> int:
+        slot = self.slots.get(var)
+        if slot is None:
+            slot = len(self.slots)
+            self.slots[var] = slot
+        return slot
+
+    def label(self, label: ir.Label) -> int:
+        index = self.labels.get(label.name)
+        if index is None:
+            raise Exception(f'{label.location}: unknown label {label.name}')
+        return index
+
+
+def interpret_ir(instructions: list[ir.Instruction], io: IOContext | None = None) -> None:
+    """Runs IR instructions like the compiled program runs them,
+    with integers that wrap at 64 bits. Without an I/O context the
+    program reads the standard input and its printed values are
+    buffered and written to the standard output."""
+    if io is None:
+        with IOContext() as io:
+            run_prepared(PreparedIR(instructions, io))
+    else:
+        run_prepared(PreparedIR(instructions, io))
+
+
+def run_prepared(program: PreparedIR) -> None:
+    handlers = program.handlers
+    slots: list[Any] = [None] * len(program.slots)
+    end = len(handlers)
+    pc = 0
+    while pc < end:
+        pc = handlers[pc](slots)
+
+
+# === Operators ===
+
+def _add(a: int, b: int) -> int:
+    value = a + b
+    return value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+
+
+def _subtract(a: int, b: int) -> int:
+    value = a - b
+    return value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+
+
+def _multiply(a: int, b: int) -> int:
+    value = a * b
+    return value if _MIN_INT <= value <= _MAX_INT else _wrap(value)
+
+
+def _quotient(a: int, b: int) -> int:
+    """Division rounded towards zero like `idivq`."""
+    if b == 0:
+        raise Exception("Can't divide by zero")
+    quotient = abs(a) // abs(b)
+    return -quotient if (a < 0) != (b < 0) else quotient
+
+
+def _divide(a: int, b: int) -> int:
+    return _wrap(_quotient(a, b))
+
+
+def _remainder(a: int, b: int) -> int:
+    # Has the sign of `a` like the remainder of `idivq`
+    return a - b * _quotient(a, b)
+
+
+_operators: dict[str, Callable[..., Any]] = {
+    '+': _add,
+    '-': _subtract,
+    '*': _multiply,
+    '/': _divide,
+    '%': _remainder,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'unary_-': lambda a: _wrap(-a),
+    'unary_not': lambda a: not a,
+}
+
+
+def _io_functions(io: IOContext) -> dict[str, Callable[..., Any]]:
+    def read_int() -> int:
+        return _wrap(io.read_int())
+
+    return {'print_int': io.print_int, 'print_bool': io.print_bool, 'read_int': read_int}
+
+
+# === Preparing instructions ===
+
+_Preparer = Callable[[PreparedIR, Any, int], Handler]
+
+_preparers: dict[type[ir.Instruction], _Preparer] = {}
+
+
+def _preparer(instruction_type: type[ir.Instruction]) -> Callable[[_Preparer], _Preparer]:
+    """Function decorator that registers the function as the preparer
+    of an instruction type."""
+    def wrapper(f: _Preparer) -> _Preparer:
+        assert instruction_type not in _preparers
+        _preparers[instruction_type] = f
+        return f
+    return wrapper
+
+
+@_preparer(ir.LoadIntConstant)
+def _prepare_load_int(program: PreparedIR, ins: ir.LoadIntConstant, next_pc: int) -> Handler:
+    dest = program.slot(ins.dest)
+    value = _wrap(ins.value)
+
+    def handler(slots: list[Any]) -> int:
+        slots[dest] = value
+        return next_pc
+    return handler
+
+
+@_preparer(ir.LoadBoolConstant)
+def _prepare_load_bool(program: PreparedIR, ins: ir.LoadBoolConstant, next_pc: int) -> Handler:
+    dest = program.slot(ins.dest)
+    value = bool(ins.value)
+
+    def handler(slots: list[Any]) -> int:
+        slots[dest] = value
+        return next_pc
+    return handler
+
+
+@_preparer(ir.Copy)
+def _prepare_copy(program: PreparedIR, ins: ir.Copy, next_pc: int) -> Handler:
+    source = program.slot(ins.source)
+    dest = program.slot(ins.dest)
+
+    def handler(slots: list[Any]) -> int:
+        slots[dest] = slots[source]
+        return next_pc
+    return handler
+
+
+@_preparer(ir.Jump)
+def _prepare_jump(program: PreparedIR, ins: ir.Jump, next_pc: int) -> Handler:
+    target = program.label(ins.label)
+
+    def handler(slots: list[Any]) -> int:
+        return target
+    return handler
+
+
+@_preparer(ir.CondJump)
+def _prepare_cond_jump(program: PreparedIR, ins: ir.CondJump, next_pc: int) -> Handler:
+    cond = program.slot(ins.cond)
+    then_target = program.label(ins.then_label)
+    else_target = program.label(ins.else_label)
+
+    def handler(slots: list[Any]) -> int:
+        return then_target if slots[cond] else else_target
+    return handler
+
+
+@_preparer(ir.Call)
+def _prepare_call(program: PreparedIR, ins: ir.Call, next_pc: int) -> Handler:
+    operator = program.functions.get(ins.fun.name)
+    if operator is None:
+        raise Exception(f'{ins.location}: unknown function {ins.fun.name}')
+    args = [program.slot(arg) for arg in ins.args]
+    dest = program.slot(ins.dest)
+
+    # The common argument counts are unpacked without a loop
+    if len(args) == 2:
+        left, right = args
+
+        def binary_handler(slots: list[Any]) -> int:
+            slots[dest] = operator(slots[left], slots[right])
+            return next_pc
+        return binary_handler
+
+    if len(args) == 1:
+        arg = args[0]
+
+        def unary_handler(slots: list[Any]) -> int:
+            slots[dest] = operator(slots[arg])
+            return next_pc
+        return unary_handler
+
+    def handler(slots: list[Any]) -> int:
+        slots[dest] = operator(*[slots[arg] for arg in args])
+        return next_pc
+    return handler
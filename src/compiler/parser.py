@@ -1,236 +1,407 @@
-from compiler import ast
-from compiler.tokenizer import Token
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Iterable, Iterator, Protocol
+from compiler import ast, trampoline
+from compiler.tokenizer import SourceLocation, Token, TokenBuffer, TokenKind, token_kind
+from compiler.trampoline import Step
 
 
-def parse(tokens: list[Token]) -> ast.Expression:
-    allow_var = True
-    pos = 0
+class TokenCursor(Protocol):
+    """The parser's view of the token stream: the kind and text of the
+    current token, and its location on demand. Past the end of the
+    input the cursor stays on an end token."""
+    kind: int
+    text: str
 
-    def peek() -> Token:
-        if len(tokens) == 0:
-            raise Exception("Input was empty")
-        if pos < len(tokens):
-            return tokens[pos]
+    def advance(self) -> None: ...
+
+    def location(self) -> SourceLocation: ...
+
+
+class BufferCursor:
+    """Reads a `TokenBuffer` through its columns without building `Token` objects."""
+
+    def __init__(self, buffer: TokenBuffer) -> None:
+        self._buffer = buffer
+        self._count = len(buffer)
+        self._pos = -1
+        self.advance()
+
+    def advance(self) -> None:
+        self._pos += 1
+        if self._pos < self._count:
+            self.kind = self._buffer.kinds[self._pos]
+            self.text = self._buffer.strings[self._buffer.text_ids[self._pos]]
         else:
-            return Token(loc=tokens[-1].loc, type='end', text='')
-
-    def consume(expected: str | None = None) -> Token:
-        token = peek()
-        if expected is not None and token.text != expected:
-            raise Exception(f'Expected "{expected}", got "{token.text}"')
-        nonlocal pos
-        pos += 1
-        return token
-
-    def parse_literal() -> ast.Literal:
-        token = peek()
-        if token.type == 'int_literal':
-            consume()
-            return ast.Literal(location=token.loc, value=int(token.text))
-        elif token.type == 'bool_literal':
-            if token.text == 'true':
-                consume()
-                return ast.Literal(location=token.loc, value=True)
-            else:
-                consume()
-                return ast.Literal(location=token.loc, value=False)
+            self.kind = TokenKind.END
+            self.text = ''
+
+    def location(self) -> SourceLocation:
+        if self._pos < self._count:
+            return self._buffer.location(self._pos)
+        return self._buffer.location(self._count - 1)
+
+
+class StreamCursor:
+    """Pulls tokens from an iterator one at a time.
+    Only the current token is kept, which is all the lookahead the parser needs."""
+
+    def __init__(self, tokens: Iterator[Token]) -> None:
+        self._tokens = tokens
+        self._token: Token | None = None
+        self.kind: int
+        self.text: str
+        self.advance()
+
+    def advance(self) -> None:
+        token = next(self._tokens, None)
+        if token is not None:
+            self._token = token
+            self.kind = token_kind(token)
+            self.text = token.text
         else:
-            raise Exception(f'{peek().loc}: excepted literal, found "{token.text}')
+            self.kind = TokenKind.END
+            self.text = ''
+
+    def location(self) -> SourceLocation:
+        if self._token is None:
+            raise Exception("Input was empty")
+        return self._token.loc
+
+
+def parse(tokens: list[Token] | TokenBuffer) -> ast.Expression:
+    """Parses a token list or a `TokenBuffer`.
+    A buffer is read through its columns, so no `Token` objects are built
+    and source locations are only resolved for tokens that start AST nodes."""
+    if isinstance(tokens, TokenBuffer):
+        buffer = tokens
+    else:
+        buffer = TokenBuffer.from_tokens(tokens)
+    if len(buffer) == 0:
+        raise Exception("Input was empty")
+    return program_expression(parse_cursor(BufferCursor(buffer)))
+
+
+def parse_stream(tokens: Iterable[Token]) -> ast.Expression:
+    """Parses tokens as they are produced, e.g. by `iter_tokens`,
+    so scanning and parsing overlap and the full token list is never built."""
+    return program_expression(parse_cursor(StreamCursor(iter(tokens))))
+
+
+# Programs with fewer top-level statements than this are parsed sequentially
+PARALLEL_PARSE_THRESHOLD = 10000
+
+
+def parse_parallel(
+    tokens: list[Token] | TokenBuffer,
+    workers: int | None = None,
+    threshold: int = PARALLEL_PARSE_THRESHOLD,
+) -> ast.Expression:
+    """Like `parse`, but parses the top-level statements in a process pool.
+
+    A top-level ';' always ends a statement, so one scan over the token
+    kinds finds the ';' tokens outside all parentheses and braces. The
+    tokens are split at some of them, each slice is parsed as a sequence
+    of statements, and the results are joined into one block. Any syntax
+    error makes the whole input be parsed again sequentially, so errors
+    are reported exactly like `parse` does."""
+    if isinstance(tokens, TokenBuffer):
+        tokens = tokens.tokens()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(tokens) == 0 or workers <= 1:
+        return parse(tokens)
+
+    kinds = [token_kind(token) for token in tokens]
+    separators: list[int] = []
+    depth = 0
+    for index, kind in enumerate(kinds):
+        if kind == TokenKind.LPAREN or kind == TokenKind.LBRACE:
+            depth += 1
+        elif kind == TokenKind.RPAREN or kind == TokenKind.RBRACE:
+            depth -= 1
+            if depth < 0:
+                break
+        elif kind == TokenKind.SEMICOLON and depth == 0:
+            separators.append(index)
+    if depth != 0 or len(separators) < threshold:
+        return parse(tokens)
+
+    # Split only at a ';' that follows a statement and is not the last token,
+    # so every slice but the last ends with a statement, and the last slice
+    # keeps a trailing ';' for the usual Literal(None) handling.
+    slices: list[list[Token]] = []
+    slice_size = len(tokens) // (workers * 4) + 1
+    start = 0
+    for index in separators:
+        if (index - start >= slice_size and 0 < index < len(tokens) - 1
+                and kinds[index - 1] != TokenKind.SEMICOLON):
+            slices.append(tokens[start:index])
+            start = index + 1
+    slices.append(tokens[start:])
+
+    arguments: list[ast.Expression] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for statements in executor.map(_parse_statements, slices):
+            if statements is None:
+                return parse(tokens)
+            arguments.extend(statements)
+    return program_expression(ast.Block(location=tokens[0].loc, arguments=arguments))
+
+
+def _parse_statements(tokens: list[Token]) -> list[ast.Expression] | None:
+    """Parses a slice of top-level statements in a worker process."""
+    try:
+        if len(tokens) == 0:
+            return None
+        return parse_cursor(BufferCursor(TokenBuffer.from_tokens(tokens))).arguments
+    except Exception:
+        return None
+
+
+def program_expression(block: ast.Block) -> ast.Expression:
+    """A program with a single top-level expression is that expression,
+    otherwise it is the implicit top-level block."""
+    if len(block.arguments) == 1:
+        return block.arguments[0]
+    return block
+
+
+# Nesting depth at which the parser switches from recursion to an explicit stack
+PARSE_RECURSION_BUDGET = 40
+
+
+# Binding power of each binary operator, indexed by token kind.
+# Zero means the token is not a binary operator.
+binding_powers = [0] * len(TokenKind)
+for _power, _kinds in enumerate([
+    [TokenKind.OR],
+    [TokenKind.AND],
+    [TokenKind.EQ, TokenKind.NE],
+    [TokenKind.LT, TokenKind.LE, TokenKind.GT, TokenKind.GE],
+    [TokenKind.PLUS, TokenKind.MINUS],
+    [TokenKind.STAR, TokenKind.SLASH, TokenKind.PERCENT],
+], start=1):
+    for _kind in _kinds:
+        binding_powers[_kind] = _power
+
+
+def parse_cursor(cursor: TokenCursor) -> ast.Block:
+    """Operator-precedence (Pratt) parser over a token cursor.
+    Returns the implicit block that holds the top-level statements."""
+    allow_var = True
+    # Whether the most recently parsed expression ended with a block,
+    # which allows the next expression in a block to follow without ';'
+    ended_with_block = False
+    # Number of `parse_expression` steps nested with `yield from`; past the
+    # budget the next one is yielded to `trampoline.run`
+    depth = 0
+
+    def consume(expected_kind: int, expected: str) -> None:
+        if cursor.kind != expected_kind:
+            raise Exception(f'Expected "{expected}", got "{cursor.text}"')
+        cursor.advance()
 
     def parse_identifier() -> ast.Identifier:
-        token = peek()
-        if token.type == 'identifier':
-            consume()
-            return ast.Identifier(location=token.loc, name=token.text)
+        location = cursor.location()
+        if TokenKind.IDENTIFIER <= cursor.kind <= TokenKind.NOT:
+            name = cursor.text
+            cursor.advance()
+            return ast.Identifier(location=location, name=name)
         else:
-            raise Exception(f'{peek().loc}: excepted identifier, found "{token.text}') 
+            raise Exception(f'{location}: excepted identifier, found "{cursor.text}')
 
-    def parse_expression() -> ast.Expression:
-        return parse_assignment()
+    def build_assignments(operands: list[ast.Expression], locations: list[SourceLocation]) -> ast.Expression:
+        """Builds a chain of assignments, which is right-associative."""
+        expr = operands.pop()
+        while operands:
+            expr = ast.BinaryOp(location=locations.pop(), left=operands.pop(), op='=', right=expr)
+        return expr
 
-    def parse_assignment() -> ast.Expression:
-        left: ast.Expression = parse_left_associative_operator(0)
-        while peek().text == '=':
-            op_token = consume()
-            right = parse_assignment()
-            return ast.BinaryOp(location=op_token.loc, left=left, op=op_token.text, right=right)
-        return left
+    def parse_unary_operators() -> list[tuple[SourceLocation, str]]:
+        """Reads a run of prefix operators with a loop rather than recursively."""
+        operators = []
+        while cursor.kind == TokenKind.MINUS or cursor.kind == TokenKind.NOT:
+            operators.append((cursor.location(), cursor.text))
+            cursor.advance()
+        return operators
+
+    def build_unary_ops(operators: list[tuple[SourceLocation, str]], expr: ast.Expression) -> ast.Expression:
+        for op_location, op in reversed(operators):
+            expr = ast.UnaryOp(location=op_location, op=op, expr=expr)
+        return expr
 
-    left_associative_operators = [
-        ['or'],
-        ['and'],
-        ['==', '!='],
-        ['<', '<=', '>', '>='],
-        ['+', '-'],
-        ['*', '/', '%'],
-    ]
-
-    def parse_left_associative_operator(precedence_level: int) -> ast.Expression:
-        if precedence_level >= len(left_associative_operators) - 1:
-            left = parse_unary()
-        else:
-            left = parse_left_associative_operator(precedence_level + 1)
-        if precedence_level < len(left_associative_operators):
-            while peek().text in left_associative_operators[precedence_level]:
-                op_token = consume()
-                right = parse_left_associative_operator(precedence_level + 1)
-                left = ast.BinaryOp(location=op_token.loc, left=left, op=op_token.text, right=right)
+    def parse_expression() -> Step:
+        nonlocal depth
+        if depth >= PARSE_RECURSION_BUDGET:
+            outer_depth, depth = depth, 0
+            try:
+                return (yield parse_expression())
+            finally:
+                depth = outer_depth
+        depth += 1
+        left = yield from parse_binary(0)
+        if cursor.kind == TokenKind.ASSIGN:
+            operands = [left]
+            locations = []
+            while cursor.kind == TokenKind.ASSIGN:
+                locations.append(cursor.location())
+                cursor.advance()
+                operands.append((yield from parse_binary(0)))
+            left = build_assignments(operands, locations)
+        depth -= 1
         return left
 
-    def parse_unary() -> ast.Expression:
-        while peek().text in ['-', 'not']:
-            op_token = consume()
-            expr = parse_unary()
-            return ast.UnaryOp(location=op_token.loc, op=op_token.text, expr=expr)
-        return parse_factor()
-
-    def parse_factor() -> ast.Expression:
-        if peek().text == '(':
-            return parse_parenthesized_expression()
-        elif peek().text == '{':
-            return parse_block()
-        elif peek().text == 'if':
-            return parse_if_expression()
-        elif peek().text == 'while':
-            return parse_while_expression()
-        elif peek().text == 'var' and allow_var:
-            return parse_var_declaration()
-        elif peek().type == 'int_literal' or peek().type == 'bool_literal':
-            return parse_literal()
-        elif peek().type == 'identifier':
-            identifier = parse_identifier()
-            if peek().text == "(":
-                return parse_function_call(identifier)
+    def parse_binary(min_power: int) -> Step:
+        left = yield from parse_unary()
+        while True:
+            power = binding_powers[cursor.kind]
+            if power <= min_power:
+                return left
+            op_location = cursor.location()
+            op = cursor.text
+            cursor.advance()
+            right = yield from parse_binary(power)
+            left = ast.BinaryOp(location=op_location, left=left, op=op, right=right)
+
+    def parse_unary() -> Step:
+        if cursor.kind != TokenKind.MINUS and cursor.kind != TokenKind.NOT:
+            return (yield from parse_factor())
+        operators = parse_unary_operators()
+        return build_unary_ops(operators, (yield from parse_factor()))
+
+    def parse_factor() -> Step:
+        nonlocal ended_with_block
+        kind = cursor.kind
+        if kind == TokenKind.LPAREN:
+            return (yield from parse_parenthesized_expression())
+        elif kind == TokenKind.LBRACE:
+            return (yield from parse_block())
+        elif kind == TokenKind.IF:
+            return (yield from parse_if_expression())
+        elif kind == TokenKind.WHILE:
+            return (yield from parse_while_expression())
+        elif kind == TokenKind.VAR and allow_var:
+            return (yield from parse_var_declaration())
+        elif kind == TokenKind.INT_LITERAL:
+            literal = ast.Literal(location=cursor.location(), value=int(cursor.text))
+        elif kind == TokenKind.TRUE:
+            literal = ast.Literal(location=cursor.location(), value=True)
+        elif kind == TokenKind.FALSE:
+            literal = ast.Literal(location=cursor.location(), value=False)
+        elif TokenKind.IDENTIFIER <= kind <= TokenKind.NOT:
+            identifier = ast.Identifier(location=cursor.location(), name=cursor.text)
+            cursor.advance()
+            ended_with_block = False
+            if cursor.kind == TokenKind.LPAREN:
+                return (yield from parse_function_call(identifier))
             else:
                 return identifier
         else:
-            raise Exception(f'Unexpected "{peek().text}"')
+            raise Exception(f'Unexpected "{cursor.text}"')
+        cursor.advance()
+        ended_with_block = False
+        return literal
 
-    def parse_parenthesized_expression() -> ast.Expression:
-        consume('(')
+    def parse_parenthesized_expression() -> Step:
+        consume(TokenKind.LPAREN, '(')
         nonlocal allow_var
         allow_var = False
-        expr = parse_expression()
-        consume(')')
+        expr = yield from parse_expression()
+        consume(TokenKind.RPAREN, ')')
         allow_var = True
         return expr
 
-    def parse_block() -> ast.Expression:
-        token = consume('{')
+    def parse_block() -> Step:
+        nonlocal ended_with_block
+        location = cursor.location()
+        consume(TokenKind.LBRACE, '{')
+        block = yield from parse_sequence(location, TokenKind.RBRACE)
+        consume(TokenKind.RBRACE, '}')
+        ended_with_block = True
+        return block
+
+    def parse_sequence(location: SourceLocation, closing_kind: int) -> Step:
         arguments = []
         nonlocal allow_var
         allow_var = True
 
-        if peek().text != '}':
+        if cursor.kind != closing_kind:
             while True:
-                arguments.append(parse_expression())
+                arguments.append((yield from parse_expression()))
 
-                if peek().text == '}':
+                if cursor.kind == closing_kind:
                     break
 
-                elif peek().text == ';':
-                    semicolon_token = consume(';')
-                    if peek().text == '}':
-                        arguments.append(ast.Literal(location=semicolon_token.loc, value=None))
+                elif cursor.kind == TokenKind.SEMICOLON:
+                    semicolon_location = cursor.location()
+                    cursor.advance()
+                    if cursor.kind == closing_kind:
+                        arguments.append(ast.Literal(location=semicolon_location, value=None))
                         break
                     continue
 
-                else:
-                    was_block = ends_with_block(arguments[-1])
-                    if not was_block:
-                        raise Exception(f'Unexpected "{peek().text}"')
-
-        consume('}')
-        return ast.Block(location=token.loc, arguments=arguments)
-
-    def ends_with_block(expression: ast.Expression) -> bool:
-        if isinstance(expression, ast.Block):
-            return True
-
-        if isinstance(expression, ast.IfExpression):
-            if not expression.else_clause:
-                return ends_with_block(expression.then_clause)
-            return ends_with_block(expression.else_clause)
-
-        if isinstance(expression, ast.WhileExpression):
-            return ends_with_block(expression.do_clause)
-
-        if isinstance(expression, ast.VarDeclaration):
-            return ends_with_block(expression.value)
+                elif not ended_with_block:
+                    raise Exception(f'Unexpected "{cursor.text}"')
 
-        if isinstance(expression, ast.BinaryOp):
-            return ends_with_block(expression.right)
+        return ast.Block(location=location, arguments=arguments)
 
-        if isinstance(expression, ast.UnaryOp):
-            return ends_with_block(expression.expr)
-
-        return False
-
-    def parse_if_expression() -> ast.Expression:
+    def parse_if_expression() -> Step:
         nonlocal allow_var
         allow_var = False
-        token = consume('if')
-        cond = parse_expression()
-        consume('then')
-        then_clause = parse_expression()
-        if peek().text == 'else':
-            consume('else')
-            else_clause = parse_expression()
+        location = cursor.location()
+        consume(TokenKind.IF, 'if')
+        cond = yield from parse_expression()
+        consume(TokenKind.THEN, 'then')
+        then_clause = yield from parse_expression()
+        if cursor.kind == TokenKind.ELSE:
+            cursor.advance()
+            else_clause = yield from parse_expression()
         else:
             else_clause = None
         allow_var = True
-        return ast.IfExpression(token.loc, cond, then_clause, else_clause)
+        return ast.IfExpression(location, cond, then_clause, else_clause)
 
-    def parse_while_expression() -> ast.Expression:
+    def parse_while_expression() -> Step:
         nonlocal allow_var
         allow_var = False
-        token = consume('while')
-        cond = parse_expression()
-        consume('do')
-        do_clause = parse_expression()
+        location = cursor.location()
+        consume(TokenKind.WHILE, 'while')
+        cond = yield from parse_expression()
+        consume(TokenKind.DO, 'do')
+        do_clause = yield from parse_expression()
         allow_var = True
-        return ast.WhileExpression(token.loc, cond, do_clause)
+        return ast.WhileExpression(location, cond, do_clause)
 
-    def parse_var_declaration() -> ast.Expression:
-        token = consume('var')
+    def parse_var_declaration() -> Step:
+        location = cursor.location()
+        consume(TokenKind.VAR, 'var')
         identifier = parse_identifier()
         declaration = None
-        if peek().text == ':':
-            consume(':')
-            type = parse_identifier()
-            declaration = type.name
-        consume('=')
-        value = parse_expression()
-        return ast.VarDeclaration(token.loc, declaration, identifier.name, value)
-
-    def parse_function_call(identifier: ast.Identifier) -> ast.FunctionCall:
-        consume('(')
+        if cursor.kind == TokenKind.COLON:
+            cursor.advance()
+            declaration = parse_identifier().name
+        consume(TokenKind.ASSIGN, '=')
+        value = yield from parse_expression()
+        return ast.VarDeclaration(location, declaration, identifier.name, value)
+
+    def parse_function_call(identifier: ast.Identifier) -> Step:
+        nonlocal allow_var, ended_with_block
+        consume(TokenKind.LPAREN, '(')
         arguments = []
-        nonlocal allow_var
         allow_var = False
 
-        if peek().text != ')':
+        if cursor.kind != TokenKind.RPAREN:
             while True:
-                arguments.append(parse_expression())
-                if peek().text == ')':
+                arguments.append((yield from parse_expression()))
+                if cursor.kind == TokenKind.RPAREN:
                     break
-                consume(',')
+                consume(TokenKind.COMMA, ',')
 
-        consume(')')
+        consume(TokenKind.RPAREN, ')')
         allow_var = True
+        ended_with_block = False
         return ast.FunctionCall(location=identifier.location, name=identifier.name, arguments=arguments)
 
-
-    if len(tokens) == 0:
-        raise Exception("Input was empty")
-    tokens.insert(0, Token(loc=tokens[0].loc, type='punctuation', text='{'))
-    tokens.append(Token(loc=tokens[-1].loc, type='punctuation', text='}'))
-
-    result = parse_expression()
-
-    if pos < len(tokens):
-        raise Exception(f'{tokens[pos].loc}: unexpected "{tokens[pos].text}"')
-
-    if isinstance(result, ast.Block) and len(result.arguments) == 1:
-        return result.arguments[0]
-    return result
+    # The program is an implicit block that ends at the end of the input
+    return trampoline.run(parse_sequence(cursor.location(), TokenKind.END))
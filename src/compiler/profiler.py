@@ -0,0 +1,121 @@
+from dataclasses import dataclass, field
+from time import perf_counter_ns
+from compiler import ast
+from compiler.interpreter import InterpretHook, Value, interpret
+from compiler.symtab import SymTab
+from compiler.trampoline import Step
+
+
+@dataclass
+class NodeStats:
+    """How many times a node was run and how long it took in nanoseconds,
+    with (`time`) and without (`self_time`) the nodes inside it"""
+    node: ast.Expression
+    count: int = 0
+    time: int = 0
+    self_time: int = 0
+
+
+@dataclass
+class LineStats:
+    """How many nodes on a source line were run, and how long the line's
+    outermost nodes took in nanoseconds. Lines are keyed by
+    `SourceLocation.line`, which counts from 0."""
+    count: int = 0
+    time: int = 0
+
+
+@dataclass
+class Profile:
+    nodes: dict[int, NodeStats] = field(default_factory=dict)
+    lines: dict[int, LineStats] = field(default_factory=dict)
+    # Self time of each stack of frames, keyed by the frames joined with ';'
+    stacks: dict[str, int] = field(default_factory=dict)
+
+    def report(self, source_code: str | None = None, limit: int = 10) -> str:
+        """The hottest source lines and nodes, sorted by time.
+        Lines and columns are shown counting from 1."""
+        source_lines = source_code.splitlines() if source_code is not None else []
+        result = ['Hot lines:', f'{"line":>6} {"count":>10} {"total ms":>10}']
+        for line, line_stats in sorted(self.lines.items(), key=lambda item: -item[1].time)[:limit]:
+            text = source_lines[line].strip() if 0 <= line < len(source_lines) else ''
+            result.append(f'{line + 1:>6} {line_stats.count:>10} {line_stats.time / 1e6:>10.3f}  {text}'.rstrip())
+        result.append('')
+        result.append('Hot nodes:')
+        result.append(f'{"count":>10} {"total ms":>10} {"self ms":>10}  node')
+        for node_stats in sorted(self.nodes.values(), key=lambda stats: -stats.self_time)[:limit]:
+            result.append(f'{node_stats.count:>10} {node_stats.time / 1e6:>10.3f} '
+                          f'{node_stats.self_time / 1e6:>10.3f}  {_frame_name(node_stats.node)}')
+        return '\n'.join(result) + '\n'
+
+    def collapsed_stacks(self) -> str:
+        """The self time of each stack in microseconds, in the collapsed
+        format read by flame graph tools: frames separated by ';', a space
+        and the count."""
+        return ''.join(
+            f'{stack} {time // 1000}\n'
+            for stack, time in sorted(self.stacks.items())
+            if time >= 1000
+        )
+
+
+def profile_interpret(node: ast.Expression, symtab: SymTab, profile: Profile) -> Value:
+    """Runs the program like `interpret` and records how many times each
+    node runs and how long it takes into the profile.
+
+    Each node is measured by a hook around its step, so the interpreter
+    is not slowed down when it runs without one."""
+    return interpret(node, symtab, _profiled(profile))
+
+
+def _profiled(profile: Profile) -> InterpretHook:
+    stacks: list[str] = []
+    child_times: list[int] = []
+    lines_running: dict[int, int] = {}
+    frames: dict[int, str] = {}
+
+    def profiled(node: ast.Expression, step: Step) -> Step:
+        node_stats = profile.nodes.get(id(node))
+        if node_stats is None:
+            node_stats = profile.nodes[id(node)] = NodeStats(node)
+            frames[id(node)] = _frame_name(node)
+        line = node.location.line
+        line_stats = profile.lines.get(line)
+        if line_stats is None:
+            line_stats = profile.lines[line] = LineStats()
+        frame = frames[id(node)]
+        stacks.append(f'{stacks[-1]};{frame}' if stacks else frame)
+        child_times.append(0)
+        # Only the outermost running node of a line adds to its time
+        outermost = lines_running.get(line, 0) == 0
+        lines_running[line] = lines_running.get(line, 0) + 1
+        start = perf_counter_ns()
+        try:
+            return (yield from step)
+        finally:
+            elapsed = perf_counter_ns() - start
+            self_time = elapsed - child_times.pop()
+            if child_times:
+                child_times[-1] += elapsed
+            stack = stacks.pop()
+            profile.stacks[stack] = profile.stacks.get(stack, 0) + self_time
+            lines_running[line] -= 1
+            node_stats.count += 1
+            node_stats.time += elapsed
+            node_stats.self_time += self_time
+            line_stats.count += 1
+            if outermost:
+                line_stats.time += elapsed
+
+    return profiled
+
+
+def _frame_name(node: ast.Expression) -> str:
+    match node:
+        case ast.BinaryOp() | ast.UnaryOp():
+            description = f'{type(node).__name__} {node.op}'
+        case ast.Identifier() | ast.FunctionCall() | ast.VarDeclaration():
+            description = f'{type(node).__name__} {node.name}'
+        case _:
+            description = type(node).__name__
+    return f'{description} ({node.location.line + 1}:{node.location.column + 1})'
@@ -0,0 +1,366 @@
+from functools import cache
+import hashlib
+from importlib.util import MAGIC_NUMBER
+import marshal
+import os
+from types import CodeType
+from typing import Callable
+from compiler import ast, trampoline
+from compiler.trampoline import Step
+from compiler.types import Bool, Int
+
+
+# Helpers defined at the start of every generated program.
+# Integers behave like in the compiled program: they wrap at 64 bits,
+# and division rounds towards zero.
+_PRELUDE = '''\
+def _wrap(value):
+    return ((value + 9223372036854775808) & 0xFFFFFFFFFFFFFFFF) - 9223372036854775808
+
+def _div(a, b):
+    if b == 0:
+        raise Exception("Can't divide by zero")
+    quotient = abs(a) // abs(b)
+    return _wrap(-quotient if (a < 0) != (b < 0) else quotient)
+
+def _mod(a, b):
+    if b == 0:
+        raise Exception("Can't divide by zero")
+    remainder = abs(a) % abs(b)
+    return -remainder if a < 0 else remainder
+
+def _print_bool(value):
+    print('true' if value else 'false')
+
+def _read_int():
+    return _wrap(int(input()))
+'''
+
+# An arithmetic result that is kept in 64 bits, with `{}` for the operation.
+# The conditional expression tests its condition first, so `_t` holds the
+# result when it is read.
+_WRAPPED = '(_t if -9223372036854775808 <= (_t := {}) <= 9223372036854775807 else _wrap(_t))'
+
+_comparisons = frozenset(['==', '!=', '<', '<=', '>', '>='])
+
+# Subexpressions at this many levels of nesting are stored in variables,
+# because Python limits how deeply parentheses nest
+_MAX_NESTING = 20
+
+# Nesting depth of `expression` steps run with `yield from` before the
+# next one is yielded to `trampoline.run`. A level takes up to three frames.
+_RECURSION_BUDGET = 100
+
+
+def generate_python(root_node: ast.Expression) -> str:
+    """Generates Python source code for a typechecked AST.
+
+    The program becomes a function, so its variables are Python locals.
+    Every variable declaration gets its own local, so shadowed variables
+    do not clash. Expressions that can be written as Python expressions
+    are, and the rest become statements that store their value in a
+    temporary variable. Like the compiled program, the generated program
+    prints its result if it is an Int or a Bool."""
+    generator = _PythonGenerator()
+    generator.lines.append('def main():')
+    result = trampoline.run(generator.expression(root_node))
+    if root_node.type is Int:
+        generator.emit(f'print({result})')
+    elif root_node.type is Bool:
+        generator.emit(f'_print_bool({result})')
+    else:
+        generator.emit_discarded(result)
+    generator.emit('return')
+    return _PRELUDE + '\n' + '\n'.join(generator.lines) + '\n\nmain()\n'
+
+
+def compile_python(root_node: ast.Expression, file_name: str = '<program>') -> CodeType:
+    """Generates Python code for a typechecked AST and compiles it.
+    Python limits how deeply blocks nest, so deeply nested conditionals
+    and loops cannot be compiled."""
+    source = generate_python(root_node)
+    try:
+        return compile(source, file_name, 'exec')
+    except (RecursionError, SyntaxError) as e:
+        raise Exception(f"Program is nested too deeply to run as Python: {e}")
+
+
+def run_python(code: CodeType) -> None:
+    exec(code, {'__name__': '__program__'})
+
+
+def dump_code(code: CodeType) -> bytes:
+    """Serializes a compiled program with `marshal`. The data can only be
+    loaded by the same Python version."""
+    return MAGIC_NUMBER + marshal.dumps(code)
+
+
+def load_code(data: bytes) -> CodeType:
+    if data[:len(MAGIC_NUMBER)] != MAGIC_NUMBER:
+        raise Exception("Compiled for another Python version")
+    code = marshal.loads(data[len(MAGIC_NUMBER):])
+    if not isinstance(code, CodeType):
+        raise Exception("Not a compiled program")
+    return code
+
+
+def cached_code(source_code: str, cache_dir: str, compile_source: Callable[[], CodeType]) -> CodeType:
+    """Returns the code compiled from the source code, using the code
+    saved in the cache directory if it was compiled from the same source
+    code by the same version of this module. Otherwise calls
+    `compile_source` and saves the result."""
+    digest = hashlib.sha256(_generator_digest() + source_code.encode()).digest()
+    cache_file = os.path.join(cache_dir, digest.hex() + '.pyc')
+    try:
+        with open(cache_file, 'rb') as f:
+            data = f.read()
+        if data[:len(digest)] == digest:
+            return load_code(data[len(digest):])
+    except Exception:
+        pass
+    code = compile_source()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'wb') as f:
+            f.write(digest + dump_code(code))
+    except OSError:
+        pass
+    return code
+
+
+@cache
+def _generator_digest() -> bytes:
+    # The source of this module, including the prelude, so that cached
+    # code is compiled again when the generator changes
+    with open(__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+class _PythonGenerator:
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+        self.indent = 1
+        self.scopes: list[dict[str, str]] = [{}]
+        self.local_count = 0
+        self.nesting = 0
+        self.depth = 0
+
+    def emit(self, line: str) -> None:
+        self.lines.append('    ' * self.indent + line)
+
+    def emit_discarded(self, expr: str) -> None:
+        """Emits an expression whose value is not used, if it can have an effect."""
+        if _is_constant(expr) or expr.isidentifier():
+            return
+        # An assignment expression becomes an assignment statement
+        name, separator, value = expr[1:-1].partition(' := ')
+        if separator and name.isidentifier() and _balanced(value):
+            self.emit(f'{name} = {value}')
+        else:
+            self.emit(expr)
+
+    def new_local(self, prefix: str) -> str:
+        self.local_count += 1
+        return f'{prefix}_{self.local_count}'
+
+    def emit_body(self, lines: list[str], value: str) -> None:
+        """Emits the body of a statement from the result of `nested`."""
+        start = len(self.lines)
+        self.lines.extend(lines)
+        self.indent += 1
+        self.emit_discarded(value)
+        if len(self.lines) == start:
+            self.emit('pass')
+        self.indent -= 1
+
+    def store(self, expr: str) -> str:
+        """Stores the value of an expression in a new temporary variable."""
+        temp = self.new_local('t')
+        self.emit(f'{temp} = {expr}')
+        return temp
+
+    def lookup(self, name: str) -> str:
+        for scope in reversed(self.scopes):
+            local = scope.get(name)
+            if local is not None:
+                return local
+        raise Exception(f'Variable "{name}" is not set')
+
+    def operands(self, nodes: list[ast.Expression]) -> Step:
+        """Generates expressions that are evaluated from left to right.
+        If an operand needs statements, the operands before it are stored
+        in variables before those statements run."""
+        exprs: list[str] = []
+        positions: list[int] = []
+        for node in nodes:
+            start = len(self.lines)
+            expr = yield from self.expression(node)
+            if len(self.lines) > start:
+                for i in reversed(range(len(exprs))):
+                    if not _is_constant(exprs[i]):
+                        temp = self.new_local('t')
+                        self.lines.insert(positions[i], '    ' * self.indent + f'{temp} = {exprs[i]}')
+                        exprs[i] = temp
+            exprs.append(expr)
+            positions.append(len(self.lines))
+        return exprs
+
+    def expression(self, node: ast.Expression) -> Step:
+        """Emits the statements needed to evaluate the node and
+        returns a Python expression for its value."""
+        if self.depth >= _RECURSION_BUDGET:
+            outer_depth, self.depth = self.depth, 0
+            try:
+                return (yield self.expression(node))
+            finally:
+                self.depth = outer_depth
+        self.depth += 1
+        self.nesting += 1
+        expr = yield from self.generate(node)
+        self.nesting -= 1
+        self.depth -= 1
+        if self.nesting > 0 and self.nesting % _MAX_NESTING == 0 and not _is_constant(expr) and not expr.isidentifier():
+            return self.store(expr)
+        return expr
+
+    def nested(self, node: ast.Expression) -> Step:
+        """Generates an expression that is evaluated only conditionally.
+        Returns the expression and the statements it needs, indented
+        to go inside an `if` statement, without emitting them."""
+        start = len(self.lines)
+        self.indent += 1
+        expr = yield from self.expression(node)
+        self.indent -= 1
+        lines = self.lines[start:]
+        del self.lines[start:]
+        return expr, lines
+
+    def generate(self, node: ast.Expression) -> Step:
+        match node:
+            case ast.Literal():
+                if isinstance(node.value, bool) or node.value is None:
+                    return repr(node.value)
+                number = ((node.value + 2**63) & (2**64 - 1)) - 2**63
+                return str(number) if number >= 0 else f'({number})'
+
+            case ast.Identifier():
+                return self.lookup(node.name)
+
+            case ast.BinaryOp() if node.op == '=':
+                if not isinstance(node.left, ast.Identifier):
+                    raise Exception('Left of assignment must be an identifier')
+                local = self.lookup(node.left.name)
+                value = yield from self.expression(node.right)
+                return f'({local} := {value})'
+
+            case ast.BinaryOp() if node.op in ('and', 'or'):
+                left = yield from self.expression(node.left)
+                right, right_lines = yield from self.nested(node.right)
+                if not right_lines:
+                    return f'({left} {node.op} {right})'
+                # The right operand needs statements, which run only if needed
+                temp = self.store(left)
+                self.emit(f'if {temp}:' if node.op == 'and' else f'if not {temp}:')
+                self.lines.extend(right_lines)
+                self.emit(f'    {temp} = {right}')
+                return temp
+
+            case ast.BinaryOp():
+                left, right = yield from self.operands([node.left, node.right])
+                if node.op in _comparisons:
+                    return f'({left} {node.op} {right})'
+                if node.op == '/':
+                    return f'_div({left}, {right})'
+                if node.op == '%':
+                    return f'_mod({left}, {right})'
+                if node.op in ('+', '-', '*'):
+                    return _WRAPPED.format(f'{left} {node.op} {right}')
+                raise Exception(f'Unsupported operator: {node.op}')
+
+            case ast.UnaryOp():
+                expr = yield from self.expression(node.expr)
+                if node.op == 'not':
+                    return f'(not {expr})'
+                return _WRAPPED.format(f'-{expr}')
+
+            case ast.VarDeclaration():
+                value = yield from self.expression(node.value)
+                local = self.new_local('v_' + node.name)
+                self.scopes[-1][node.name] = local
+                self.emit(f'{local} = {value}')
+                return 'None'
+
+            case ast.Block():
+                self.scopes.append({})
+                result = 'None'
+                for i, argument in enumerate(node.arguments):
+                    result = yield from self.expression(argument)
+                    if i < len(node.arguments) - 1:
+                        self.emit_discarded(result)
+                self.scopes.pop()
+                return result
+
+            case ast.IfExpression():
+                cond = yield from self.expression(node.cond)
+                then_value, then_lines = yield from self.nested(node.then_clause)
+                if node.else_clause is None:
+                    self.emit(f'if {cond}:')
+                    self.emit_body(then_lines, then_value)
+                    return 'None'
+
+                else_value, else_lines = yield from self.nested(node.else_clause)
+                if not then_lines and not else_lines:
+                    return f'({then_value} if {cond} else {else_value})'
+                temp = self.new_local('t')
+                self.emit(f'if {cond}:')
+                self.lines.extend(then_lines)
+                self.emit(f'    {temp} = {then_value}')
+                self.emit('else:')
+                self.lines.extend(else_lines)
+                self.emit(f'    {temp} = {else_value}')
+                return temp
+
+            case ast.WhileExpression():
+                cond, cond_lines = yield from self.nested(node.cond)
+                body_value, body_lines = yield from self.nested(node.do_clause)
+                if cond_lines:
+                    self.emit('while True:')
+                    self.lines.extend(cond_lines)
+                    self.emit(f'    if not {cond}:')
+                    self.emit('        break')
+                else:
+                    self.emit(f'while {cond}:')
+                self.emit_body(body_lines, body_value)
+                return 'None'
+
+            case ast.FunctionCall():
+                arguments = yield from self.operands(node.arguments)
+                if node.name == 'print_int' and len(arguments) == 1:
+                    self.emit(f'print({arguments[0]})')
+                    return 'None'
+                if node.name == 'print_bool' and len(arguments) == 1:
+                    self.emit(f'_print_bool({arguments[0]})')
+                    return 'None'
+                if node.name == 'read_int' and len(arguments) == 0:
+                    return self.store('_read_int()')
+                raise Exception(f'Unknown function: {node.name}')
+
+            case _:
+                raise Exception(f'Unsupported AST node: {node}')
+
+
+def _is_constant(expr: str) -> bool:
+    return expr in ('None', 'True', 'False') or expr.strip('()-').isdigit()
+
+
+def _balanced(expr: str) -> bool:
+    """Whether the parentheses in the expression match."""
+    depth = 0
+    for char in expr:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
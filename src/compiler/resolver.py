@@ -0,0 +1,94 @@
+from compiler import ast
+
+
+_VISIT = 0
+_END_BLOCK = 1
+_DECLARE = 2
+
+
+def resolve(root: ast.Expression) -> None:
+    """Resolves variable references in the AST ahead of the later stages.
+
+    Each variable declared in a block gets a slot in that block's frame,
+    and each identifier, assignment target and function call referring
+    to such a variable gets its (depth, slot) address, where depth is the
+    number of blocks between the reference and the declaration. Names
+    that are not declared in an enclosing block, such as the built-in
+    functions, are left unresolved and are looked up by name.
+
+    A block's declarations are visible only after them, so a repeated
+    declaration in the same block reuses the slot of the first one,
+    which lets the later stages report it as already existing."""
+    scopes: list[dict[str, int]] = []
+
+    def lookup(name: str) -> tuple[int, int] | None:
+        for depth in range(len(scopes)):
+            slot = scopes[-1 - depth].get(name)
+            if slot is not None:
+                return (depth, slot)
+        return None
+
+    # An explicit stack of nodes to visit and of the actions to take
+    # after the children of a block or a declaration have been visited
+    stack: list[tuple[int, ast.Expression]] = [(_VISIT, root)]
+    while stack:
+        action, node = stack.pop()
+
+        if action == _END_BLOCK:
+            assert isinstance(node, ast.Block)
+            node.frame_size = len(scopes.pop())
+            continue
+
+        if action == _DECLARE:
+            assert isinstance(node, ast.VarDeclaration)
+            if scopes:
+                scope = scopes[-1]
+                slot = scope.get(node.name)
+                if slot is None:
+                    slot = len(scope)
+                    scope[node.name] = slot
+                node.slot = slot
+            else:
+                # Declared directly in the symbol table given to the stage
+                node.slot = None
+            continue
+
+        match node:
+            case ast.Literal():
+                pass
+
+            case ast.Identifier():
+                node.address = lookup(node.name)
+
+            case ast.BinaryOp():
+                stack.append((_VISIT, node.right))
+                stack.append((_VISIT, node.left))
+
+            case ast.UnaryOp():
+                stack.append((_VISIT, node.expr))
+
+            case ast.IfExpression():
+                if node.else_clause is not None:
+                    stack.append((_VISIT, node.else_clause))
+                stack.append((_VISIT, node.then_clause))
+                stack.append((_VISIT, node.cond))
+
+            case ast.WhileExpression():
+                stack.append((_VISIT, node.do_clause))
+                stack.append((_VISIT, node.cond))
+
+            case ast.FunctionCall():
+                node.address = lookup(node.name)
+                stack.extend((_VISIT, argument) for argument in reversed(node.arguments))
+
+            case ast.Block():
+                scopes.append({})
+                stack.append((_END_BLOCK, node))
+                stack.extend((_VISIT, argument) for argument in reversed(node.arguments))
+
+            case ast.VarDeclaration():
+                stack.append((_DECLARE, node))
+                stack.append((_VISIT, node.value))
+
+            case _:
+                raise Exception(f"Unsupported AST node: {node}")
@@ -0,0 +1,525 @@
+from dataclasses import dataclass
+from typing import Callable
+from compiler import ir
+from compiler.cfg import BasicBlock, ControlFlowGraph
+from compiler.ir import IRVar
+from compiler.tokenizer import SourceLocation
+from compiler.types import Type
+
+# SSA form of a control flow graph: every variable is assigned once.
+#
+# `to_ssa` renames each assignment of a variable `x` to a new version
+# `x.1`, `x.2`, ... and adds a `Phi` to the start of the blocks where
+# versions meet. A use of `x` that no assignment reaches keeps the
+# name `x`. `from_ssa` removes the phis again, giving the versions of
+# `x` back the name `x` wherever they are not live at the same time.
+
+
+@dataclass(frozen=True)
+class Phi(ir.Instruction):
+    """Sets `dest` to the argument of the predecessor that the block was
+    entered from. The arguments are in the order of the block's
+    `predecessors`."""
+    args: list[IRVar]
+    dest: IRVar
+
+
+class DominatorTree:
+    """Block `a` dominates block `b` if every path from the entry to `b`
+    goes through `a`. `idom` is the immediate dominator of each block,
+    -1 for the entry and for unreachable blocks. `frontiers` lists for
+    each block the blocks where its dominance ends: blocks with a
+    predecessor that it dominates, which it does not strictly dominate."""
+
+    def __init__(self, idom: list[int], frontiers: list[list[int]]) -> None:
+        self.idom = idom
+        self.frontiers = frontiers
+        self.children: list[list[int]] = [[] for _ in idom]
+        for block, parent in enumerate(idom):
+            if parent >= 0:
+                self.children[parent].append(block)
+        # Preorder numbers, so that `a` dominates `b` if and only if
+        # `b`'s number is between `a`'s and the last one in `a`'s subtree
+        self.preorder = [-1] * len(idom)
+        self.last = [-1] * len(idom)
+        self.order: list[int] = []
+        if idom:
+            stack = [(0, False)]
+            while stack:
+                block, done = stack.pop()
+                if done:
+                    self.last[block] = len(self.order) - 1
+                    continue
+                self.preorder[block] = len(self.order)
+                self.order.append(block)
+                stack.append((block, True))
+                stack.extend((child, False) for child in reversed(self.children[block]))
+
+    def dominates(self, a: int, b: int) -> bool:
+        return self.preorder[b] >= 0 and self.preorder[a] <= self.preorder[b] <= self.last[a]
+
+
+def build_dominator_tree(cfg: ControlFlowGraph) -> DominatorTree:
+    """The dominators of the blocks by the iterative algorithm of Cooper,
+    Harvey and Kennedy, and their dominance frontiers."""
+    blocks = cfg.blocks
+    postorder = _postorder(blocks)
+    number = [-1] * len(blocks)
+    for i, block in enumerate(postorder):
+        number[block] = i
+
+    idom = [-1] * len(blocks)
+    if not blocks:
+        return DominatorTree(idom, [])
+    idom[0] = 0
+
+    def intersect(a: int, b: int) -> int:
+        while a != b:
+            while number[a] < number[b]:
+                a = idom[a]
+            while number[b] < number[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(postorder[:-1]):
+            new_idom = -1
+            for pred in blocks[block].predecessors:
+                if idom[pred] >= 0:
+                    new_idom = pred if new_idom < 0 else intersect(pred, new_idom)
+            if idom[block] != new_idom:
+                idom[block] = new_idom
+                changed = True
+
+    # The entry is entered from outside the graph too, which makes it
+    # part of the frontiers of the blocks that jump back to it
+    idom[0] = -1
+    frontiers: list[list[int]] = [[] for _ in blocks]
+    for block in postorder:
+        preds = blocks[block].predecessors
+        if len(preds) < 2 and block != 0:
+            continue
+        for pred in preds:
+            if number[pred] < 0:
+                continue  # Unreachable
+            runner = pred
+            while runner != idom[block]:
+                runner_frontier = frontiers[runner]
+                if runner_frontier and runner_frontier[-1] == block:
+                    break  # Added from an earlier predecessor, and so were the rest
+                runner_frontier.append(block)
+                runner = idom[runner]
+    return DominatorTree(idom, frontiers)
+
+
+def _postorder(blocks: list[BasicBlock]) -> list[int]:
+    """The blocks reachable from the entry in depth-first postorder."""
+    result: list[int] = []
+    if not blocks:
+        return result
+    visited = [False] * len(blocks)
+    visited[0] = True
+    stack = [(0, 0)]
+    while stack:
+        block, i = stack[-1]
+        successors = blocks[block].successors
+        if i < len(successors):
+            stack[-1] = (block, i + 1)
+            successor = successors[i]
+            if not visited[successor]:
+                visited[successor] = True
+                stack.append((successor, 0))
+        else:
+            stack.pop()
+            result.append(block)
+    return result
+
+
+def to_ssa(cfg: ControlFlowGraph, var_types: dict[IRVar, Type] | None = None) -> DominatorTree:
+    """Converts the graph to SSA form in place and returns its dominator
+    tree. Unreachable blocks are removed, and an empty entry block is
+    added if the first block can be jumped to. If `var_types` is given,
+    each new version gets the type of its variable.
+
+    Phis are placed only for variables that are read in a block before
+    they are assigned in it, because the others (like most temporaries of
+    the IR generator) never live across blocks."""
+    _normalize(cfg)
+    blocks = cfg.blocks
+    tree = build_dominator_tree(cfg)
+    names = _Names(cfg)
+
+    # Variables read before they are assigned in some block, and the
+    # blocks that assign each variable
+    live_across: set[IRVar] = set()
+    assigned_in: dict[IRVar, list[int]] = {}
+    for block in blocks:
+        assigned: set[IRVar] = set()
+        for ins in block.instructions:
+            for var in _uses(ins):
+                if var not in assigned:
+                    live_across.add(var)
+            dest = _dest(ins)
+            if dest is not None and dest not in assigned:
+                assigned.add(dest)
+                assigned_in.setdefault(dest, []).append(block.index)
+        if isinstance(block.terminator, ir.CondJump) and block.terminator.cond not in assigned:
+            live_across.add(block.terminator.cond)
+
+    # Phis go to the iterated dominance frontier of the assignments.
+    # The arrays mark blocks by the number of the variable last placed.
+    phi_vars: list[list[IRVar]] = [[] for _ in blocks]
+    has_phi = [-1] * len(blocks)
+    queued = [-1] * len(blocks)
+    for var_number, (var, var_blocks) in enumerate(assigned_in.items()):
+        if var not in live_across:
+            continue
+        pending = list(var_blocks)
+        for index in pending:
+            queued[index] = var_number
+        while pending:
+            for frontier in tree.frontiers[pending.pop()]:
+                if has_phi[frontier] != var_number:
+                    has_phi[frontier] = var_number
+                    phi_vars[frontier].append(var)
+                    if queued[frontier] != var_number:
+                        queued[frontier] = var_number
+                        pending.append(frontier)
+
+    # Renaming walks the dominator tree with a stack of versions for each
+    # variable, so a use gets the version of the nearest dominating
+    # assignment
+    versions: dict[IRVar, list[IRVar]] = {}
+    phi_dests: list[list[IRVar]] = [[] for _ in blocks]
+    phi_args: list[list[list[IRVar]]] = [
+        [[var] * len(block.predecessors) for var in phi_vars[block.index]]
+        for block in blocks
+    ]
+    predecessor_positions = [
+        {pred: position for position, pred in enumerate(block.predecessors)}
+        for block in blocks
+    ]
+
+    def current(var: IRVar) -> IRVar:
+        stack = versions.get(var)
+        return stack[-1] if stack else var
+
+    def new_version(var: IRVar) -> IRVar:
+        version = names.fresh(var)
+        versions.setdefault(var, []).append(version)
+        if var_types is not None and var in var_types:
+            var_types[version] = var_types[var]
+        return version
+
+    work: list[tuple[int, list[IRVar] | None]] = [(0, None)] if blocks else []
+    while work:
+        index, renamed = work.pop()
+        if renamed is not None:
+            # Leaving the block's subtree
+            for var in renamed:
+                versions[var].pop()
+            continue
+        block = blocks[index]
+        renamed = list(phi_vars[index])
+        phi_dests[index] = [new_version(var) for var in renamed]
+        instructions: list[ir.Instruction] = []
+        for ins in block.instructions:
+            instructions.append(_rename(ins, current, new_version))
+            dest = _dest(ins)
+            if dest is not None:
+                renamed.append(dest)
+        block.instructions = instructions
+        if isinstance(block.terminator, ir.CondJump):
+            terminator = block.terminator
+            block.terminator = ir.CondJump(
+                terminator.location, current(terminator.cond), terminator.then_label, terminator.else_label)
+        for successor in block.successors:
+            position = predecessor_positions[successor][index]
+            for var, args in zip(phi_vars[successor], phi_args[successor]):
+                args[position] = current(var)
+        work.append((index, renamed))
+        work.extend((child, None) for child in reversed(tree.children[index]))
+
+    for block in blocks:
+        if phi_vars[block.index]:
+            location = _block_location(block)
+            block.instructions[:0] = [
+                Phi(location, args, dest)
+                for args, dest in zip(phi_args[block.index], phi_dests[block.index])
+            ]
+    return tree
+
+
+def from_ssa(cfg: ControlFlowGraph, var_types: dict[IRVar, Type] | None = None) -> None:
+    """Converts the graph out of SSA form in place, replacing phis with
+    copies. If `var_types` is given, it gets the types of the new
+    variables.
+
+    The versions of a variable are coalesced back into one variable,
+    except for versions that are live at the same time as a version they
+    would share it with. Such versions keep their own name. A phi whose
+    arguments and destination end up as one variable is simply removed.
+    The other phis become a copy of the argument to a new variable at the
+    end of each predecessor and a copy of that variable to the
+    destination at the start of the block, which stays correct for
+    critical edges and for phis that read each other."""
+    blocks = cfg.blocks
+    tree = build_dominator_tree(cfg)
+    names = _Names(cfg)
+
+    # Where each variable is assigned: its block and position. Variables
+    # that are read but never assigned are live from the start.
+    assignments: dict[IRVar, tuple[int, int]] = {}
+    used: set[IRVar] = set()
+    for block in blocks:
+        for position, ins in enumerate(block.instructions):
+            used.update(_uses(ins))
+            dest = _dest(ins)
+            if dest is not None:
+                if dest in assignments:
+                    raise Exception(f'{ins.location}: {dest} is assigned more than once, not in SSA form')
+                assignments[dest] = (block.index, position)
+        if isinstance(block.terminator, ir.CondJump):
+            used.add(block.terminator.cond)
+    for var in used:
+        if var not in assignments:
+            assignments[var] = (0, -1)
+
+    groups: dict[str, list[IRVar]] = {}
+    for var in assignments:
+        groups.setdefault(_base_name(var), []).append(var)
+    candidates = {var for group in groups.values() if len(group) > 1 for var in group}
+    liveness = _Liveness(cfg, assignments, candidates)
+
+    def dominates(a: tuple[int, int], b: tuple[int, int]) -> bool:
+        if a[0] == b[0]:
+            return a[1] <= b[1]
+        return tree.dominates(a[0], b[0])
+
+    # Each group keeps the versions that do not interfere with each other.
+    # In SSA form a variable is live only where its assignment dominates,
+    # so checking each version against the nearest kept version that
+    # dominates it is enough (Budimlić et al.).
+    renamed: dict[IRVar, IRVar] = {}
+    for base, group in groups.items():
+        base_var = IRVar(base)
+        group.sort(key=lambda var: (tree.preorder[assignments[var][0]], assignments[var][1]))
+        kept: list[IRVar] = []
+        for var in group:
+            point = assignments[var]
+            if tree.preorder[point[0]] < 0:
+                continue  # Unreachable
+            while kept and not dominates(assignments[kept[-1]], point):
+                kept.pop()
+            if kept and liveness.live_at(kept[-1], point):
+                if var == base_var:
+                    renamed[var] = names.fresh(var)
+                continue
+            kept.append(var)
+            renamed[var] = base_var
+            if var_types is not None and var in var_types:
+                var_types.setdefault(base_var, var_types[var])
+
+    def name(var: IRVar) -> IRVar:
+        return renamed.get(var, var)
+
+    predecessor_copies: list[list[ir.Instruction]] = [[] for _ in blocks]
+    for block in blocks:
+        instructions: list[ir.Instruction] = []
+        for ins in block.instructions:
+            if isinstance(ins, Phi):
+                dest = name(ins.dest)
+                if ins.dest not in used or all(name(arg) == dest for arg in ins.args):
+                    continue
+                temp = names.fresh(ins.dest)
+                if var_types is not None and ins.dest in var_types:
+                    var_types[temp] = var_types[ins.dest]
+                for pred, arg in zip(block.predecessors, ins.args):
+                    predecessor_copies[pred].append(ir.Copy(ins.location, name(arg), temp))
+                instructions.append(ir.Copy(ins.location, temp, dest))
+                continue
+            ins = _rename(ins, name, name)
+            if not (isinstance(ins, ir.Copy) and ins.source == ins.dest):
+                instructions.append(ins)
+        block.instructions = instructions
+        if isinstance(block.terminator, ir.CondJump):
+            terminator = block.terminator
+            block.terminator = ir.CondJump(
+                terminator.location, name(terminator.cond), terminator.then_label, terminator.else_label)
+    for block in blocks:
+        block.instructions.extend(predecessor_copies[block.index])
+
+
+class _Liveness:
+    """Where the given SSA variables are live, found by walking backwards
+    from each use to the assignment."""
+
+    def __init__(self, cfg: ControlFlowGraph, assignments: dict[IRVar, tuple[int, int]],
+                 variables: set[IRVar]) -> None:
+        self.blocks = cfg.blocks
+        self.assignments = assignments
+        self.live_in: list[set[IRVar]] = [set() for _ in self.blocks]
+        self.live_out: list[set[IRVar]] = [set() for _ in self.blocks]
+        # The position of the last use of a variable in each block
+        self.last_use: dict[IRVar, dict[int, int]] = {var: {} for var in variables}
+        for block in self.blocks:
+            index = block.index
+            for position, ins in enumerate(block.instructions):
+                if isinstance(ins, Phi):
+                    # A phi reads its arguments at the end of the predecessors
+                    for pred, arg in zip(block.predecessors, ins.args):
+                        if arg in variables:
+                            self._live_out(arg, pred)
+                    continue
+                for var in _uses(ins):
+                    if var in variables:
+                        self._use(var, index, position)
+            if isinstance(block.terminator, ir.CondJump) and block.terminator.cond in variables:
+                self._use(block.terminator.cond, index, len(block.instructions))
+
+    def _use(self, var: IRVar, index: int, position: int) -> None:
+        last_use = self.last_use[var]
+        if last_use.get(index, -1) < position:
+            last_use[index] = position
+        if self.assignments[var][0] != index:
+            self._live_in(var, index)
+
+    def _live_out(self, var: IRVar, index: int) -> None:
+        if var not in self.live_out[index]:
+            self.live_out[index].add(var)
+            if self.assignments[var][0] != index:
+                self._live_in(var, index)
+
+    def _live_in(self, var: IRVar, index: int) -> None:
+        assigned_in = self.assignments[var][0]
+        work = [index]
+        while work:
+            index = work.pop()
+            if var in self.live_in[index]:
+                continue
+            self.live_in[index].add(var)
+            for pred in self.blocks[index].predecessors:
+                if var not in self.live_out[pred]:
+                    self.live_out[pred].add(var)
+                    if pred != assigned_in:
+                        work.append(pred)
+
+    def live_at(self, var: IRVar, point: tuple[int, int]) -> bool:
+        """Whether the variable is live right after the given position,
+        given that its assignment dominates it."""
+        index, position = point
+        return var in self.live_out[index] or self.last_use[var].get(index, -1) > position
+
+
+class _Names:
+    """New variable names that are not used in the graph yet."""
+
+    def __init__(self, cfg: ControlFlowGraph) -> None:
+        self.used: set[str] = set()
+        self.counters: dict[str, int] = {}
+        for block in cfg.blocks:
+            for ins in block.instructions:
+                self.used.update(var.name for var in _uses(ins))
+                dest = _dest(ins)
+                if dest is not None:
+                    self.used.add(dest.name)
+            if isinstance(block.terminator, ir.CondJump):
+                self.used.add(block.terminator.cond.name)
+
+    def fresh(self, var: IRVar) -> IRVar:
+        """A new version of the variable, like `x3.1`."""
+        base = _base_name(var)
+        counter = self.counters.get(base, 0)
+        while True:
+            counter += 1
+            name = f'{base}.{counter}'
+            if name not in self.used:
+                break
+        self.counters[base] = counter
+        self.used.add(name)
+        return IRVar(name)
+
+
+def _base_name(var: IRVar) -> str:
+    return var.name.partition('.')[0]
+
+
+def _uses(ins: ir.Instruction) -> list[IRVar]:
+    match ins:
+        case ir.Copy():
+            return [ins.source]
+        case ir.Call():
+            return [ins.fun, *ins.args]
+        case Phi():
+            return ins.args
+        case _:
+            return []
+
+
+def _dest(ins: ir.Instruction) -> IRVar | None:
+    match ins:
+        case ir.LoadIntConstant() | ir.LoadBoolConstant() | ir.Copy() | ir.Call() | Phi():
+            return ins.dest
+        case _:
+            return None
+
+
+def _rename(ins: ir.Instruction, use: Callable[[IRVar], IRVar],
+            define: Callable[[IRVar], IRVar]) -> ir.Instruction:
+    """The instruction with its uses and its destination renamed.
+    Uses are renamed first, since they are read before the destination
+    is written."""
+    match ins:
+        case ir.LoadIntConstant():
+            return ir.LoadIntConstant(ins.location, ins.value, define(ins.dest))
+        case ir.LoadBoolConstant():
+            return ir.LoadBoolConstant(ins.location, ins.value, define(ins.dest))
+        case ir.Copy():
+            source = use(ins.source)
+            return ir.Copy(ins.location, source, define(ins.dest))
+        case ir.Call():
+            fun = use(ins.fun)
+            args = [use(arg) for arg in ins.args]
+            return ir.Call(ins.location, fun, args, define(ins.dest))
+        case Phi():
+            raise Exception(f'{ins.location}: the IR is already in SSA form')
+        case _:
+            raise Exception(f'{ins.location}: unexpected instruction inside a basic block: {ins}')
+
+
+def _normalize(cfg: ControlFlowGraph) -> None:
+    """Removes unreachable blocks and makes sure that nothing jumps to
+    the entry block, so that it needs no phis."""
+    blocks = cfg.blocks
+    reachable = [False] * len(blocks)
+    for index in _postorder(blocks):
+        reachable[index] = True
+    add_entry = bool(blocks) and any(reachable[pred] for pred in blocks[0].predecessors)
+    if not add_entry and all(reachable):
+        return
+    kept = [block for block in blocks if reachable[block.index]]
+    offset = 1 if add_entry else 0
+    new_index = {block.index: i + offset for i, block in enumerate(kept)}
+    for block in kept:
+        block.index = new_index[block.index]
+        block.successors = [new_index[successor] for successor in block.successors]
+        block.predecessors = [new_index[pred] for pred in block.predecessors if pred in new_index]
+    if add_entry:
+        # An empty block that falls through to the old entry
+        entry = BasicBlock(0, None)
+        entry.successors.append(1)
+        kept[0].predecessors.insert(0, 0)
+        kept.insert(0, entry)
+    cfg.blocks = kept
+
+
+def _block_location(block: BasicBlock) -> SourceLocation:
+    if block.label is not None:
+        return block.label.location
+    if block.instructions:
+        return block.instructions[0].location
+    if block.terminator is not None:
+        return block.terminator.location
+    return SourceLocation('ir', 0, 0)
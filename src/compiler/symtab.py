@@ -3,6 +3,7 @@ from dataclasses import dataclass, field
 from typing import Any, Optional
 from compiler.types import Bool, Int, Unit, FunType
 from compiler.ir import IRVar
+from compiler.io_context import IOContext
 
 
 UNDEFINED = object()
@@ -11,15 +12,18 @@ UNDEFINED = object()
 class SymTab:
     locals: dict = field(default_factory=dict)
     parent: Optional['SymTab'] = None
+    # Values of resolved variables, see `compiler.resolver`
+    slots: list = field(default_factory=list)
 
     def set(self, name: str, value: Any) -> None:
         self.locals[name] = value
 
     def get(self, name: str) -> Any:
-        if name in self.locals:
-            return self.locals[name]
-        elif self.parent:
-            return self.parent.get(name)
+        scope: SymTab | None = self
+        while scope is not None:
+            if name in scope.locals:
+                return scope.locals[name]
+            scope = scope.parent
         return UNDEFINED
 
     def get_local(self, name: str) -> Any:
@@ -28,13 +32,40 @@ class SymTab:
         return UNDEFINED
 
     def find_scope(self, name: str) -> Any:
-        if name in self.locals:
-            return self
-        if self.parent:
-            return self.parent.find_scope(name)
+        scope: SymTab | None = self
+        while scope is not None:
+            if name in scope.locals:
+                return scope
+            scope = scope.parent
         return UNDEFINED
 
-def build_interpreter_symtab() -> SymTab:
+    def get_slot(self, address: tuple[int, int]) -> Any:
+        depth, slot = address
+        scope: Any = self
+        for _ in range(depth):
+            scope = scope.parent
+        return scope.slots[slot]
+
+    def set_slot(self, address: tuple[int, int], value: Any) -> None:
+        depth, slot = address
+        scope: Any = self
+        for _ in range(depth):
+            scope = scope.parent
+        scope.slots[slot] = value
+
+    @staticmethod
+    def for_block(parent: 'SymTab', frame_size: int | None) -> 'SymTab':
+        """A scope for a block with the given `frame_size`. The variables
+        of a resolved block live in its slots, so it shares the names of
+        the enclosing scope, and unresolved names are found without
+        walking the parent chain."""
+        if frame_size is None:
+            return SymTab(parent=parent)
+        return SymTab(parent.locals, parent, [UNDEFINED] * frame_size)
+
+def build_interpreter_symtab(io: IOContext | None = None) -> SymTab:
+    """The built-in functions of the interpreter. Without an I/O context
+    they read and print with `input` and `print`."""
     symtab = SymTab()
 
     symtab.set('+', lambda a, b: a + b)
@@ -52,9 +83,14 @@ def build_interpreter_symtab() -> SymTab:
     symtab.set('or', lambda a, b: a or b)
     symtab.set('unary_-', lambda a: -a)
     symtab.set('unary_not', lambda a: not a)
-    symtab.set('read_int', lambda: int(input()))
-    symtab.set('print_int', lambda a: print(a))
-    symtab.set('print_bool', lambda a: print('true') if a else print('false'))
+    if io is not None:
+        symtab.set('read_int', io.read_int)
+        symtab.set('print_int', io.print_int)
+        symtab.set('print_bool', io.print_bool)
+    else:
+        symtab.set('read_int', lambda: int(input()))
+        symtab.set('print_int', lambda a: print(a))
+        symtab.set('print_bool', lambda a: print('true') if a else print('false'))
 
     return symtab
 
@@ -64,22 +100,22 @@ def zero_division_exception() -> None:
 def build_type_symtab() -> SymTab:
     symtab = SymTab()
 
-    symtab.set('+', FunType([Int, Int], Int))
-    symtab.set('-', FunType([Int, Int], Int))
-    symtab.set('*', FunType([Int, Int], Int))
-    symtab.set('/', FunType([Int, Int], Int))
-    symtab.set('%', FunType([Int, Int], Int))
-    symtab.set('<', FunType([Int, Int], Bool))
-    symtab.set('<=', FunType([Int, Int], Bool))
-    symtab.set('>', FunType([Int, Int], Bool))
-    symtab.set('>=', FunType([Int, Int], Bool))
-    symtab.set('and', FunType([Bool, Bool], Bool))
-    symtab.set('or', FunType([Bool, Bool], Bool))
-    symtab.set('unary_-', FunType([Int], Int))
-    symtab.set('unary_not', FunType([Bool], Bool))
-    symtab.set('print_int', FunType([Int], Unit))
-    symtab.set('print_bool', FunType([Bool], Unit))
-    symtab.set('read_int', FunType([], Int))
+    symtab.set('+', FunType((Int, Int), Int))
+    symtab.set('-', FunType((Int, Int), Int))
+    symtab.set('*', FunType((Int, Int), Int))
+    symtab.set('/', FunType((Int, Int), Int))
+    symtab.set('%', FunType((Int, Int), Int))
+    symtab.set('<', FunType((Int, Int), Bool))
+    symtab.set('<=', FunType((Int, Int), Bool))
+    symtab.set('>', FunType((Int, Int), Bool))
+    symtab.set('>=', FunType((Int, Int), Bool))
+    symtab.set('and', FunType((Bool, Bool), Bool))
+    symtab.set('or', FunType((Bool, Bool), Bool))
+    symtab.set('unary_-', FunType((Int,), Int))
+    symtab.set('unary_not', FunType((Bool,), Bool))
+    symtab.set('print_int', FunType((Int,), Unit))
+    symtab.set('print_bool', FunType((Bool,), Unit))
+    symtab.set('read_int', FunType((), Int))
 
     return symtab
 
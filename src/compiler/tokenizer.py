@@ -1,6 +1,11 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from enum import IntEnum
+from mmap import mmap
+import os
 import re
-from typing import Literal
+from typing import Any, Generator, Iterator, Literal, cast
 
 
 @dataclass
@@ -31,76 +36,332 @@ class Token:
     text: str
 
 
+_token_patterns = [
+    ('comment', r'//.*|#.*'),
+    ('whitespace', r'\s+'),
+    ('identifier', r'[a-zA-Z_][a-zA-Z0-9_]*'),
+    ('int_literal', r'[0-9]+'),
+    ('operator', r'==|!=|<=|>=|[-+*/=<>%]'),
+    ('punctuation', r'[(){},;:]'),
+]
+_token_re = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in _token_patterns))
+
+# The characters other than ASCII that `\s` matches in a `str`
+_unicode_whitespace = '\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+
+# In bytes, `\s` only matches ASCII whitespace, so the UTF-8 encodings of
+# the other whitespace characters are listed to scan bytes like a `str`
+_byte_whitespace = b'(?:[\t-\r\x1c-\x20]|' + b'|'.join(re.escape(c.encode()) for c in _unicode_whitespace) + b')+'
+_byte_token_re = re.compile(_token_re.pattern.encode().replace(rb'\s+', _byte_whitespace))
+_bool_literals = frozenset(['true', 'false'])
+
+
+class TokenKind(IntEnum):
+    """Small integer token kinds used by `TokenBuffer`.
+    Keywords get their own kinds, but still have the token type
+    'identifier' so they can be used as names where the grammar allows."""
+    END = 0
+    INT_LITERAL = 1
+    TRUE = 2
+    FALSE = 3
+    IDENTIFIER = 4
+    IF = 5
+    THEN = 6
+    ELSE = 7
+    WHILE = 8
+    DO = 9
+    VAR = 10
+    AND = 11
+    OR = 12
+    NOT = 13
+    PLUS = 14
+    MINUS = 15
+    STAR = 16
+    SLASH = 17
+    PERCENT = 18
+    EQ = 19
+    NE = 20
+    LT = 21
+    LE = 22
+    GT = 23
+    GE = 24
+    ASSIGN = 25
+    LPAREN = 26
+    RPAREN = 27
+    LBRACE = 28
+    RBRACE = 29
+    COMMA = 30
+    SEMICOLON = 31
+    COLON = 32
+
+
+word_kinds: dict[str, TokenKind] = {
+    'true': TokenKind.TRUE,
+    'false': TokenKind.FALSE,
+    'if': TokenKind.IF,
+    'then': TokenKind.THEN,
+    'else': TokenKind.ELSE,
+    'while': TokenKind.WHILE,
+    'do': TokenKind.DO,
+    'var': TokenKind.VAR,
+    'and': TokenKind.AND,
+    'or': TokenKind.OR,
+    'not': TokenKind.NOT,
+}
+
+symbol_kinds: dict[str, TokenKind] = {
+    '+': TokenKind.PLUS,
+    '-': TokenKind.MINUS,
+    '*': TokenKind.STAR,
+    '/': TokenKind.SLASH,
+    '%': TokenKind.PERCENT,
+    '==': TokenKind.EQ,
+    '!=': TokenKind.NE,
+    '<': TokenKind.LT,
+    '<=': TokenKind.LE,
+    '>': TokenKind.GT,
+    '>=': TokenKind.GE,
+    '=': TokenKind.ASSIGN,
+    '(': TokenKind.LPAREN,
+    ')': TokenKind.RPAREN,
+    '{': TokenKind.LBRACE,
+    '}': TokenKind.RBRACE,
+    ',': TokenKind.COMMA,
+    ';': TokenKind.SEMICOLON,
+    ':': TokenKind.COLON,
+}
+
+
+def kind_type(kind: int) -> TokenType:
+    """Returns the `Token.type` that corresponds to a token kind."""
+    if kind == TokenKind.END:
+        return 'end'
+    if kind == TokenKind.INT_LITERAL:
+        return 'int_literal'
+    if kind in (TokenKind.TRUE, TokenKind.FALSE):
+        return 'bool_literal'
+    if kind <= TokenKind.NOT:
+        return 'identifier'
+    if kind <= TokenKind.ASSIGN:
+        return 'operator'
+    return 'punctuation'
+
+
+def token_kind(token: Token) -> TokenKind:
+    """Returns the kind of a `Token` object."""
+    if token.type == 'int_literal':
+        return TokenKind.INT_LITERAL
+    if token.type == 'end':
+        return TokenKind.END
+    if token.type in ('identifier', 'bool_literal'):
+        return word_kinds.get(token.text, TokenKind.IDENTIFIER)
+    kind = symbol_kinds.get(token.text)
+    if kind is None:
+        raise Exception(f'{token.loc}: unknown {token.type} "{token.text}"')
+    return kind
+
+
+class TokenBuffer:
+    """Struct-of-arrays storage for a token stream.
+
+    Each token is a row in the parallel `kinds`, `lines`, `columns` and
+    `text_ids` columns. Token texts are interned into `strings`, and
+    `SourceLocation` objects are only built when `location` is called.
+    Indexing the buffer gives `Token` objects for code that expects
+    a `list[Token]`."""
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self.kinds = array('B')
+        self.lines = array('q')
+        self.columns = array('q')
+        self.text_ids = array('q')
+        self.strings: list[str] = []
+        self._string_ids: dict[str, int] = {}
+        self._locations: list[SourceLocation] | None = None
+
+    @staticmethod
+    def from_tokens(tokens: list[Token]) -> 'TokenBuffer':
+        """Builds a buffer from existing `Token` objects, keeping their locations."""
+        buffer = TokenBuffer(tokens[0].loc.file if tokens else '')
+        buffer._locations = [token.loc for token in tokens]
+        for token in tokens:
+            buffer.append(token_kind(token), 0, 0, token.text)
+        return buffer
+
+    def append(self, kind: int, line: int, column: int, text: str) -> None:
+        text_id = self._string_ids.get(text)
+        if text_id is None:
+            text_id = len(self.strings)
+            self._string_ids[text] = text_id
+            self.strings.append(text)
+        self.kinds.append(kind)
+        self.lines.append(line)
+        self.columns.append(column)
+        self.text_ids.append(text_id)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> Token:
+        return Token(
+            loc=self.location(index),
+            type=kind_type(self.kinds[index]),
+            text=self.text(index)
+        )
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self.kinds)):
+            yield self[index]
+
+    def tokens(self) -> list[Token]:
+        """Returns the tokens as a `list[Token]`, like `tokenize` does."""
+        return list(self)
+
+    def text(self, index: int) -> str:
+        return self.strings[self.text_ids[index]]
+
+    def location(self, index: int) -> SourceLocation:
+        if self._locations is not None:
+            return self._locations[index]
+        return SourceLocation(self.file_name, self.lines[index], self.columns[index])
+
+
 def tokenize(source_code: str, file_name: str = "file_name") -> list[Token]:
-    whitespace_re = re.compile(r'\s+')
-    integer_re = re.compile(r'[0-9]+')
-    identifier_re = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
-    operator_re = re.compile(r'==|!=|<=|>=|[-+*/=<>%]')
-    punctuation_re = re.compile(r'[(){},;:]')
-    comment_re = re.compile(r'//.*|#.*')
+    return list(iter_tokens(source_code, file_name))
+
 
+def iter_tokens(source_code: str | bytes | bytearray | mmap, file_name: str = "file_name") -> Generator[Token, None, None]:
+    """Yields the tokens of the source code one at a time.
+
+    Scans with a single combined regex, so each token costs one match
+    attempt, and computes line and column advances per whitespace run.
+    The source can also be a bytes-like object such as a memory-mapped
+    file with UTF-8 text, which is scanned like the decoded text."""
+    matches: Iterator[re.Match[Any]]
+    if isinstance(source_code, str):
+        matches = _token_re.finditer(source_code)
+    else:
+        matches = _byte_token_re.finditer(source_code)
     position = 0
     line = 0
     column = 0
-    result: list[Token] = []
 
-    def append_token(token_type: TokenType, text: str) -> None:
-        nonlocal position, column
-
-        location = SourceLocation(file_name, line, column)
-        result.append(Token(
-            loc=location,
-            type=token_type,
-            text=text
-        ))
+    for match in matches:
+        if match.start() != position:
+            break
+        kind = match.lastgroup
+        text = match.group()
+        position = match.end()
 
-        column += len(text)
-        position += len(text)
-
-    while position < len(source_code):
-        match = comment_re.match(source_code, position)
-        if match is not None:
-            position = match.end()
+        if kind == 'comment':
             continue
 
-        match = whitespace_re.match(source_code, position)
-        if match is not None:
-            whitespaces = match.group()
-            for whitespace in whitespaces:
-                if whitespace == "\n":
-                    line += 1
-                    column = 0
-                elif whitespace == "\t":
-                    column += 8
-                else:
-                    column += 1
-
-            position = match.end()
-            continue
+        if not isinstance(text, str):
+            text = text.decode()
 
-        match = identifier_re.match(source_code, position)
-        if match is not None:
-            if match.group() in ["true", "false"]:
-                append_token("bool_literal", source_code[position:match.end()])
+        if kind == 'whitespace':
+            last_newline = text.rfind('\n')
+            if last_newline >= 0:
+                line += text.count('\n')
+                column = len(text) - last_newline - 1 + 7 * text.count('\t', last_newline)
             else:
-                append_token("identifier", source_code[position:match.end()])
+                column += len(text) + 7 * text.count('\t')
             continue
 
-        match = integer_re.match(source_code, position)
-        if match is not None:
-            append_token("int_literal", source_code[position:match.end()])
-            continue
+        if kind == 'identifier' and text in _bool_literals:
+            kind = 'bool_literal'
 
-        match = operator_re.match(source_code, position)
-        if match is not None:
-            append_token("operator", source_code[position:match.end()])
-            continue
+        yield Token(
+            loc=SourceLocation(file_name, line, column),
+            type=cast(TokenType, kind),
+            text=text
+        )
+        column += len(text)
+
+    if position < len(source_code):
+        if isinstance(source_code, str):
+            near = source_code[position:(position + 10)]
+        else:
+            near = bytes(source_code[position:(position + 40)]).decode(errors='replace')[:10]
+        raise Exception(f"Tokenization failed near {near}...")
 
-        match = punctuation_re.match(source_code, position)
-        if match is not None:
-            append_token("punctuation", source_code[position:match.end()])
-            continue
-        
-        raise Exception(f"Tokenization failed near {source_code[position:(position + 10)]}...")
 
+# Sources shorter than this are not worth the cost of starting worker processes
+PARALLEL_TOKENIZE_THRESHOLD = 1 << 20
+
+_token_types: list[TokenType] = ["int_literal", "bool_literal", "identifier", "operator", "punctuation"]
+_token_type_ids = {token_type: index for index, token_type in enumerate(_token_types)}
+
+
+def tokenize_parallel(
+    source_code: str,
+    file_name: str = "file_name",
+    workers: int | None = None,
+    threshold: int = PARALLEL_TOKENIZE_THRESHOLD,
+) -> list[Token]:
+    """Like `tokenize`, but scans large sources in a process pool.
+
+    Comments end at a newline and no token spans lines, so the source
+    is split into line-aligned chunks that are scanned independently.
+    Line numbers are then shifted by the chunk's first line. The result
+    is the same as from `tokenize`, including its error message."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(source_code) < threshold:
+        return tokenize(source_code, file_name)
+
+    chunks: list[str] = []
+    first_lines: list[int] = []
+    chunk_size = len(source_code) // workers + 1
+    start = 0
+    line = 0
+    while start < len(source_code):
+        end = source_code.find('\n', start + chunk_size)
+        end = len(source_code) if end < 0 else end + 1
+        chunks.append(source_code[start:end])
+        first_lines.append(line)
+        line += source_code.count('\n', start, end)
+        start = end
+
+    result: list[Token] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for first_line, scanned in zip(first_lines, executor.map(_scan_chunk, chunks)):
+            if scanned is None:
+                # Let the sequential tokenizer report the error
+                return tokenize(source_code, file_name)
+            types, texts, lines, columns = scanned
+            for type_index, text, token_line, column in zip(types, texts, lines, columns):
+                result.append(Token(
+                    loc=SourceLocation(file_name, first_line + token_line, column),
+                    type=_token_types[type_index],
+                    text=text
+                ))
     return result
+
+
+def _scan_chunk(chunk: str) -> tuple[bytes, list[str], 'array[int]', 'array[int]'] | None:
+    """Tokenizes one chunk in a worker process. The tokens are returned
+    as columns, which are much cheaper to send back than `Token` objects."""
+    types = bytearray()
+    texts: list[str] = []
+    lines = array('q')
+    columns = array('q')
+    try:
+        for token in iter_tokens(chunk):
+            types.append(_token_type_ids[token.type])
+            texts.append(token.text)
+            lines.append(token.loc.line)
+            columns.append(token.loc.column)
+    except Exception:
+        return None
+    return bytes(types), texts, lines, columns
+
+
+def tokenize_buffer(source_code: str, file_name: str = "file_name") -> TokenBuffer:
+    """Like `tokenize`, but returns a `TokenBuffer` instead of token objects."""
+    buffer = TokenBuffer(file_name)
+    append = buffer.append
+    for token in iter_tokens(source_code, file_name):
+        append(token_kind(token), token.loc.line, token.loc.column, token.text)
+    return buffer
@@ -0,0 +1,47 @@
+from typing import Any, Generator
+
+
+# A traversal step is a generator. To visit a child, a step yields the
+# child's step and is sent the child's result. The step's return value
+# is its own result. A step may instead run a child directly with
+# `yield from`, which is faster but nests Python frames, so passes do that
+# up to `RECURSION_BUDGET` deep and yield the next step to `run`.
+Step = Generator['Step', Any, Any]
+
+
+def run(step: Step) -> Any:
+    """Runs a step and the steps it yields with an explicit stack,
+    so the nesting depth is bounded only by memory.
+
+    An exception raised by a step is thrown into the step that yielded
+    it, like in an ordinary recursive call."""
+    stack: list[Step] = []
+    value: Any = None
+    error: BaseException | None = None
+    while True:
+        try:
+            if error is not None:
+                exception, error = error, None
+                child = step.throw(exception)
+            else:
+                child = step.send(value)
+        except StopIteration as stop:
+            if not stack:
+                return stop.value
+            step = stack.pop()
+            value = stop.value
+            continue
+        except BaseException as e:
+            if not stack:
+                raise
+            step = stack.pop()
+            error = e
+            continue
+        stack.append(step)
+        step = child
+        value = None
+
+
+# How deeply the steps of a pass nest with `yield from` before the next
+# step is yielded to `run` instead, which starts it on a fresh stack
+RECURSION_BUDGET = 200
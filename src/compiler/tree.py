@@ -0,0 +1,75 @@
+from operator import attrgetter
+from typing import Any, Callable, Protocol, Sequence, TypeVar
+from compiler import ast
+from compiler.tokenizer import SourceLocation
+from compiler.types import Type
+
+
+N = TypeVar('N')
+
+
+class Tree(Protocol[N]):
+    """Access to the nodes of an AST, whatever they are stored as.
+
+    The type checker, the interpreter and the IR generator walk a tree
+    through these methods, so the same code runs on `ast` nodes, through
+    `nodes`, and on the node indices of an `Arena`. Each method reads the
+    field of the same name in the `ast` class of the node, and `kind`
+    tells which class that is, as an `ast.NodeKind`."""
+
+    def kind(self, node: N) -> int: ...
+    def location(self, node: N) -> SourceLocation: ...
+    def type(self, node: N) -> Type: ...
+    def set_type(self, node: N, t: Type) -> None: ...
+    def literal_value(self, node: N) -> int | bool | None: ...
+    def name(self, node: N) -> str: ...
+    def op(self, node: N) -> str: ...
+    def left(self, node: N) -> N: ...
+    def right(self, node: N) -> N: ...
+    def expr(self, node: N) -> N: ...
+    def cond(self, node: N) -> N: ...
+    def then_clause(self, node: N) -> N: ...
+    def else_clause(self, node: N) -> N | None: ...
+    def do_clause(self, node: N) -> N: ...
+    def arguments(self, node: N) -> Sequence[N]: ...
+    def value(self, node: N) -> N: ...
+    def declared_type(self, node: N) -> str | None: ...
+    def address(self, node: N) -> tuple[int, int] | None: ...
+    def slot(self, node: N) -> int | None: ...
+    def frame_size(self, node: N) -> int | None: ...
+    def to_ast(self, node: N) -> ast.Expression: ...
+
+
+class NodeTree:
+    """The `Tree` of `ast` nodes. The fields are read with `attrgetter`,
+    which is faster than calling a method."""
+    __slots__ = ()
+
+    kind: Callable[[ast.Expression], int] = attrgetter('kind')
+    location: Callable[[ast.Expression], SourceLocation] = attrgetter('location')
+    type: Callable[[ast.Expression], Type] = attrgetter('type')
+    literal_value: Callable[[Any], int | bool | None] = attrgetter('value')
+    name: Callable[[Any], str] = attrgetter('name')
+    op: Callable[[Any], str] = attrgetter('op')
+    left: Callable[[Any], ast.Expression] = attrgetter('left')
+    right: Callable[[Any], ast.Expression] = attrgetter('right')
+    expr: Callable[[Any], ast.Expression] = attrgetter('expr')
+    cond: Callable[[Any], ast.Expression] = attrgetter('cond')
+    then_clause: Callable[[Any], ast.Expression] = attrgetter('then_clause')
+    else_clause: Callable[[Any], ast.Expression | None] = attrgetter('else_clause')
+    do_clause: Callable[[Any], ast.Expression] = attrgetter('do_clause')
+    arguments: Callable[[Any], list[ast.Expression]] = attrgetter('arguments')
+    value: Callable[[Any], ast.Expression] = attrgetter('value')
+    declared_type: Callable[[Any], str | None] = attrgetter('declared_type')
+    address: Callable[[Any], tuple[int, int] | None] = attrgetter('address')
+    slot: Callable[[Any], int | None] = attrgetter('slot')
+    frame_size: Callable[[Any], int | None] = attrgetter('frame_size')
+
+    def set_type(self, node: ast.Expression, t: Type) -> None:
+        node.type = t
+
+    def to_ast(self, node: ast.Expression) -> ast.Expression:
+        return node
+
+
+nodes = NodeTree()
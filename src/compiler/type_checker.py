@@ -1,119 +1,259 @@
-
-from compiler import ast
+from compiler import ast, trampoline
+from compiler.arena import Arena
+from compiler.ast import NodeKind
+from compiler.hash_cons import TypeMemo
 from compiler.symtab import SymTab, UNDEFINED
+from compiler.trampoline import Step
 from compiler.types import Bool, Int, Unit, Type
-from typing import Any
-
-
-def typecheck(node: ast.Expression, symtab: SymTab) -> Type:
-
-    def check(node: ast.Expression) -> Type:
-        match node:
-            case ast.Literal():
-                if isinstance(node.value, bool):
-                    return Bool
-                elif isinstance(node.value, int):
-                    return Int
-                elif node.value is None:
-                    return Unit
-                else:
-                    raise Exception(f"Don't know type of literal: {node.value}")
-
-            case ast.BinaryOp():
-                t1 = typecheck(node.left, symtab)
-                t2 = typecheck(node.right, symtab)
-
-                if node.op in ['==', '!=']:
-                    if t1 != t2:
-                        raise Exception(f"Operator '{node.op} had different types: {t1} and {t2}")
-                    return Bool
-
-                elif node.op == '=':
-                    if t1 != t2:
-                        raise Exception(f"Operator '{node.op} had different types: {t1} and {t2}")
-                    elif not isinstance(node.left, ast.Identifier):
-                        raise Exception("Left of assignment must be an identifier")
-                    name = node.left.name
-                    scope = symtab.find_scope(name)
-                    if scope is UNDEFINED:
-                        raise Exception(f'Variable "{name}" is not set')
-                    scope.set(name, t2)
-                    return t2
-
-                binaryop = symtab.get(node.op)
-                if binaryop is UNDEFINED:
-                    raise Exception(f"Unknown operator: {node.op}")
-                elif t1 != binaryop.arg_types[0] or t2 != binaryop.arg_types[1]:
-                    raise Exception(f"Unexpected types with operator '{node.op}', got '{t1}' and '{t2}'")
-
-                return binaryop.return_type
-
-            case ast.UnaryOp():
-                type = typecheck(node.expr, symtab)
-                unaryop = symtab.get(f'unary_{node.op}')
-                if type != unaryop.arg_types[0]:
-                    raise Exception(f"Unary operator '{node.op}' expected type '{unaryop.arg_types[0]}', got '{type}'")
-                return type
-
-            case ast.VarDeclaration():
-                if symtab.get_local(node.name) is not UNDEFINED:
-                    raise Exception(f"Value for '{node.name}' already exists")
-
-                actual_type = typecheck(node.value, symtab)
-                if node.declared_type is not None:
-                    types = {'Int': Int, 'Bool': Bool, 'Unit': Unit}
-                    declared_type = types.get(node.declared_type)
-                    if declared_type is None:
-                        raise Exception(f"Unknown declaration type '{node.declared_type}' to '{node.name}'")
-                    if actual_type != declared_type:
-                        raise Exception(f"Declared '{node.name}' as type '{declared_type}' but it was '{actual_type}'")
-
-                symtab.set(node.name, actual_type)
-                return Unit
-
-            case ast.Identifier():
-                type = symtab.get(node.name)
-                if type is UNDEFINED:
-                    raise Exception(f"Variable '{node.name}' is not set")
-                return type
-
-            case ast.Block():
-                inner_scope = SymTab(parent=symtab)
-                return_type: Any = Unit
-                for argument in node.arguments:
-                    return_type = typecheck(argument, inner_scope)
-                return return_type
-
-            case ast.IfExpression():
-                t1 = typecheck(node.cond, symtab)
-                if t1 is not Bool:
-                    raise Exception(f"'if' condition was '{t1}'")
-                t2 = typecheck(node.then_clause, symtab)
-                if node.else_clause is None:
-                    return Unit
-                t3 = typecheck(node.else_clause, symtab)
-                if t2 != t3:
-                    raise Exception(f"'then' and 'else' had different types: {t2} and {t3}")
-                return t2
-
-            case ast.WhileExpression():
-                cond_type = typecheck(node.cond, symtab)
-                if cond_type is not Bool:
-                    raise Exception(f"'while' condition was '{cond_type}'")
-                return Unit
-
-            case ast.FunctionCall():
-                func = symtab.get(node.name)
-                if func is UNDEFINED:
-                    raise Exception(f"Function '{node.name}' is not defined")
-                expected_args = func.arg_types
-                given_args = [typecheck(arg, symtab) for arg in node.arguments]
-                if expected_args != given_args:
-                    raise Exception(f"Unexpected argument type in '{node.name}'")
-                return func.return_type
-
-            case _:
-                raise Exception(f"Unsupported AST node: {node}")
-
-    node.type = check(node)
-    return node.type
+from compiler.tree import N, Tree, nodes
+from typing import Any, Callable, cast
+
+
+_declared_types = {'Int': Int, 'Bool': Bool, 'Unit': Unit}
+_equality_operators = frozenset(['==', '!='])
+
+
+def typecheck(node: ast.Expression, symtab: SymTab, memo: TypeMemo | None = None) -> Type:
+    """Typechecks the AST and sets the types of its nodes.
+
+    With a `TypeMemo`, each copy of a repeated subtree is checked only
+    once for the same types of the names it uses. Parts nested deeper
+    than the recursion budget are checked with an explicit stack."""
+    return trampoline.run(_typecheck(nodes, node, symtab, memo, 0))
+
+
+def typecheck_arena(arena: Arena, node: int, symtab: SymTab) -> Type:
+    """Like `typecheck`, but walks an arena AST by node index
+    and stores the types in the arena's type column."""
+    return trampoline.run(_typecheck(arena, node, symtab, None, 0))
+
+
+def _typecheck(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    if depth > trampoline.RECURSION_BUDGET:
+        return (yield _typecheck(tree, node, symtab, memo, 0))
+    depth += 1
+
+    # The memo is only given with `ast` nodes
+    key = None
+    if memo is not None:
+        key = memo.key(cast(ast.Expression, node), symtab)
+        if key is not None:
+            known_type = memo.lookup(key, cast(ast.Expression, node))
+            if known_type is not None:
+                return known_type
+
+    kind = tree.kind(node)
+    t: Type
+    leaf_handler = _leaf_handlers.get(kind)
+    if leaf_handler is not None:
+        t = leaf_handler(tree, node, symtab)
+    else:
+        handler = _handlers.get(kind)
+        if handler is None:
+            raise Exception(f"Unsupported AST node: {tree.to_ast(node)}")
+        t = yield from handler(tree, node, symtab, memo, depth)
+    tree.set_type(node, t)
+
+    if memo is not None and key is not None:
+        memo.store(key, cast(ast.Expression, node))
+    return t
+
+
+# === Type rules ===
+# The rules get the types of the children and raise the errors of the
+# checker. They are also used by `ir_generator.typecheck_and_generate_ir`,
+# which finds the types of names from their IR variables.
+
+def literal_type(value: int | bool | None) -> Type:
+    if isinstance(value, bool):
+        return Bool
+    elif isinstance(value, int):
+        return Int
+    elif value is None:
+        return Unit
+    else:
+        raise Exception(f"Don't know type of literal: {value}")
+
+
+def identifier_type(name: str, type: Any) -> Type:
+    if type is UNDEFINED:
+        raise Exception(f"Variable '{name}' is not set")
+    return cast(Type, type)
+
+
+def assignment_type(t1: Type, t2: Type, left_is_identifier: bool) -> Type:
+    if t1 != t2:
+        raise Exception(f"Operator '= had different types: {t1} and {t2}")
+    elif not left_is_identifier:
+        raise Exception("Left of assignment must be an identifier")
+    return t2
+
+
+def binary_op_type(op: str, binaryop: Any, t1: Type, t2: Type) -> Type:
+    """The type of `t1 op t2`, where `binaryop` is the type of `op`
+    in the symbol table"""
+    if op in _equality_operators:
+        if t1 != t2:
+            raise Exception(f"Operator '{op} had different types: {t1} and {t2}")
+        return Bool
+    if binaryop is UNDEFINED:
+        raise Exception(f"Unknown operator: {op}")
+    elif t1 != binaryop.arg_types[0] or t2 != binaryop.arg_types[1]:
+        raise Exception(f"Unexpected types with operator '{op}', got '{t1}' and '{t2}'")
+    return cast(Type, binaryop.return_type)
+
+
+def unary_op_type(op: str, unaryop: Any, type: Type) -> Type:
+    if type != unaryop.arg_types[0]:
+        raise Exception(f"Unary operator '{op}' expected type '{unaryop.arg_types[0]}', got '{type}'")
+    return type
+
+
+def check_not_declared(name: str, declared: Any) -> None:
+    if declared is not UNDEFINED:
+        raise Exception(f"Value for '{name}' already exists")
+
+
+def check_declared_type(name: str, declared_name: str | None, actual_type: Type) -> None:
+    if declared_name is not None:
+        declared_type = _declared_types.get(declared_name)
+        if declared_type is None:
+            raise Exception(f"Unknown declaration type '{declared_name}' to '{name}'")
+        if actual_type != declared_type:
+            raise Exception(f"Declared '{name}' as type '{declared_type}' but it was '{actual_type}'")
+
+
+def check_condition(keyword: str, type: Type) -> None:
+    if type is not Bool:
+        raise Exception(f"'{keyword}' condition was '{type}'")
+
+
+def if_type(then_type: Type, else_type: Type) -> Type:
+    if then_type != else_type:
+        raise Exception(f"'then' and 'else' had different types: {then_type} and {else_type}")
+    return then_type
+
+
+def parameter_types(name: str, func: Any) -> tuple[Type, ...]:
+    """The parameter types of the function that `name` refers to. They
+    are needed before the arguments are checked."""
+    if func is UNDEFINED:
+        raise Exception(f"Function '{name}' is not defined")
+    return cast(tuple[Type, ...], func.arg_types)
+
+
+def call_type(name: str, func: Any, expected_args: tuple[Type, ...], given_args: list[Type]) -> Type:
+    if expected_args != tuple(given_args):
+        raise Exception(f"Unexpected argument type in '{name}'")
+    return cast(Type, func.return_type)
+
+
+# === Checking ===
+
+def _check_literal(tree: Tree[N], node: N, symtab: SymTab) -> Type:
+    return literal_type(tree.literal_value(node))
+
+
+def _check_identifier(tree: Tree[N], node: N, symtab: SymTab) -> Type:
+    address = tree.address(node)
+    if address is not None:
+        type = symtab.get_slot(address)
+    else:
+        type = symtab.get(tree.name(node))
+    return identifier_type(tree.name(node), type)
+
+
+def _check_binary_op(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    op = tree.op(node)
+    left = tree.left(node)
+    t1 = yield from _typecheck(tree, left, symtab, memo, depth)
+    t2 = yield from _typecheck(tree, tree.right(node), symtab, memo, depth)
+
+    if op == '=':
+        assignment_type(t1, t2, tree.kind(left) == NodeKind.IDENTIFIER)
+        address = tree.address(left)
+        if address is not None:
+            symtab.set_slot(address, t2)
+            return t2
+        name = tree.name(left)
+        scope = symtab.find_scope(name)
+        if scope is UNDEFINED:
+            raise Exception(f'Variable "{name}" is not set')
+        scope.set(name, t2)
+        return t2
+
+    return binary_op_type(op, symtab.get(op), t1, t2)
+
+
+def _check_unary_op(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    op = tree.op(node)
+    type = yield from _typecheck(tree, tree.expr(node), symtab, memo, depth)
+    return unary_op_type(op, symtab.get(f'unary_{op}'), type)
+
+
+def _check_var_declaration(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    name = tree.name(node)
+    slot = tree.slot(node)
+    check_not_declared(name, symtab.get_local(name) if slot is None else symtab.slots[slot])
+
+    actual_type = yield from _typecheck(tree, tree.value(node), symtab, memo, depth)
+    check_declared_type(name, tree.declared_type(node), actual_type)
+
+    if slot is not None:
+        symtab.slots[slot] = actual_type
+    else:
+        symtab.set(name, actual_type)
+    return Unit
+
+
+def _check_block(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    inner_scope = SymTab.for_block(symtab, tree.frame_size(node))
+    return_type: Any = Unit
+    for argument in tree.arguments(node):
+        return_type = yield from _typecheck(tree, argument, inner_scope, memo, depth)
+    return return_type
+
+
+def _check_if_expression(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    t1 = yield from _typecheck(tree, tree.cond(node), symtab, memo, depth)
+    check_condition('if', t1)
+    t2 = yield from _typecheck(tree, tree.then_clause(node), symtab, memo, depth)
+    else_clause = tree.else_clause(node)
+    if else_clause is None:
+        return Unit
+    t3 = yield from _typecheck(tree, else_clause, symtab, memo, depth)
+    return if_type(t2, t3)
+
+
+def _check_while_expression(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    cond_type = yield from _typecheck(tree, tree.cond(node), symtab, memo, depth)
+    check_condition('while', cond_type)
+    return Unit
+
+
+def _check_function_call(tree: Tree[N], node: N, symtab: SymTab, memo: TypeMemo | None, depth: int) -> Step:
+    name = tree.name(node)
+    address = tree.address(node)
+    func = symtab.get(name) if address is None else symtab.get_slot(address)
+    expected_args = parameter_types(name, func)
+    given_args = []
+    for arg in tree.arguments(node):
+        given_args.append((yield from _typecheck(tree, arg, symtab, memo, depth)))
+    return call_type(name, func, expected_args, given_args)
+
+
+# Literals and identifiers have no children and are checked without a step
+_leaf_handlers: dict[int, Callable[[Any, Any, SymTab], Type]] = {
+    NodeKind.LITERAL: _check_literal,
+    NodeKind.IDENTIFIER: _check_identifier,
+}
+
+_handlers: dict[int, Callable[[Any, Any, SymTab, TypeMemo | None, int], Step]] = {
+    NodeKind.BINARY_OP: _check_binary_op,
+    NodeKind.UNARY_OP: _check_unary_op,
+    NodeKind.VAR_DECLARATION: _check_var_declaration,
+    NodeKind.BLOCK: _check_block,
+    NodeKind.IF_EXPRESSION: _check_if_expression,
+    NodeKind.WHILE_EXPRESSION: _check_while_expression,
+    NodeKind.FUNCTION_CALL: _check_function_call,
+}
@@ -1,22 +1,57 @@
-
 from dataclasses import dataclass
+from typing import Any, Iterable
+
 
+# Every distinct type, keyed by its class and fields
+_interned: dict[tuple[Any, ...], 'Type'] = {}
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, eq=False, init=False)
 class Type:
-    """Base class for types"""
+    """Base class for types
+
+    Types are interned: constructing a type equal to an existing one
+    returns the existing object. Equality and hashing are by identity."""
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False, init=False)
 class BasicType(Type):
     name: str
 
+    def __new__(cls, name: str) -> 'BasicType':
+        key = (cls, name)
+        t = _interned.get(key)
+        if t is None:
+            t = object.__new__(cls)
+            object.__setattr__(t, 'name', name)
+            _interned[key] = t
+        assert isinstance(t, BasicType)
+        return t
 
-@dataclass(frozen=True)
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (BasicType, (self.name,))
+
+
+@dataclass(frozen=True, eq=False, init=False)
 class FunType(Type):
-    arg_types: list[Type]
+    arg_types: tuple[Type, ...]
     return_type: Type
 
+    def __new__(cls, arg_types: Iterable[Type], return_type: Type) -> 'FunType':
+        arg_types = tuple(arg_types)
+        key = (cls, arg_types, return_type)
+        t = _interned.get(key)
+        if t is None:
+            t = object.__new__(cls)
+            object.__setattr__(t, 'arg_types', arg_types)
+            object.__setattr__(t, 'return_type', return_type)
+            _interned[key] = t
+        assert isinstance(t, FunType)
+        return t
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (FunType, (self.arg_types, self.return_type))
+
 
 Int = BasicType('Int')
 Bool = BasicType('Bool')
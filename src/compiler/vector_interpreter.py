@@ -0,0 +1,349 @@
+from dataclasses import dataclass
+from typing import Any
+from compiler import ast
+from compiler.interpreter import Value, interpret
+from compiler.io_context import IOContext
+from compiler.resolver import resolve
+from compiler.symtab import build_interpreter_symtab, UNDEFINED
+
+
+# Nesting depth evaluated on the arrays. Deeper programs are run by
+# `interpret` lane by lane, which continues with an explicit stack.
+_RECURSION_BUDGET = 200
+
+
+class _TooDeep(Exception):
+    pass
+
+
+@dataclass
+class LaneResult:
+    """The result of running the program on one input vector:
+    what `interpret` returns, prints and raises."""
+    value: Value
+    output: str
+    error: Exception | None = None
+
+
+def interpret_lanes(node: ast.Expression, inputs: list[list[int]]) -> list[LaneResult]:
+    """Runs the program once for each input vector, whose numbers are
+    what `read_int` returns, and returns the result of each run.
+
+    All runs ("lanes") are interpreted together. Each value is a NumPy
+    array with an element per lane, so every node is evaluated once for
+    all lanes. Where lanes take different branches of an `if` or exit a
+    `while` at different times, a mask of the active lanes decides which
+    lanes a branch, an assignment or a print applies to.
+
+    A lane that does something the arrays cannot represent like
+    `interpret` does, such as an integer overflowing 64 bits, a division
+    by zero or reading past its input, leaves the arrays and is run
+    again on its own with `interpret`, so every result is exactly what
+    `interpret` gives. Requires NumPy."""
+    import numpy as np  # type: ignore[import-not-found, unused-ignore]
+
+    resolve(node)
+    lanes = _Lanes(np, inputs)
+    try:
+        value = lanes.eval(node, _Frame(None, 0), lanes.alive.copy(), 0)
+    except _TooDeep:
+        lanes.eject(lanes.alive)
+        value = None
+
+    results = []
+    for lane, lane_inputs in enumerate(inputs):
+        if lanes.alive[lane]:
+            results.append(LaneResult(_lane_value(value, lane), ''.join(lanes.outputs[lane])))
+        else:
+            results.append(_interpret_lane(node, lane_inputs))
+    return results
+
+
+def _lane_value(value: Any, lane: int) -> Value:
+    if value is None:
+        return None
+    result: Value = value[lane].item()
+    return result
+
+
+def _interpret_lane(node: ast.Expression, inputs: list[int]) -> LaneResult:
+    """Runs one input vector with `interpret`."""
+    io = IOContext(inputs, capture=True)
+    try:
+        value = interpret(node, build_interpreter_symtab(io))
+    except Exception as e:
+        return LaneResult(None, io.captured_output(), e)
+    return LaneResult(value, io.captured_output())
+
+
+class _Frame:
+    """The variables of a block, one array per slot"""
+
+    def __init__(self, parent: '_Frame | None', size: int) -> None:
+        self.parent = parent
+        self.slots: list[Any] = [UNDEFINED] * size
+
+    def scope(self, depth: int) -> '_Frame':
+        frame = self
+        for _ in range(depth):
+            assert frame.parent is not None
+            frame = frame.parent
+        return frame
+
+
+class _Lanes:
+    def __init__(self, np: Any, inputs: list[list[int]]) -> None:
+        self.np = np
+        count = len(inputs)
+        # Lanes that have not been ejected to run with `interpret`
+        self.alive = np.ones(count, dtype=bool)
+        self.outputs: list[list[str]] = [[] for _ in inputs]
+        # Variables declared outside all blocks
+        self.root_variables: dict[str, Any] = {}
+        # The inputs as a matrix padded with zeros, and the next input of each lane
+        width = max((len(lane_inputs) for lane_inputs in inputs), default=0)
+        self.input_counts = np.array([len(lane_inputs) for lane_inputs in inputs], dtype=np.int64)
+        self.input_matrix = np.zeros((count, max(width, 1)), dtype=np.int64)
+        for lane, lane_inputs in enumerate(inputs):
+            for index, number in enumerate(lane_inputs):
+                if not -2**63 <= number < 2**63:
+                    # Ejected when it is read
+                    self.input_counts[lane] = min(self.input_counts[lane], index)
+                    break
+                self.input_matrix[lane, index] = number
+        self.input_positions = np.zeros(count, dtype=np.int64)
+        self.min_int = np.int64(-2**63)
+
+    def eject(self, lanes: Any) -> None:
+        """Stops running the lanes, so they run with `interpret` instead."""
+        self.alive &= ~lanes
+
+    def full(self, value: int | bool) -> Any:
+        np = self.np
+        return np.full(len(self.alive), value, dtype=bool if isinstance(value, bool) else np.int64)
+
+    def eval(self, node: ast.Expression, frame: _Frame, mask: Any, depth: int) -> Any:
+        """Evaluates the node in the lanes of the mask. The values of the
+        other lanes in the result are unspecified."""
+        if depth > _RECURSION_BUDGET:
+            raise _TooDeep()
+        depth += 1
+        np = self.np
+
+        match node:
+            case ast.Literal():
+                if node.value is None:
+                    return None
+                if isinstance(node.value, int) and not isinstance(node.value, bool) \
+                        and not -2**63 <= node.value < 2**63:
+                    self.eject(mask)
+                    return self.full(0)
+                return self.full(node.value)
+
+            case ast.Identifier():
+                if node.address is not None:
+                    value = frame.scope(node.address[0]).slots[node.address[1]]
+                else:
+                    value = self.root_variables.get(node.name, UNDEFINED)
+                if value is UNDEFINED:
+                    # Not set, or a built-in function
+                    self.eject(mask)
+                    return self.full(0)
+                return value
+
+            case ast.BinaryOp() if node.op == '=':
+                if not isinstance(node.left, ast.Identifier):
+                    self.eject(mask)
+                    return None
+                value = self.eval(node.right, frame, mask, depth)
+                if node.left.address is not None:
+                    scope = frame.scope(node.left.address[0])
+                    slot = node.left.address[1]
+                    scope.slots[slot] = self.merge(mask, value, scope.slots[slot])
+                elif node.left.name in self.root_variables:
+                    self.root_variables[node.left.name] = self.merge(
+                        mask, value, self.root_variables[node.left.name])
+                else:
+                    self.eject(mask)
+                return value
+
+            case ast.BinaryOp() if node.op in ('and', 'or'):
+                left = self.eval(node.left, frame, mask, depth)
+                if not self.has_type(mask, bool, left):
+                    return self.full(False)
+                # The right operand is evaluated only where it decides the result
+                right_mask = mask & (left if node.op == 'and' else ~left) & self.alive
+                if not right_mask.any():
+                    return left
+                right = self.eval(node.right, frame, right_mask, depth)
+                if not self.has_type(right_mask, bool, right):
+                    return left
+                if node.op == 'and':
+                    return left & right
+                return left | right
+
+            case ast.BinaryOp():
+                left = self.eval(node.left, frame, mask, depth)
+                right = self.eval(node.right, frame, mask, depth)
+                return self.binary_op(node.op, left, right, mask)
+
+            case ast.UnaryOp():
+                value = self.eval(node.expr, frame, mask, depth)
+                if node.op == 'not':
+                    return ~value if self.has_type(mask, bool, value) else self.full(False)
+                if not self.has_type(mask, int, value):
+                    return self.full(0)
+                self.eject(mask & (value == self.min_int))
+                return -value
+
+            case ast.VarDeclaration():
+                value = self.eval(node.value, frame, mask, depth)
+                if node.slot is None:
+                    if node.name in self.root_variables:
+                        self.eject(mask)
+                    self.root_variables[node.name] = value
+                else:
+                    if frame.slots[node.slot] is not UNDEFINED:
+                        # Declared twice in the block
+                        self.eject(mask)
+                    frame.slots[node.slot] = value
+                return None
+
+            case ast.IfExpression():
+                cond = self.truth(self.eval(node.cond, frame, mask, depth))
+                then_mask = mask & cond & self.alive
+                else_mask = mask & ~cond & self.alive
+                then_value = self.eval(node.then_clause, frame, then_mask, depth) if then_mask.any() else None
+                if node.else_clause is None:
+                    return None
+                else_value = self.eval(node.else_clause, frame, else_mask, depth) if else_mask.any() else None
+                if then_value is None:
+                    return else_value
+                if else_value is None:
+                    return then_value
+                return np.where(cond, then_value, else_value)
+
+            case ast.WhileExpression():
+                loop_mask = mask
+                while True:
+                    cond = self.truth(self.eval(node.cond, frame, loop_mask, depth))
+                    loop_mask = loop_mask & cond & self.alive
+                    if not loop_mask.any():
+                        return None
+                    self.eval(node.do_clause, frame, loop_mask, depth)
+
+            case ast.Block():
+                inner = _Frame(frame, node.frame_size or 0)
+                result = None
+                for argument in node.arguments:
+                    result = self.eval(argument, inner, mask, depth)
+                return result
+
+            case ast.FunctionCall():
+                return self.call(node, frame, mask, depth)
+
+            case _:
+                raise Exception(f'Unsupported AST node: {node}')
+
+    def merge(self, mask: Any, value: Any, old: Any) -> Any:
+        """The value in the lanes of the mask and the old value elsewhere"""
+        if old is UNDEFINED or old is None or value is None:
+            return value
+        return self.np.where(mask, value, old)
+
+    def has_type(self, mask: Any, expected: type, *values: Any) -> bool:
+        """Whether the values are all Int or all Bool arrays. Otherwise the
+        lanes of the mask are ejected, since `interpret` would compute with
+        Python's rules for mixed types, or fail."""
+        dtype = self.np.bool_ if expected is bool else self.np.int64
+        if all(value is not None and value.dtype == dtype for value in values):
+            return True
+        self.eject(mask)
+        return False
+
+    def truth(self, value: Any) -> Any:
+        """The truth value of a condition in each lane"""
+        if value is None:
+            return self.full(False)
+        return value != 0
+
+    def binary_op(self, op: str, left: Any, right: Any, mask: Any) -> Any:
+        np = self.np
+        if left is None or right is None:
+            if op in ('==', '!='):
+                # Unit values are all equal
+                return self.full((left is right) == (op == '=='))
+            self.eject(mask)
+            return self.full(0)
+        if op == '==':
+            return left == right
+        if op == '!=':
+            return left != right
+        if op == '<':
+            return left < right
+        if op == '<=':
+            return left <= right
+        if op == '>':
+            return left > right
+        if op == '>=':
+            return left >= right
+
+        if not self.has_type(mask, int, left, right):
+            return self.full(0)
+        with np.errstate(over='ignore'):
+            if op == '+':
+                result = left + right
+                # Overflowed if the result's sign differs from both operands'
+                self.eject(mask & (((left ^ result) & (right ^ result)) < 0))
+                return result
+            if op == '-':
+                result = left - right
+                self.eject(mask & (((left ^ right) & (left ^ result)) < 0))
+                return result
+            if op == '*':
+                result = left * right
+                nonzero_left = np.where(left == 0, 1, left)
+                overflow = (left != 0) & (result // nonzero_left != right)
+                overflow |= ((left == -1) & (right == self.min_int)) | ((right == -1) & (left == self.min_int))
+                self.eject(mask & overflow)
+                return result
+            if op in ('/', '%'):
+                # Division by zero and the one overflowing division are left
+                # to `interpret`, and the other lanes divide by one instead
+                invalid = (right == 0) | ((right == -1) & (left == self.min_int))
+                self.eject(mask & invalid)
+                divisor = np.where(invalid, 1, right)
+                # NumPy rounds down and takes the sign of the divisor like Python
+                return left // divisor if op == '/' else left % divisor
+        self.eject(mask)
+        return self.full(0)
+
+    def call(self, node: ast.FunctionCall, frame: _Frame, mask: Any, depth: int) -> Any:
+        np = self.np
+        arguments = [self.eval(argument, frame, mask, depth) for argument in node.arguments]
+        if node.address is not None or node.name in self.root_variables:
+            # Calling a variable
+            self.eject(mask)
+            return None
+        active = np.flatnonzero(mask & self.alive)
+
+        if node.name in ('print_int', 'print_bool') and len(arguments) == 1 and arguments[0] is not None:
+            values = arguments[0][active].tolist()
+            for lane, value in zip(active.tolist(), values):
+                if node.name == 'print_int':
+                    self.outputs[lane].append(f'{value}\n')
+                else:
+                    self.outputs[lane].append('true\n' if value else 'false\n')
+            return None
+
+        if node.name == 'read_int' and len(arguments) == 0:
+            exhausted = mask & (self.input_positions >= self.input_counts)
+            self.eject(exhausted)
+            reading = mask & ~exhausted
+            positions = np.minimum(self.input_positions, self.input_matrix.shape[1] - 1)
+            value = self.input_matrix[np.arange(len(positions)), positions]
+            self.input_positions += reading
+            return value
+
+        self.eject(mask)
+        return None
@@ -0,0 +1,169 @@
+from compiler.arena import NodeKind, build_arena, dump, load
+from compiler.tokenizer import tokenize, SourceLocation
+from compiler.parser import parse
+from compiler.resolver import resolve
+from compiler.type_checker import typecheck, typecheck_arena
+from compiler.interpreter import interpret, interpret_arena
+from compiler.ir_generator import generate_ir, generate_ir_arena
+from compiler.symtab import build_type_symtab, build_interpreter_symtab, build_ir_dict
+from compiler.types import Bool, Int
+from compiler import ast
+from typing import Callable
+import pytest
+import time
+
+
+programs = [
+    '1 + 2 * 3',
+    'var x: Int = 10; var y = x > 3 and not false; if y then x = x - 1 else x; x',
+    'var i = 0; var s = 0; while i < 5 do { s = s + i; i = i + 1 }; s',
+    '{ var a = 1; { var a = true; a } }',
+    'print_int(-12345678901234567890123); print_bool(1 != 2);',
+    'var x = 1; if x == 1 then { x = 2 }',
+]
+
+
+def test_arena_round_trip() -> None:
+    for code in programs:
+        node = parse(tokenize(code))
+        arena, root = build_arena(node)
+        assert repr(arena.to_ast(root)) == repr(node)
+
+    node = parse(tokenize('\n  f(a, 2)'))
+    arena, root = build_arena(node)
+    assert arena.kinds[root] == NodeKind.FUNCTION_CALL
+    assert arena.name(root) == 'f'
+    assert [arena.kinds[c] for c in arena.arguments(root)] == [NodeKind.IDENTIFIER, NodeKind.LITERAL]
+    assert arena.location(root) == SourceLocation('file_name', 1, 2)
+    assert arena.files == ['file_name']
+
+    # Deep ASTs are copied without recursion
+    node = parse(tokenize('{ ' * 3000 + '1 + 2' + ' }' * 3000))
+    arena, root = build_arena(node)
+    assert dump(arena.to_ast(root)) == dump(node)
+
+
+def test_arena_stages() -> None:
+    for code in programs:
+        node = parse(tokenize(code))
+        arena, root = build_arena(node)
+        assert typecheck_arena(arena, root, build_type_symtab()) == typecheck(node, build_type_symtab())
+        assert repr(arena.to_ast(root)) == repr(node)
+
+        ir_lines = [str(ins) for ins in generate_ir(build_ir_dict(), node)]
+        assert [str(ins) for ins in generate_ir_arena(build_ir_dict(), arena, root)] == ir_lines
+
+        if 'print' not in code:
+            assert interpret_arena(arena, root, build_interpreter_symtab()) == interpret(node, build_interpreter_symtab())
+
+    arena, root = build_arena(parse(tokenize('var a = 1; a + true')))
+    with pytest.raises(Exception):
+        typecheck_arena(arena, root, build_type_symtab())
+
+    arena, root = build_arena(parse(tokenize('1 < 2')))
+    assert typecheck_arena(arena, root, build_type_symtab()) == Bool
+    assert arena.type(root) == Bool
+    assert arena.type(arena.left(root)) == Int
+
+
+def test_arena_deep_programs() -> None:
+    deep_programs = [
+        '1' + ' + 1' * 2000,
+        '- ' * 3000 + '3',
+        '{ ' * 3000 + '1 + 2' + ' }' * 3000,
+        'var x = 0; ' + 'x = ' * 3000 + '4; x',
+        'var n = 0; while n < 3 do ' + '{' * 3000 + 'n = n + 1' + '}' * 3000 + '; n',
+    ]
+    for code in deep_programs:
+        node = parse(tokenize(code))
+        arena, root = build_arena(node)
+        assert typecheck_arena(arena, root, build_type_symtab()) == typecheck(node, build_type_symtab())
+        ir_lines = [str(ins) for ins in generate_ir(build_ir_dict(), node)]
+        assert [str(ins) for ins in generate_ir_arena(build_ir_dict(), arena, root)] == ir_lines
+        assert interpret_arena(arena, root, build_interpreter_symtab()) == interpret(node, build_interpreter_symtab())
+
+
+def test_dump_and_load() -> None:
+    for code in programs:
+        node = parse(tokenize(code))
+        typecheck(node, build_type_symtab())
+        arena, root = load(dump(node))
+        loaded = arena.to_ast(root)
+        assert loaded == node
+        assert repr(loaded) == repr(node)
+
+    node = parse(tokenize('if true then ' * 3000 + '3 else 4'))
+    typecheck(node, build_type_symtab())
+    data = dump(node)
+    arena, root = load(data)
+    assert dump(arena.to_ast(root)) == data
+
+    node = parse(tokenize('print_int'))
+    typecheck(node, build_type_symtab())
+    arena, root = load(dump(node))
+    assert arena.type(root) == node.type
+    assert arena.to_ast(root).type == node.type
+
+    node = ast.Identifier(SourceLocation('other', -1, 2**40), 'x')
+    arena, root = load(dump(node))
+    assert arena.to_ast(root) == node
+
+    # Nodes can be added to a loaded arena, whose columns are narrow
+    arena, root = load(dump(parse(tokenize('{ var x = 1; x }'))))
+    added = arena.from_ast(parse(tokenize(f'100000 + {2**40}')))
+    assert arena.to_ast(added) == parse(tokenize(f'100000 + {2**40}'))
+    assert arena.to_ast(root) == parse(tokenize('{ var x = 1; x }'))
+
+    data = dump(parse(tokenize('1')))
+    with pytest.raises(Exception):
+        load(b'XXXX' + data[4:])
+    with pytest.raises(Exception):
+        load(data[:4] + b'\xff\xff' + data[6:])
+
+
+def test_dump_keeps_resolved_addresses() -> None:
+    code = 'var x = 1; var print_int = print_bool; { var y = x; { x = y + x; print_int(x > 1) }; y }'
+    node = parse(tokenize(code))
+    resolve(node)
+    arena, root = load(dump(node))
+    loaded = arena.to_ast(root)
+    assert isinstance(loaded, ast.Block) and isinstance(node, ast.Block)
+    assert loaded.frame_size == node.frame_size == 2
+    assert isinstance(loaded.arguments[1], ast.VarDeclaration)
+    assert loaded.arguments[1].slot == 1
+
+    inner = loaded.arguments[2]
+    assert isinstance(inner, ast.Block) and inner.frame_size == 1
+    assignment = inner.arguments[1]
+    assert isinstance(assignment, ast.Block)
+    set_x = assignment.arguments[0]
+    assert isinstance(set_x, ast.BinaryOp) and isinstance(set_x.left, ast.Identifier)
+    assert set_x.left.address == (2, 0)
+    call = assignment.arguments[1]
+    assert isinstance(call, ast.FunctionCall) and call.address == (2, 1)
+
+    symtab = build_interpreter_symtab()
+    assert interpret_arena(arena, root, symtab) == interpret(node, build_interpreter_symtab())
+
+
+def test_dump_size_and_load_speed() -> None:
+    code = '\n'.join(f'var v{i} = {i} + {i} * 2 - ({i} % 7); if v{i} > 3 then {{ v{i} = v{i} - 1 }} else {{ v{i} = v{i} + 1 }};'
+                     for i in range(2000)) + ' 0'
+    node = parse(tokenize(code))
+    resolve(node)
+    typecheck(node, build_type_symtab())
+    data = dump(node)
+    assert len(data) < 4 * len(code)
+
+    def best_time(f: Callable[[], object]) -> float:
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            f()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    assert best_time(lambda: load(data)) * 10 < best_time(lambda: parse(tokenize(code)))
+    arena, root = load(data)
+    assert typecheck_arena(arena, root, build_type_symtab()) == Int
+    assert arena.to_ast(root) == node
@@ -0,0 +1,58 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler.bytecode import Bytecode, Op, compile_bytecode, run_bytecode, dump, load
+
+
+def compile_code(code: str) -> Bytecode:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    return compile_bytecode(generate_ir(build_ir_dict(), node))
+
+
+def run(code: str, capsys: pytest.CaptureFixture[str]) -> str:
+    run_bytecode(load(dump(compile_code(code))))
+    return capsys.readouterr().out
+
+
+def test_bytecode(capsys: pytest.CaptureFixture[str]) -> None:
+    assert run('1 + 2 * 3', capsys) == '7\n'
+    assert run('var x = 3; x = x - 1; x', capsys) == '2\n'
+    assert run('true == not false', capsys) == 'true\n'
+    assert run('if 1 > 2 then 3 else 4', capsys) == '4\n'
+    assert run('var x = 1; { var x = 2; print_int(x) }; x', capsys) == '2\n1\n'
+    assert run('false and 1 / 0 == 0', capsys) == 'false\n'
+    assert run('var i = 0; var s = 0; while i < 10 do { s = s + i; i = i + 1 }; s', capsys) == '45\n'
+    assert run('var i = 3; while i != 0 do { print_bool(i % 2 == 1); i = i - 1 }', capsys) == 'true\nfalse\ntrue\n'
+    # Integers behave like in the compiled program
+    assert run('-7 / 2', capsys) == '-3\n'
+    assert run('-7 % 2', capsys) == '-1\n'
+    assert run('9223372036854775807 + 1', capsys) == '-9223372036854775808\n'
+    with pytest.raises(Exception):
+        run('1 / 0', capsys)
+
+
+def test_superinstructions() -> None:
+    ops = [op for _, op, _ in compile_code('var i = 0; while i < 10 do { i = i + 1 }; i').instructions()]
+    assert Op.JUMP_UNLESS_LT_IMMEDIATE in ops
+    assert Op.ADD_IMMEDIATE in ops
+    assert Op.LT not in ops
+    assert Op.ADD not in ops
+
+    ops = [op for _, op, _ in compile_code('var a = 1; var b = 2; if a <= b then 1 else 2').instructions()]
+    assert Op.JUMP_UNLESS_LE in ops
+    assert Op.JUMP_UNLESS not in ops
+
+
+def test_bytecode_file_format() -> None:
+    program = compile_code('var i = 0; while i < 3 do i = i + 1; i')
+    data = dump(program)
+    assert data[:4] == b'CBYC'
+    assert load(data) == program
+    with pytest.raises(Exception):
+        load(b'XXXX' + data[4:])
+    with pytest.raises(Exception):
+        load(data[:-8])
@@ -0,0 +1,68 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_cfg, generate_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler.cfg import ControlFlowGraph, build_cfg
+from compiler.tokenizer import SourceLocation
+from compiler.ir import IRVar
+from compiler import ir
+
+programs = [
+    '1 + 2 * 3',
+    'var x = 10; while x > 0 do { if x % 2 == 0 then print_int(x); x = x - 1 }',
+    'if true and false then 1 else 2',
+    'var x = 1; while x < 5 do { if x > 3 then print_int(x) else { x = x + 1 }; x = x + 1 }; x',
+]
+
+
+def generate(code: str) -> tuple[list[ir.Instruction], ControlFlowGraph]:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    return generate_ir(build_ir_dict(), node), generate_cfg(build_ir_dict(), node)
+
+
+def test_linearize_gives_generated_ir() -> None:
+    for code in programs:
+        instructions, cfg = generate(code)
+        assert cfg.linearize() == instructions
+        assert build_cfg(instructions).linearize() == instructions
+
+
+def test_blocks_and_edges() -> None:
+    _, cfg = generate('var x = 10; while x > 0 do x = x - 1; x')
+    # Entry, loop condition, loop body, after the loop
+    assert len(cfg.blocks) == 4
+    entry, condition, body, end = cfg.blocks
+    assert entry.label is None and entry.terminator is None
+    assert entry.successors == [condition.index]
+    assert isinstance(condition.terminator, ir.CondJump)
+    assert condition.successors == [body.index, end.index]
+    # The body jumps back to the condition
+    assert isinstance(body.terminator, ir.Jump)
+    assert body.successors == [condition.index]
+    assert condition.predecessors == [entry.index, body.index]
+    assert end.successors == []
+    for block in cfg.blocks:
+        assert all(not isinstance(ins, (ir.Label, ir.Jump, ir.CondJump)) for ins in block.instructions)
+
+
+def test_unreachable_code() -> None:
+    loc = SourceLocation('test', 0, 0)
+    end = ir.Label(loc, 'end')
+    instructions: list[ir.Instruction] = [
+        ir.Jump(loc, end),
+        ir.LoadIntConstant(loc, 1, IRVar('x1')),
+        end,
+        ir.LoadIntConstant(loc, 2, IRVar('x2')),
+    ]
+    cfg = build_cfg(instructions)
+    assert len(cfg.blocks) == 3
+    assert cfg.blocks[1].label is None
+    assert cfg.blocks[1].predecessors == []
+    assert cfg.blocks[2].predecessors == [0, 1]
+    assert cfg.linearize() == instructions
+
+    with pytest.raises(Exception):
+        build_cfg([ir.Jump(loc, ir.Label(loc, 'nowhere'))])
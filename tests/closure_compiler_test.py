@@ -0,0 +1,72 @@
+import pytest
+from compiler.tokenizer import tokenize, SourceLocation
+from compiler.parser import parse
+from compiler.interpreter import interpret
+from compiler.closure_compiler import closure_interpret, compile_closures
+from compiler.symtab import build_interpreter_symtab
+from compiler import ast
+
+
+def both(code: str) -> tuple:
+    a = interpret(parse(tokenize(code)), build_interpreter_symtab())
+    b = closure_interpret(parse(tokenize(code)), build_interpreter_symtab())
+    return a, b
+
+
+def test_closure_compiler() -> None:
+    for code in [
+        '1 + 2 * 3', '4 / -2', '4 % 2', 'true == not false', '(1 + 1) >= 2',
+        'if 1 <= 2 then 3 else 4', '10 + if 2 < 1 then 3 else 4', 'if 1 < 2 then 3',
+        '{}', '{1}{2}', '{1}{2};', 'var x = 10; x + 1', 'var x = 10', 'var x = 1; {var x = 2; x}',
+        'var x = 1; {var y = 2; x = y}; x', 'var x = 1; x = x + 1; x = x * 3; x',
+        'false and 1 / 0 == 0', 'true or 1 / 0 == 0', 'var a = 1; var b = a = a + 1; a + b',
+        'var i = 0; var s = 0; while i < 10 do { var j = i; s = s + j; i = i + 1 }; s',
+        'var i = 0; while i < 3 do { var i2 = i * 2; i = i + 1; { var x = i2; x } }; i',
+    ]:
+        a, b = both(code)
+        assert a == b, code
+
+    for code in [
+        'var x = 1; var x = 2', 'z', '{var a = 1}; a', '{var c = 1}{c}', '1 / 0',
+        'var i = 0; while i < 2 do { i = i + 1; print_int(1, 2) }',
+    ]:
+        with pytest.raises(Exception):
+            interpret(parse(tokenize(code)), build_interpreter_symtab())
+        with pytest.raises(Exception):
+            closure_interpret(parse(tokenize(code)), build_interpreter_symtab())
+
+    # A variable whose declaration has not run is not set
+    for code in [
+        '{ false and var y = 1; y }', '{ false and var y = 1; y + 1 }', '{ false and var y = 1; y == 1 }',
+        '{ false and var y = 1; y; var y = 2 }', 'var i = 0; while i < 2 do { i = i + 1; i > 1 or var y = 1; y }',
+    ]:
+        with pytest.raises(Exception, match='Variable "y" is not set'):
+            interpret(parse(tokenize(code)), build_interpreter_symtab())
+        with pytest.raises(Exception, match='Variable "y" is not set'):
+            closure_interpret(parse(tokenize(code)), build_interpreter_symtab())
+
+
+def test_closure_compiler_output(capsys: pytest.CaptureFixture[str]) -> None:
+    code = 'var i = 0; while i < 3 do { print_int(i); print_bool(i == 1); i = i + 1 }'
+    run = compile_closures(parse(tokenize(code)), build_interpreter_symtab())
+    run()
+    run()
+    assert capsys.readouterr().out == '0\nfalse\n1\ntrue\n2\nfalse\n' * 2
+
+
+def test_closure_compiler_unresolved() -> None:
+    L = SourceLocation('test', 0, 0)
+    node = ast.Block(L, [
+        ast.VarDeclaration(L, None, 'x', ast.Literal(L, 1)),
+        ast.Block(L, [ast.BinaryOp(L, ast.Identifier(L, 'x'), '=', ast.Literal(L, 5))]),
+        ast.Identifier(L, 'x'),
+    ])
+    assert closure_interpret(node, build_interpreter_symtab()) == 5
+
+    s = build_interpreter_symtab()
+    closure_interpret(parse(tokenize('var y = 3')), s)
+    assert closure_interpret(parse(tokenize('y = y + 1')), s) == 4
+    assert s.get('y') == 4
+
+    deep = '- ' * 5000 + '3'
+    assert closure_interpret(parse(tokenize(deep)), build_interpreter_symtab()) == 3
@@ -0,0 +1,39 @@
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir, generate_compact_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler.compact_ir import Call, CondJump, Copy, compact
+from compiler.types import Bool, Int
+
+CODE = 'var x = 1; var f = print_int; while x < 10 do { f(x); x = x * 2 }; x > 3'
+
+
+def test_view_equals_ir() -> None:
+    node = parse(tokenize(CODE))
+    typecheck(node, build_type_symtab())
+    instructions = generate_ir(build_ir_dict(), node)
+    program = compact(instructions)
+    assert program.view() == instructions
+    assert str(program) == '\n'.join(str(ins) for ins in instructions)
+
+
+def test_operands() -> None:
+    node = parse(tokenize(CODE))
+    typecheck(node, build_type_symtab())
+    program = generate_compact_ir(build_ir_dict(), node)
+    variables = program.variables
+
+    copy = next(ins for ins in program if isinstance(ins, Copy))
+    assert copy.uses() == (copy.source,)
+    assert copy.defs() == (copy.dest,)
+
+    # Calling a variable uses it
+    call = next(ins for ins in program if isinstance(ins, Call) and variables.names[ins.fun].startswith('x'))
+    assert call.uses() == (call.fun,) + call.args
+    assert variables.types[call.args[0]] is Int
+
+    cond_jump = next(ins for ins in program if isinstance(ins, CondJump))
+    assert cond_jump.defs() == ()
+    assert variables.types[cond_jump.cond] is Bool
+    assert program.labels[cond_jump.then_label].name != program.labels[cond_jump.else_label].name
@@ -0,0 +1,58 @@
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.symtab import build_type_symtab
+from compiler.hash_cons import hash_cons, TypeMemo
+from compiler.types import Bool, Int
+from compiler import ast
+import pytest
+
+
+def test_hash_cons() -> None:
+    node = parse(tokenize('f(1 + x, 1 + x) + (1 + x)'))
+    consing = hash_cons(node)
+    assert isinstance(node, ast.BinaryOp)
+    assert isinstance(node.left, ast.FunctionCall)
+    first, second = node.left.arguments
+    assert consing.canonical_id(first) == consing.canonical_id(second) == consing.canonical_id(node.right)
+    assert consing.canonical_id(first) != consing.canonical_id(node)
+    assert consing.node_count == 11
+    assert consing.duplicate_count == 6
+    assert '3 copies of BinaryOp with 3 nodes' in consing.report()
+
+    consing = hash_cons(parse(tokenize('1; true; 1')))
+    assert len(consing.subtrees) == 3
+
+    # Deep ASTs are walked without recursion
+    node = parse(tokenize('{ ' * 3000 + '1 + 1' + ' }' * 3000))
+    consing = hash_cons(node)
+    assert consing.node_count == 3003
+    assert typecheck(node, build_type_symtab(), TypeMemo(consing)) == Int
+
+
+def test_typecheck_memo() -> None:
+    code = 'var a = 1; if a + 2 * 3 > 4 then { var c = a + 2 * 3; c } else { var c = a + 2 * 3; c }'
+    node = parse(tokenize(code))
+    memo = TypeMemo(hash_cons(node))
+    assert typecheck(node, build_type_symtab(), memo) == Int
+    assert memo.hits > 0
+    assert repr(node) == repr(typecheck_plain(code))
+
+    node = parse(tokenize(code + '; { var a = true; a + 2 * 3 > 4 }'))
+    with pytest.raises(Exception):
+        typecheck(node, build_type_symtab(), TypeMemo(hash_cons(node)))
+
+    # Declarations outside blocks change the scope, so they are not reused
+    code = 'var x = 1; var y = x + 1; var y = x + 1'
+    node = parse(tokenize(code))
+    with pytest.raises(Exception):
+        typecheck(node, build_type_symtab(), TypeMemo(hash_cons(node)))
+
+    node = parse(tokenize('{ var b = 1 < 2; b } == { var b = 1 < 2; b }'))
+    assert typecheck(node, build_type_symtab(), TypeMemo(hash_cons(node))) == Bool
+
+
+def typecheck_plain(code: str) -> ast.Expression:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    return node
@@ -0,0 +1,36 @@
+import io
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.interpreter import interpret
+from compiler.io_context import IOContext
+from compiler.symtab import build_interpreter_symtab
+
+
+def run(code: str, io_context: IOContext) -> None:
+    interpret(parse(tokenize(code)), build_interpreter_symtab(io_context))
+
+
+def test_captured_io() -> None:
+    io_context = IOContext([3, 4], capture=True)
+    run('var a = read_int(); var b = read_int(); print_int(a * b); print_bool(a < b)', io_context)
+    assert io_context.outputs == ['12', 'true']
+    assert io_context.captured_output() == '12\ntrue\n'
+    with pytest.raises(EOFError):
+        run('read_int()', io_context)
+
+
+def test_buffered_output() -> None:
+    stream = io.StringIO()
+    with IOContext([], buffer_size=3, stream=stream) as io_context:
+        run('var i = 0; while i < 4 do { print_int(i); i = i + 1 }', io_context)
+        # The first three lines were written when the buffer was full
+        assert stream.getvalue() == '0\n1\n2\n'
+    assert stream.getvalue() == '0\n1\n2\n3\n'
+
+
+def test_stdin_input(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.setattr('sys.stdin', io.StringIO('5\n-2\n'))
+    with IOContext() as io_context:
+        run('print_int(read_int() + read_int())', io_context)
+    assert capsys.readouterr().out == '3\n'
@@ -0,0 +1,46 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler.ir_format import dump_ir, format_ir, load_ir, parse_ir
+from compiler import ir
+
+programs = [
+    '1 + 2 * 3',
+    'var x = 10; while x > 0 do { if x % 2 == 0 then print_int(x); x = x - 1 }',
+    'var f = print_bool; f(not true or 1 < 2); read_int()',
+    '123456789012345678901234567890 + 1',
+]
+
+
+def generate(code: str) -> list[ir.Instruction]:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    return generate_ir(build_ir_dict(), node)
+
+
+def test_text_format() -> None:
+    for code in programs:
+        instructions = generate(code)
+        assert parse_ir(format_ir(instructions)) == instructions
+        # Without locations, only the instructions themselves are kept
+        parsed = parse_ir(format_ir(instructions, locations=False))
+        assert [str(ins) for ins in parsed] == [str(ins) for ins in instructions]
+    with pytest.raises(Exception):
+        parse_ir('Copy(x1)')
+    with pytest.raises(Exception):
+        parse_ir('Frobnicate(x1, x2)')
+
+
+def test_binary_format() -> None:
+    for code in programs:
+        instructions = generate(code)
+        data = dump_ir(instructions)
+        assert data[:4] == b'CIRB'
+        assert load_ir(data) == instructions
+    with pytest.raises(Exception):
+        load_ir(data[:-8])
+    with pytest.raises(Exception):
+        load_ir(b'XXXX' + data[4:])
@@ -0,0 +1,123 @@
+import random
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir, typecheck_and_generate_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+
+
+programs = [
+    '1 + 2 * 3',
+    'true and not false or 1 < 2',
+    'var x: Int = 10; var y = x > 3 and not false; if y then x = x - 1 else x; x',
+    'var i = 0; var s = 0; while i < 5 do { var t = s + i; s = t; i = i + 1 }; s',
+    'var x = 1; var y = 5; { var y = 2; x = y }; x',
+    '{ var a = 1; { var a = true; a } }',
+    'print_int(-12345); print_bool(1 != 2); read_int()',
+    'var x = 1; if x == 1 then { x = 2 }',
+    'if 1 < 2 then { 1 } else { 2 } == 3',
+    'while false do { undefined_in_body }',
+    'var f = print_int; f(1)',
+    'var x = 1',
+    # Errors
+    '1 + true',
+    'if 1 then 2 else 3',
+    'if true then 2 else false',
+    'while 1 do 2',
+    'var x: Bool = 1',
+    'var x: Something = 1',
+    '{ var x = 1; var x = 2 }',
+    'x = 1',
+    'undefined_variable + 1',
+    'print_int(true)',
+    'print_int(1, 2)',
+    'undefined_function()',
+    '1 = 2',
+    'var x = 1; x = true',
+    '-true',
+    'not 1',
+    'true == 1',
+    'var x = 1; x(2)',
+    '1 = true',
+    'var x = 1; x(1 + true)',
+    'while false do { undefined_in_body }; 1 + true',
+    'while false do { undefined_in_body }; while false do { x = 1 }',
+    'while false do { 1 = 2 }',
+    'while false do { undefined_function() }',
+    'while false do { var x = 1; x(2) }',
+    'while false do { var x = 1; var x = 2; x + true }',
+]
+
+
+def two_pass(code: str) -> str:
+    node = parse(tokenize(code))
+    try:
+        typecheck(node, build_type_symtab())
+        instructions = generate_ir(build_ir_dict(), node)
+    except Exception as e:
+        return f'error: {e}'
+    return repr(node) + '\n'.join(str(i) for i in instructions)
+
+
+def fused(code: str) -> str:
+    node = parse(tokenize(code))
+    try:
+        instructions = typecheck_and_generate_ir(build_ir_dict(), node)
+    except Exception as e:
+        return f'error: {e}'
+    return repr(node) + '\n'.join(str(i) for i in instructions)
+
+
+def test_typecheck_and_generate_ir() -> None:
+    for code in programs:
+        assert fused(code) == two_pass(code), code
+    assert 'Copy' in fused('var x = 1; var y = 5; { var y = 2; x = y }; x')
+    assert fused('1 + true') == "error: Unexpected types with operator '+', got 'BasicType(name='Int')' and 'BasicType(name='Bool')'"
+    assert fused('while false do { undefined_in_body }') == \
+        "error: SourceLocation(file='file_name', line=0, column=17): variable 'undefined_in_body' is not set"
+
+
+def random_program(rng: random.Random, depth: int) -> str:
+    """A program that is often but not always well typed"""
+    def expr(depth: int) -> str:
+        if depth == 0:
+            return rng.choice(['1', '7', 'true', 'false', 'x', 'y', 'read_int()'])
+        choice = rng.randrange(7)
+        if choice == 0:
+            return f'{expr(depth - 1)} {rng.choice(["+", "*", "%", "<", "==", "!=", "and", "or"])} {expr(depth - 1)}'
+        elif choice == 1:
+            return f'{rng.choice(["-", "not "])}{expr(depth - 1)}'
+        elif choice == 2:
+            else_clause = f' else {expr(depth - 1)}' if rng.random() < 0.7 else ''
+            return f'if {expr(depth - 1)} then {expr(depth - 1)}{else_clause}'
+        elif choice == 3:
+            return f'while {expr(depth - 1)} do {block(depth - 1)}'
+        elif choice == 4:
+            return f'{rng.choice(["x", "y", "z"])} = {expr(depth - 1)}'
+        elif choice == 5:
+            return f'{rng.choice(["print_int", "print_bool", "f"])}({expr(depth - 1)})'
+        return block(depth - 1)
+
+    def block(depth: int) -> str:
+        statements = []
+        for _ in range(rng.randint(0, 3)):
+            if rng.random() < 0.3:
+                declared_type = rng.choice(['', ': Int', ': Bool'])
+                statements.append(f'var {rng.choice(["x", "y", "f"])}{declared_type} = {expr(depth)}')
+            else:
+                statements.append(expr(depth))
+        return '{ ' + '; '.join(statements) + ' }'
+
+    return f'var x = 1; var y = true; {block(depth)}'
+
+
+def test_typecheck_and_generate_ir_random_programs() -> None:
+    rng = random.Random(1)
+    errors = 0
+    for _ in range(500):
+        code = random_program(rng, 3)
+        expected = two_pass(code)
+        errors += expected.startswith('error')
+        assert fused(code) == expected, code
+    # Both the programs and the diagnostics are compared
+    assert 50 < errors < 450
@@ -0,0 +1,45 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler.ir_interpreter import interpret_ir
+from compiler.io_context import IOContext
+
+
+def run(code: str, capsys: pytest.CaptureFixture[str]) -> str:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    interpret_ir(generate_ir(build_ir_dict(), node))
+    return capsys.readouterr().out
+
+
+def test_ir_interpreter(capsys: pytest.CaptureFixture[str]) -> None:
+    assert run('1 + 2 * 3', capsys) == '7\n'
+    assert run('var x = 3; x = x - 1; x', capsys) == '2\n'
+    assert run('true == not false', capsys) == 'true\n'
+    assert run('if 1 > 2 then 3 else 4', capsys) == '4\n'
+    assert run('var x = 1; { var x = 2; print_int(x) }; x', capsys) == '2\n1\n'
+    assert run('false and 1 / 0 == 0', capsys) == 'false\n'
+    assert run('var i = 0; var s = 0; while i < 10 do { s = s + i; i = i + 1 }; s', capsys) == '45\n'
+    assert run('print_bool(true or false)', capsys) == 'true\n'
+    # The value of an assignment sees the variables of the assignment's scope
+    assert run('var x = 1; var y = 5; { var y = 2; x = y }; x', capsys) == '2\n'
+    assert run('var x = 1; { var x = 2; { var x = 3; x = x + 1; print_int(x) }; print_int(x) }; x', capsys) == '4\n2\n1\n'
+    # Integers behave like in the compiled program
+    assert run('-7 / 2', capsys) == '-3\n'
+    assert run('-7 % 2', capsys) == '-1\n'
+    assert run('9223372036854775807 + 1', capsys) == '-9223372036854775808\n'
+    assert run('-9223372036854775807 * 2', capsys) == '2\n'
+    with pytest.raises(Exception):
+        run('1 / 0', capsys)
+
+
+def test_ir_interpreter_io_context(capsys: pytest.CaptureFixture[str]) -> None:
+    node = parse(tokenize('var x = read_int(); print_bool(x > 2); print_int(read_int() + 9223372036854775807); x'))
+    typecheck(node, build_type_symtab())
+    io = IOContext(inputs=[3, 1], capture=True)
+    interpret_ir(generate_ir(build_ir_dict(), node), io)
+    assert io.outputs == ['true', '-9223372036854775808', '3']
+    assert capsys.readouterr().out == ''
@@ -1,7 +1,7 @@
 
 from compiler import ast
-from compiler.parser import parse
-from compiler.tokenizer import tokenize, SourceLocation
+from compiler.parser import parse, parse_parallel, parse_stream
+from compiler.tokenizer import iter_tokens, tokenize, tokenize_buffer, SourceLocation
 import pytest
 
 
@@ -896,3 +896,43 @@ def test_parser_location() -> None:
             arguments=[ast.Identifier(loc3, "hello")]
         )]
     )
+
+def test_parser_token_buffer() -> None:
+    for code in ["1 + 2 * 3", "{var x: Int = 1 + 2; print_int(x)}", "if a then {b} else {c} d;", "x = y = -1"]:
+        assert repr(parse(tokenize_buffer(code))) == repr(parse(tokenize(code)))
+
+    assert parse(tokenize_buffer("\n  a + b")).location == SourceLocation(file="file_name", line=1, column=4)
+
+    with pytest.raises(Exception):
+        parse(tokenize_buffer(""))
+    with pytest.raises(Exception):
+        parse(tokenize_buffer("a}"))
+
+def test_parse_stream() -> None:
+    for code in ["1 + 2 * 3", "{var x: Int = 1 + 2; print_int(x)}", "if a then {b} else {c} d;", "x = y = -1"]:
+        assert repr(parse_stream(iter_tokens(code))) == repr(parse(tokenize(code)))
+
+    with pytest.raises(Exception):
+        parse_stream(iter_tokens(""))
+    with pytest.raises(Exception):
+        parse_stream(iter_tokens("a b"))
+
+def test_parser_does_not_modify_tokens() -> None:
+    tokens = tokenize("a + b; {c} d")
+    parse(tokens)
+    assert tokens == tokenize("a + b; {c} d")
+
+def test_parse_parallel() -> None:
+    codes = [
+        "var x = 1; {x} x = 2; if x then {a} else {b} c; while a do {b}; print_int(x);",
+        "a; b; c",
+        "a",
+        "{a} {b};",
+    ]
+    for code in codes:
+        assert repr(parse_parallel(tokenize(code), workers=2, threshold=0)) == repr(parse(tokenize(code)))
+    assert repr(parse_parallel(tokenize("a; b"), workers=2)) == repr(parse(tokenize("a; b")))
+
+    for code in ["a;; b; c", "a; b c; d", "a; (b; c); d", "a; b; c}", ""]:
+        with pytest.raises(Exception):
+            parse_parallel(tokenize(code), workers=2, threshold=0)
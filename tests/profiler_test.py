@@ -0,0 +1,52 @@
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.interpreter import interpret
+from compiler.io_context import IOContext
+from compiler.profiler import Profile, profile_interpret
+from compiler.symtab import build_interpreter_symtab
+
+CODE = '''var i = 0;
+var s = 0;
+while i < 100 do {
+    s = s + i;
+    i = i + 1
+};
+s'''
+
+
+def test_profile_interpret() -> None:
+    profile = Profile()
+    result = profile_interpret(parse(tokenize(CODE)), build_interpreter_symtab(IOContext(capture=True)), profile)
+    assert result == 4950
+
+    assert profile.lines[3].count == 100 * 4
+    assert profile.lines[2].time >= profile.lines[3].time
+    counts = {stats.node.location.line: stats.count for stats in profile.nodes.values()
+              if type(stats.node).__name__ == 'WhileExpression'}
+    assert counts == {2: 1}
+
+    report = profile.report(CODE)
+    assert 's = s + i;' in report
+    assert report.index('while i < 100 do {') < report.index('var s = 0;')
+
+
+def test_collapsed_stacks() -> None:
+    profile = Profile()
+    profile_interpret(parse(tokenize(CODE)), build_interpreter_symtab(), profile)
+    assert profile.stacks
+    stack = max(profile.stacks, key=lambda stack: stack.count(';'))
+    assert stack.startswith('Block (1:1);WhileExpression (3:1);Block (3:')
+    for line in profile.collapsed_stacks().splitlines():
+        frames, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+        assert frames in profile.stacks
+    assert interpret(parse(tokenize(CODE)), build_interpreter_symtab()) == 4950
+
+
+def test_profile_deep_program() -> None:
+    # Nodes run past the recursion budget are counted once
+    profile = Profile()
+    code = '{ ' * 1000 + '1' + ' }' * 1000
+    assert profile_interpret(parse(tokenize(code)), build_interpreter_symtab(), profile) == 1
+    assert len(profile.nodes) == 1001
+    assert all(stats.count == 1 for stats in profile.nodes.values())
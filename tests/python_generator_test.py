@@ -0,0 +1,79 @@
+import pytest
+from pathlib import Path
+from types import CodeType
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.symtab import build_type_symtab
+from compiler import python_generator
+from compiler.python_generator import (
+    cached_code, compile_python, dump_code, generate_python, load_code, run_python
+)
+
+
+def compile_code(code: str) -> CodeType:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    return compile_python(node)
+
+
+def run(code: str, capsys: pytest.CaptureFixture[str]) -> str:
+    run_python(load_code(dump_code(compile_code(code))))
+    return capsys.readouterr().out
+
+
+def test_python_generator(capsys: pytest.CaptureFixture[str]) -> None:
+    assert run('1 + 2 * 3', capsys) == '7\n'
+    assert run('var x = 1; { var x = 2; print_int(x) }; x', capsys) == '2\n1\n'
+    assert run('var i = 0; var s = 0; while i < 10 do { s = s + i; i = i + 1 }; s', capsys) == '45\n'
+    assert run('if 1 > 2 then 3 else 4', capsys) == '4\n'
+    assert run('not true or 1 < 2', capsys) == 'true\n'
+    # Operands are evaluated from left to right
+    assert run('var x = 1; x + { x = 2; x }', capsys) == '3\n'
+    assert run('var x = 3; { x } + (x = 5)', capsys) == '8\n'
+    assert run('var a = 0; var b = true or { a = 1; false }; a', capsys) == '0\n'
+    assert run('var i = 0; while { i = i + 1; i < 5 } do {}; i', capsys) == '5\n'
+    # Integers behave like in the compiled program
+    assert run('-7 / 2', capsys) == '-3\n'
+    assert run('-7 % 2', capsys) == '-1\n'
+    assert run('9223372036854775807 + 1', capsys) == '-9223372036854775808\n'
+    assert run('- ' * 200 + '1', capsys) == '1\n'
+    with pytest.raises(Exception):
+        run('1 / 0', capsys)
+    # Deep nesting is generated without recursion
+    assert run('- ' * 5000 + '1', capsys) == '1\n'
+    assert run('{ ' * 3000 + '2' + ' }' * 3000, capsys) == '2\n'
+    # Python itself limits how deeply blocks nest
+    with pytest.raises(Exception, match='nested too deeply'):
+        compile_code('if true then ' * 3000 + '3 else 4')
+
+
+def test_generated_source() -> None:
+    node = parse(tokenize('var i = 0; while i < 3 do i = i + 1'))
+    typecheck(node, build_type_symtab())
+    source = generate_python(node)
+    assert 'while (v_i_1 < 3):' in source
+    assert 'v_i_1 = ' in source
+
+
+def test_cached_code(tmp_path: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_dir = str(tmp_path / 'cache')
+    compiled = []
+
+    def compile_source() -> CodeType:
+        compiled.append(True)
+        return compile_code('print_int(42)')
+
+    for _ in range(2):
+        run_python(cached_code('print_int(42)', cache_dir, compile_source))
+    assert len(compiled) == 1
+    assert capsys.readouterr().out == '42\n42\n'
+
+    cached_code('print_int(43)', cache_dir, compile_source)
+    assert len(compiled) == 2
+    assert len(list((tmp_path / 'cache').iterdir())) == 2
+
+    # Code cached by another version of the generator is compiled again
+    monkeypatch.setattr(python_generator, '_generator_digest', lambda: b'other version')
+    cached_code('print_int(42)', cache_dir, compile_source)
+    assert len(compiled) == 3
@@ -0,0 +1,78 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.interpreter import interpret
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir
+from compiler.symtab import build_interpreter_symtab, build_type_symtab, build_ir_dict
+from compiler.resolver import resolve
+from compiler.tokenizer import SourceLocation
+from compiler import ast
+
+
+def parse_resolved(code: str) -> ast.Expression:
+    node = parse(tokenize(code))
+    resolve(node)
+    return node
+
+
+def test_resolver() -> None:
+    # The parser leaves the names unresolved
+    node = parse(tokenize('var x = 1; x'))
+    assert isinstance(node, ast.Block) and node.frame_size is None
+
+    node = parse_resolved('var x = 1; var y = x; { var z = y; x = z; print_int(x) }')
+    assert isinstance(node, ast.Block)
+    assert node.frame_size == 2
+    x, y, block = node.arguments
+    assert isinstance(x, ast.VarDeclaration) and isinstance(y, ast.VarDeclaration)
+    assert x.slot == 0 and y.slot == 1
+    assert isinstance(y.value, ast.Identifier) and y.value.address == (0, 0)
+    assert isinstance(block, ast.Block)
+    assert block.frame_size == 1
+    z, assignment, call = block.arguments
+    assert isinstance(z, ast.VarDeclaration) and z.slot == 0
+    assert isinstance(z.value, ast.Identifier) and z.value.address == (1, 1)
+    assert isinstance(assignment, ast.BinaryOp)
+    assert isinstance(assignment.left, ast.Identifier) and assignment.left.address == (1, 0)
+    assert isinstance(assignment.right, ast.Identifier) and assignment.right.address == (0, 0)
+    assert isinstance(call, ast.FunctionCall) and call.address is None
+
+    node = parse_resolved('{ x; var x = 1; x }')
+    assert isinstance(node, ast.Block)
+    first, _, last = node.arguments
+    assert isinstance(first, ast.Identifier) and first.address is None
+    assert isinstance(last, ast.Identifier) and last.address == (0, 0)
+
+    # A top-level declaration goes into the symbol table given to the stages
+    node = parse_resolved('var x = 1')
+    assert isinstance(node, ast.VarDeclaration) and node.slot is None
+    s = build_interpreter_symtab()
+    interpret(node, s)
+    assert s.get('x') == 1
+
+    # Unresolved trees are handled by name
+    loc = SourceLocation('file_name', 0, 0)
+    node = ast.Block(loc, [ast.VarDeclaration(loc, None, 'a', ast.Literal(loc, 2)), ast.Identifier(loc, 'a')])
+    assert interpret(node, build_interpreter_symtab()) == 2
+    resolve(node)
+    assert node.frame_size == 1
+    assert interpret(node, build_interpreter_symtab()) == 2
+
+
+def test_resolved_stages() -> None:
+    s = build_interpreter_symtab()
+    assert interpret(parse_resolved('var x = 1; { var x = 2; { x = x + 1 } ; x } + x'), s) == 4
+    assert interpret(parse_resolved('var i = 0; while i < 3 do { var j = i; i = j + 1 }; i'), s) == 3
+    with pytest.raises(Exception):
+        interpret(parse_resolved('var x = 1; var x = 2'), s)
+    with pytest.raises(Exception):
+        typecheck(parse_resolved('{ var x = 1; var x = 2 }'), build_type_symtab())
+    with pytest.raises(Exception):
+        typecheck(parse_resolved('{ var x = 1 }; x'), build_type_symtab())
+
+    # The value of an assignment is generated in the scope of the assignment
+    node = parse_resolved('var x = 1; var y = 5; { var y = 2; x = y }; x')
+    typecheck(node, build_type_symtab())
+    instructions = [str(i) for i in generate_ir(build_ir_dict(), node)]
+    assert 'Copy(x6, x2)' in instructions
@@ -0,0 +1,130 @@
+import pytest
+from compiler.tokenizer import tokenize, SourceLocation
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_cfg, generate_ir
+from compiler.symtab import build_type_symtab, build_ir_dict
+from compiler.cfg import ControlFlowGraph, build_cfg
+from compiler.ir_interpreter import interpret_ir
+from compiler.ssa import Phi, build_dominator_tree, from_ssa, to_ssa
+from compiler.ir import IRVar
+from compiler import ir
+
+programs = [
+    'var x = 10; var s = 0; while x > 0 do { if x % 2 == 0 then s = s + x else s = s - 1; x = x - 1 }; s',
+    'var x = 1; var y = 2; if x < y then { x = y; y = 3 } else y = 4; print_int(x); y',
+    'var i = 0; while i < 3 do { var j = 0; while j < i do { print_int(j); j = j + 1 }; i = i + 1 }',
+    'var a = 1; var b = true; if b and a > 0 then a = 2; if not b or a == 2 then a = 3 else a = 4; a',
+]
+
+
+def generate(code: str) -> ControlFlowGraph:
+    node = parse(tokenize(code))
+    typecheck(node, build_type_symtab())
+    return generate_cfg(build_ir_dict(), node)
+
+
+def assignments(cfg: ControlFlowGraph) -> list[IRVar]:
+    return [ins.dest for block in cfg.blocks for ins in block.instructions
+            if isinstance(ins, (ir.LoadIntConstant, ir.LoadBoolConstant, ir.Copy, ir.Call, Phi))]
+
+
+def test_dominator_tree() -> None:
+    cfg = generate('var x = 10; while x > 0 do { if x == 5 then print_int(x); x = x - 1 }; x')
+    # Entry, loop condition, if condition, then branch, if end, loop end
+    assert [block.label.name if block.label else None for block in cfg.blocks] \
+        == [None, 'L1', 'L2', 'L4', 'L5', 'L3']
+    tree = build_dominator_tree(cfg)
+    assert tree.idom == [-1, 0, 1, 2, 2, 1]
+    assert tree.frontiers == [[], [1], [1], [4], [1], []]
+    assert tree.dominates(1, 4) and tree.dominates(2, 2)
+    assert not tree.dominates(3, 4) and not tree.dominates(5, 2)
+
+
+def test_ssa_form() -> None:
+    for code in programs:
+        cfg = generate(code)
+        tree = to_ssa(cfg)
+        variables = assignments(cfg)
+        assert len(variables) == len(set(variables))
+        assigned_in = {
+            ins.dest: block.index for block in cfg.blocks for ins in block.instructions
+            if isinstance(ins, (ir.LoadIntConstant, ir.LoadBoolConstant, ir.Copy, ir.Call, Phi))
+        }
+        for block in cfg.blocks:
+            for ins in block.instructions:
+                if isinstance(ins, Phi):
+                    assert len(block.predecessors) >= 2
+                    assert len(ins.args) == len(block.predecessors)
+                    # Each argument is assigned on the way to its predecessor
+                    for pred, arg in zip(block.predecessors, ins.args):
+                        assert arg not in assigned_in or tree.dominates(assigned_in[arg], pred)
+
+    # A phi only where versions meet
+    cfg = generate('var x = 1; if x > 0 then x = 2; x')
+    to_ssa(cfg)
+    phis = [ins for block in cfg.blocks for ins in block.instructions if isinstance(ins, Phi)]
+    assert len(phis) == 1
+    assert phis[0].dest.name.startswith('x2.')
+
+
+def test_round_trip(capsys: pytest.CaptureFixture[str]) -> None:
+    for code in programs:
+        node = parse(tokenize(code))
+        typecheck(node, build_type_symtab())
+        interpret_ir(generate_ir(build_ir_dict(), node))
+        expected = capsys.readouterr().out
+
+        cfg = generate(code)
+        to_ssa(cfg)
+        from_ssa(cfg)
+        instructions = cfg.linearize()
+        assert not any(isinstance(ins, Phi) for ins in instructions)
+        # The versions of each variable are coalesced back into it
+        assert not any('.' in var.name for var in assignments(cfg))
+        interpret_ir(instructions)
+        assert capsys.readouterr().out == expected
+
+
+def test_entry_loop(capsys: pytest.CaptureFixture[str]) -> None:
+    # The program starts with the loop's label, so an entry block is added
+    cfg = generate('while read_int() > 0 do print_int(1)')
+    assert cfg.blocks[0].predecessors != []
+    to_ssa(cfg)
+    assert cfg.blocks[0].predecessors == [] and cfg.blocks[0].successors == [1]
+    from_ssa(cfg)
+
+
+def test_interfering_versions(capsys: pytest.CaptureFixture[str]) -> None:
+    # a and b are swapped on every round, so their versions are live at
+    # the same time and the phis need copies
+    loc = SourceLocation('test', 0, 0)
+    start, body, end = ir.Label(loc, 'start'), ir.Label(loc, 'body'), ir.Label(loc, 'end')
+    a1, b1, a2, b2 = IRVar('a.1'), IRVar('b.1'), IRVar('a.2'), IRVar('b.2')
+    i1, i2, i3 = IRVar('i.1'), IRVar('i.2'), IRVar('i.3')
+    instructions: list[ir.Instruction] = [
+        ir.LoadIntConstant(loc, 1, a1),
+        ir.LoadIntConstant(loc, 2, b1),
+        ir.LoadIntConstant(loc, 0, i1),
+        ir.Jump(loc, start),
+        start,
+        Phi(loc, [a1, b2], a2),
+        Phi(loc, [b1, a2], b2),
+        Phi(loc, [i1, i3], i2),
+        ir.LoadIntConstant(loc, 3, IRVar('n')),
+        ir.Call(loc, IRVar('<'), [i2, IRVar('n')], IRVar('c')),
+        ir.CondJump(loc, IRVar('c'), body, end),
+        body,
+        ir.LoadIntConstant(loc, 1, IRVar('one')),
+        ir.Call(loc, IRVar('+'), [i2, IRVar('one')], i3),
+        ir.Call(loc, IRVar('print_int'), [a2], IRVar('u')),
+        ir.Jump(loc, start),
+        end,
+    ]
+    cfg = build_cfg(instructions)
+    from_ssa(cfg)
+    interpret_ir(cfg.linearize())
+    assert capsys.readouterr().out == '1\n2\n1\n'
+
+    with pytest.raises(Exception):
+        from_ssa(build_cfg(instructions + [ir.LoadIntConstant(loc, 1, a1)]))
@@ -1,4 +1,7 @@
-from compiler.tokenizer import Token, tokenize, SourceLocation
+from compiler.tokenizer import _unicode_whitespace, Token, TokenBuffer, TokenKind, iter_tokens, tokenize, tokenize_buffer, tokenize_parallel, SourceLocation
+import mmap
+import sys
+import tempfile
 import pytest
 
 
@@ -156,3 +159,75 @@ def test_tokenizer_location() -> None:
         Token(loc=loc4, type='operator', text="+"),
         Token(loc=loc5, type='int_literal', text="1"),
     ]
+    loc1 = SourceLocation(file="file_name", line=0, column=0)
+    loc2 = SourceLocation(file="file_name", line=0, column=10)
+    loc3 = SourceLocation(file="file_name", line=2, column=9)
+    assert tokenize("a\t b // c\n\n \tc") == [
+        Token(loc=loc1, type='identifier', text="a"),
+        Token(loc=loc2, type='identifier', text="b"),
+        Token(loc=loc3, type='identifier', text="c"),
+    ]
+
+def test_token_buffer() -> None:
+    source = "var x = 1;\n\tif x >= 1 then print_int(x) // done\nwhile true do x"
+    buffer = tokenize_buffer(source)
+
+    assert buffer.tokens() == tokenize(source)
+    assert list(buffer) == tokenize(source)
+    assert len(buffer) == len(tokenize(source))
+
+    assert buffer.kinds[0] == TokenKind.VAR
+    assert buffer.kinds[1] == TokenKind.IDENTIFIER
+    assert buffer.kinds[2] == TokenKind.ASSIGN
+    assert buffer.kinds[3] == TokenKind.INT_LITERAL
+    assert buffer.kinds[5] == TokenKind.IF
+    assert buffer.kinds[-3] == TokenKind.TRUE
+
+    assert buffer.text(1) == "x"
+    assert buffer.text_ids[1] == buffer.text_ids[6]
+    assert buffer.location(6) == SourceLocation(file="file_name", line=1, column=11)
+    assert buffer.location(len(buffer) - 1) == SourceLocation(file="file_name", line=2, column=14)
+    assert (buffer.lines[6], buffer.columns[6]) == (1, 11)
+
+    assert TokenBuffer.from_tokens(tokenize(source)).tokens() == tokenize(source)
+
+    with pytest.raises(Exception):
+        tokenize_buffer("a@")
+
+def test_iter_tokens() -> None:
+    source = "var x = 1;\n\tif x >= 1 then print_int(x) // done\nwhile true do x"
+
+    assert list(iter_tokens(source)) == tokenize(source)
+    assert list(iter_tokens(source.encode())) == tokenize(source)
+
+    with tempfile.TemporaryFile() as f:
+        f.write(source.encode())
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source_map:
+            tokens = iter_tokens(source_map)
+            assert next(tokens) == Token(loc=SourceLocation("file_name", 0, 0), type="identifier", text="var")
+            assert list(tokens) == tokenize(source)[1:]
+
+    with pytest.raises(Exception):
+        list(iter_tokens(b"a@"))
+
+    # Whitespace outside ASCII is scanned the same in bytes
+    source = "var\u00a0x =\u3000 1;\n\u2003x\u2028+ 1"
+    assert list(iter_tokens(source.encode())) == tokenize(source)
+    assert tokenize_buffer(source).tokens() == tokenize(source)
+    with pytest.raises(Exception, match="near \u00e9t"):
+        list(iter_tokens("x \u00e9t\u00e9".encode()))
+
+def test_tokenize_parallel() -> None:
+    source = "var x = 1;\n\tif x >= 1 then print_int(x) // done\n\n  while true do x # end\n" * 20
+
+    assert tokenize_parallel(source, workers=3, threshold=0) == tokenize(source)
+    assert tokenize_parallel("a\nb", workers=2, threshold=0) == tokenize("a\nb")
+    assert tokenize_parallel(source, workers=3) == tokenize(source)
+
+    with pytest.raises(Exception, match="Tokenization failed near @"):
+        tokenize_parallel(source + "@", workers=3, threshold=0)
+
+def test_unicode_whitespace() -> None:
+    # Matches what `\s` matches in a `str`
+    assert _unicode_whitespace == ''.join(c for c in map(chr, range(128, sys.maxunicode + 1)) if c.isspace())
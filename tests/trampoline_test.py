@@ -0,0 +1,44 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse, parse_stream
+from compiler.interpreter import interpret
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir, typecheck_and_generate_ir
+from compiler.symtab import build_interpreter_symtab, build_type_symtab, build_ir_dict
+from compiler.tokenizer import iter_tokens
+from compiler.types import Int, Bool, Unit
+
+
+DEPTH = 5000
+
+
+def run(code: str) -> tuple:
+    node = parse(tokenize(code))
+    t = typecheck(node, build_type_symtab())
+    instructions = generate_ir(build_ir_dict(), node)
+    value = interpret(node, build_interpreter_symtab())
+    return t, len(instructions), value
+
+
+def test_deep_nesting() -> None:
+    assert run('- ' * DEPTH + '3') == (Int, DEPTH + 2, 3)
+    assert run('not ' * (DEPTH + 1) + 'true') == (Bool, DEPTH + 3, False)
+    assert run('(' * DEPTH + '1' + ')' * DEPTH)[::2] == (Int, 1)
+    assert run('{' * DEPTH + '2' + '}' * DEPTH)[::2] == (Int, 2)
+    assert run('if true then ' * DEPTH + '3')[::2] == (Unit, None)
+    assert run('1 + (' * DEPTH + '1' + ')' * DEPTH)[::2] == (Int, DEPTH + 1)
+    assert run('1' + ' + 1' * DEPTH)[::2] == (Int, DEPTH + 1)
+    assert run('var x = 0; ' + 'x = ' * DEPTH + '4; x')[::2] == (Int, 4)
+    assert run('{ var y = 1; ' * DEPTH + 'y + 1' + ' }' * DEPTH)[::2] == (Int, 2)
+    assert run('var n = 0; while n < 3 do ' + '{' * DEPTH + 'n = n + 1' + '}' * DEPTH + '; n')[::2] == (Int, 3)
+
+    node = parse_stream(iter_tokens('(' * DEPTH + '1' + ')' * DEPTH))
+    assert interpret(node, build_interpreter_symtab()) == 1
+
+    node = parse(tokenize('- ' * DEPTH + '3'))
+    assert len(typecheck_and_generate_ir(build_ir_dict(), node)) == DEPTH + 2
+
+    with pytest.raises(Exception):
+        parse(tokenize('(' * DEPTH + '1' + ')' * (DEPTH - 1)))
+    with pytest.raises(Exception):
+        typecheck(parse(tokenize('- ' * DEPTH + 'true')), build_type_symtab())
@@ -3,7 +3,9 @@ from compiler.tokenizer import tokenize
 from compiler.parser import parse
 from compiler.type_checker import typecheck
 from compiler.symtab import build_type_symtab, SymTab
-from compiler.types import Bool, Int, Unit
+from compiler.types import BasicType, Bool, FunType, Int, Unit
+import copy
+import pickle
 
 
 def test_type_checker() -> None:
@@ -85,6 +87,14 @@ def test_type_checker() -> None:
     assert_fails_typecheck('var c: something = 1', t)
     assert_fails_typecheck('var x: Int = 2; var y = x = true', t)
 
+def test_types_are_interned() -> None:
+    assert BasicType('Int') is Int
+    assert FunType([Int, Int], Bool) is FunType((Int, Int), Bool)
+    assert FunType((Int,), Unit) is not FunType((Bool,), Unit)
+    assert {FunType((Int,), Unit): 1}[build_type_symtab().get('print_int')] == 1
+    assert pickle.loads(pickle.dumps(FunType((Int,), Int))) is FunType((Int,), Int)
+    assert copy.deepcopy(Bool) is Bool
+
 def assert_fails_typecheck(code: str, t: SymTab) -> None:
     expr = parse(tokenize(code))
     failed = False
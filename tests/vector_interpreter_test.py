@@ -0,0 +1,38 @@
+import pytest
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.vector_interpreter import LaneResult, interpret_lanes
+
+pytest.importorskip('numpy')
+
+
+def run(code: str, inputs: list[list[int]]) -> list[LaneResult]:
+    return interpret_lanes(parse(tokenize(code)), inputs)
+
+
+def test_interpret_lanes() -> None:
+    results = run('var n = read_int(); var s = 0; while n > 0 do { s = s + n; n = n - 1 }; s', [[3], [0], [10]])
+    assert [result.value for result in results] == [6, 0, 55]
+
+    results = run('var x = read_int(); if x > 0 then print_int(x) else print_bool(x == 0); x * 2', [[5], [0], [-1]])
+    assert [result.output for result in results] == ['5\n', 'true\n', 'false\n']
+    assert [result.value for result in results] == [10, 0, -2]
+
+
+def test_ejected_lanes() -> None:
+    # Lanes that fail or overflow 64 bits are run again with the interpreter
+    results = run('var a = read_int(); var b = read_int(); print_int(a); a / b', [[7, 2], [1, 0], [-7, 2]])
+    assert [result.value for result in results] == [3, None, -4]
+    assert results[1].output == '1\n'
+    assert results[1].error is not None
+
+    results = run('read_int() * 4', [[2], [2**62]])
+    assert [result.value for result in results] == [8, 2**64]
+
+    results = run('read_int() + read_int()', [[1, 2], [1]])
+    assert results[0].value == 3
+    assert results[1].error is not None
+
+    # Too deep for the arrays
+    results = run('{' * 3000 + 'read_int() + 1' + '}' * 3000, [[1], [2]])
+    assert [result.value for result in results] == [2, 3]